@@ -0,0 +1,46 @@
+"""availability rollups
+
+Revision ID: 0a6d3e9f5c71
+Revises: f4c1a8e6b927
+Create Date: 2026-10-18 15:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0a6d3e9f5c71'
+down_revision = 'f4c1a8e6b927'
+branch_labels = None
+depends_on = None
+
+ROLLUP_TABLES = {
+    'sw_core_resource_availability_hourly': 'Начало часа (UTC)',
+    'sw_core_resource_availability_daily': 'Начало суток (UTC)',
+}
+
+
+def upgrade() -> None:
+    for table_name, bucket_comment in ROLLUP_TABLES.items():
+        op.create_table(
+            table_name,
+            sa.Column('resource', sa.UUID(), nullable=False),
+            sa.Column('bucket_start', sa.DateTime(timezone=True), nullable=False, comment=bucket_comment),
+            sa.Column('up_seconds', postgresql.DOUBLE_PRECISION(), nullable=False, comment='Секунд доступности'),
+            sa.Column('down_seconds', postgresql.DOUBLE_PRECISION(), nullable=False, comment='Секунд недоступности'),
+            sa.Column('outages_count', sa.Integer(), nullable=False, comment='Начавшихся отказов'),
+            sa.Column('recoveries_count', sa.Integer(), nullable=False, comment='Завершившихся отказов'),
+            sa.Column(
+                'recovery_seconds', postgresql.DOUBLE_PRECISION(), nullable=False,
+                comment='Суммарная длительность завершившихся отказов'
+            ),
+            sa.ForeignKeyConstraint(['resource'], ['sw_core_resources.id']),
+            sa.PrimaryKeyConstraint('resource', 'bucket_start')
+        )
+
+
+def downgrade() -> None:
+    for table_name in reversed(list(ROLLUP_TABLES)):
+        op.drop_table(table_name)
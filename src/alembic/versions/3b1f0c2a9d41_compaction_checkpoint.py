@@ -0,0 +1,37 @@
+"""compaction checkpoint
+
+Revision ID: 3b1f0c2a9d41
+Revises: 5e8a2c7d9b13
+Create Date: 2026-10-18 12:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '3b1f0c2a9d41'
+down_revision = '5e8a2c7d9b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'sw_core_compaction_checkpoint',
+        sa.Column('resource', sa.UUID(), nullable=False),
+        sa.Column(
+            'watermark', sa.DateTime(timezone=True), nullable=False,
+            comment='Время последнего скомпонованного замера'
+        ),
+        sa.Column(
+            'open_interval', sa.UUID(), nullable=True,
+            comment='Интервал, который может быть продлен следующими замерами'
+        ),
+        sa.ForeignKeyConstraint(['open_interval'], ['sw_core_resource_availability_compare.id']),
+        sa.ForeignKeyConstraint(['resource'], ['sw_core_resources.id']),
+        sa.PrimaryKeyConstraint('resource')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('sw_core_compaction_checkpoint')
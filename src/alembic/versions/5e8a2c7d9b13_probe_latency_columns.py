@@ -0,0 +1,58 @@
+"""probe latency columns
+
+Revision ID: 5e8a2c7d9b13
+Revises: 
+Create Date: 2026-10-18 12:28:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '5e8a2c7d9b13'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+STATISTICS_TABLES = (
+    'sw_core_resource_availability_statistics',
+    'sw_core_resource_availability_statistics_test_storage',
+)
+
+
+def upgrade() -> None:
+    for table_name in STATISTICS_TABLES:
+        op.add_column(table_name, sa.Column(
+            'min_latency', postgresql.DOUBLE_PRECISION(), nullable=True, comment='Минимальная задержка (мс)'
+        ))
+        op.add_column(table_name, sa.Column(
+            'avg_latency', postgresql.DOUBLE_PRECISION(), nullable=True, comment='Средняя задержка (мс)'
+        ))
+        op.add_column(table_name, sa.Column(
+            'max_latency', postgresql.DOUBLE_PRECISION(), nullable=True, comment='Максимальная задержка (мс)'
+        ))
+        op.add_column(table_name, sa.Column(
+            'failures_count', sa.SmallInteger(), nullable=False, server_default='0', comment='Неудачных попыток'
+        ))
+
+    op.add_column('sw_core_resource_availability_compare', sa.Column(
+        'latency_p50', postgresql.DOUBLE_PRECISION(), nullable=True, comment='Медиана задержки (мс)'
+    ))
+    op.add_column('sw_core_resource_availability_compare', sa.Column(
+        'latency_p95', postgresql.DOUBLE_PRECISION(), nullable=True, comment='95-й перцентиль задержки (мс)'
+    ))
+    op.add_column('sw_core_resource_availability_compare', sa.Column(
+        'latency_p99', postgresql.DOUBLE_PRECISION(), nullable=True, comment='99-й перцентиль задержки (мс)'
+    ))
+    op.add_column('sw_core_resource_availability_compare', sa.Column(
+        'latency_sketch', sa.JSON(), nullable=True, comment='Корзины скетча задержки для продления интервала'
+    ))
+
+
+def downgrade() -> None:
+    for column_name in ('latency_sketch', 'latency_p99', 'latency_p95', 'latency_p50'):
+        op.drop_column('sw_core_resource_availability_compare', column_name)
+    for table_name in STATISTICS_TABLES:
+        for column_name in ('failures_count', 'max_latency', 'avg_latency', 'min_latency'):
+            op.drop_column(table_name, column_name)
@@ -0,0 +1,67 @@
+"""hot query indexes
+
+Revision ID: 7c9e4d12ab83
+Revises: 3b1f0c2a9d41
+Create Date: 2026-10-18 12:45:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c9e4d12ab83'
+down_revision = '3b1f0c2a9d41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Индексы строятся без блокировки записи (CONCURRENTLY нельзя выполнять в транзакции)
+    with op.get_context().autocommit_block():
+        # Выборка и удаление замеров ресурса по времени при компоновке (index only scan)
+        op.create_index(
+            'ix_sw_core_resource_availability_statistics_resource_created_at',
+            'sw_core_resource_availability_statistics',
+            ['resource', 'created_at'],
+            postgresql_include=['is_available', 'avg_latency'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # Поиск интервала ресурса для продления
+        op.create_index(
+            'ix_sw_core_resource_availability_compare_resource_state_time_to',
+            'sw_core_resource_availability_compare',
+            ['resource', 'is_available', 'time_to'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # Выборка активных ресурсов в каждом цикле
+        op.create_index(
+            'ix_sw_core_resources_active',
+            'sw_core_resources',
+            ['id'],
+            postgresql_include=['name', 'host', 'port'],
+            postgresql_where=sa.text('is_active'),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_sw_core_resources_active',
+            table_name='sw_core_resources',
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            'ix_sw_core_resource_availability_compare_resource_state_time_to',
+            table_name='sw_core_resource_availability_compare',
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            'ix_sw_core_resource_availability_statistics_resource_created_at',
+            table_name='sw_core_resource_availability_statistics',
+            postgresql_concurrently=True,
+        )
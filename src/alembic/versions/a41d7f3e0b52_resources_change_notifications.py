@@ -0,0 +1,59 @@
+"""resources change notifications
+
+Revision ID: a41d7f3e0b52
+Revises: 7c9e4d12ab83
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41d7f3e0b52'
+down_revision = '7c9e4d12ab83'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('sw_core_resources', sa.Column(
+        'updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False,
+        comment='Время изменения (обновляется триггером)'
+    ))
+    # Время изменения ставится и при правке ресурса в обход приложения
+    op.execute("""
+        CREATE OR REPLACE FUNCTION sw_core_resources_set_updated_at() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at := now();
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER sw_core_resources_set_updated_at
+        BEFORE UPDATE ON sw_core_resources
+        FOR EACH ROW EXECUTE FUNCTION sw_core_resources_set_updated_at()
+    """)
+    # Уведомление для реестра ресурсов (settings.RESOURCE_REGISTRY_NOTIFY_CHANNEL)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION sw_core_resources_notify() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('sw_core_resources_changed', TG_OP);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER sw_core_resources_notify
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON sw_core_resources
+        FOR EACH STATEMENT EXECUTE FUNCTION sw_core_resources_notify()
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS sw_core_resources_notify ON sw_core_resources")
+    op.execute("DROP FUNCTION IF EXISTS sw_core_resources_notify()")
+    op.execute("DROP TRIGGER IF EXISTS sw_core_resources_set_updated_at ON sw_core_resources")
+    op.execute("DROP FUNCTION IF EXISTS sw_core_resources_set_updated_at()")
+    op.drop_column('sw_core_resources', 'updated_at')
@@ -0,0 +1,31 @@
+"""resources probe type
+
+Revision ID: b7d4e1a9c352
+Revises: 0a6d3e9f5c71
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d4e1a9c352'
+down_revision = '0a6d3e9f5c71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('sw_core_resources', sa.Column(
+        'probe_type', sa.String(length=20), nullable=False, server_default='tcp',
+        comment='Тип проверки: tcp, tls, http (check_resources.probes.PROBE_TYPES)'
+    ))
+    op.add_column('sw_core_resources', sa.Column(
+        'probe_options', sa.JSON(), nullable=True, comment='Параметры проверки (по типу проверки)'
+    ))
+
+
+def downgrade() -> None:
+    op.drop_column('sw_core_resources', 'probe_options')
+    op.drop_column('sw_core_resources', 'probe_type')
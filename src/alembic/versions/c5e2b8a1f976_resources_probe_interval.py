@@ -0,0 +1,27 @@
+"""resources probe interval
+
+Revision ID: c5e2b8a1f976
+Revises: a41d7f3e0b52
+Create Date: 2026-10-18 13:15:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e2b8a1f976'
+down_revision = 'a41d7f3e0b52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('sw_core_resources', sa.Column(
+        'probe_interval', sa.Integer(), nullable=True,
+        comment='Период проверки (в секундах), по умолчанию период сбора из настроек'
+    ))
+
+
+def downgrade() -> None:
+    op.drop_column('sw_core_resources', 'probe_interval')
@@ -0,0 +1,41 @@
+"""sharding leases
+
+Revision ID: d8f3a6c4e215
+Revises: c5e2b8a1f976
+Create Date: 2026-10-18 13:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8f3a6c4e215'
+down_revision = 'c5e2b8a1f976'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'sw_core_workers',
+        sa.Column('worker_id', sa.String(length=250), nullable=False, comment='Идентификатор экземпляра'),
+        sa.Column('started_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column(
+            'heartbeat_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False,
+            comment='Время последнего сигнала'
+        ),
+        sa.PrimaryKeyConstraint('worker_id')
+    )
+    op.create_table(
+        'sw_core_partition_leases',
+        sa.Column('partition', sa.Integer(), autoincrement=False, nullable=False, comment='Номер партиции'),
+        sa.Column('worker_id', sa.String(length=250), nullable=False, comment='Владелец аренды'),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False, comment='Окончание аренды'),
+        sa.PrimaryKeyConstraint('partition')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('sw_core_partition_leases')
+    op.drop_table('sw_core_workers')
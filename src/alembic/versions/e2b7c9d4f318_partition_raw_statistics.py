@@ -0,0 +1,112 @@
+"""partition raw statistics
+
+Revision ID: e2b7c9d4f318
+Revises: d8f3a6c4e215
+Create Date: 2026-10-18 14:10:00.000000
+
+"""
+from datetime import datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app import settings
+from check_resources.partitions import PARTITION_INTERVALS, get_create_partition_sql, iter_partition_starts
+
+# revision identifiers, used by Alembic.
+revision = 'e2b7c9d4f318'
+down_revision = 'd8f3a6c4e215'
+branch_labels = None
+depends_on = None
+
+STATISTICS_TABLES = (
+    'sw_core_resource_availability_statistics',
+    'sw_core_resource_availability_statistics_test_storage',
+)
+STATISTICS_COLUMNS = (
+    'id', 'created_at', 'updated_at', 'is_available', 'resource',
+    'min_latency', 'avg_latency', 'max_latency', 'failures_count',
+)
+STATISTICS_INDEX = 'ix_sw_core_resource_availability_statistics_resource_created_at'
+
+
+def get_statistics_columns():
+    return [
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('is_available', sa.Boolean(), nullable=True),
+        sa.Column('resource', sa.UUID(), nullable=True),
+        sa.Column('min_latency', postgresql.DOUBLE_PRECISION(), nullable=True, comment='Минимальная задержка (мс)'),
+        sa.Column('avg_latency', postgresql.DOUBLE_PRECISION(), nullable=True, comment='Средняя задержка (мс)'),
+        sa.Column('max_latency', postgresql.DOUBLE_PRECISION(), nullable=True, comment='Максимальная задержка (мс)'),
+        sa.Column(
+            'failures_count', sa.SmallInteger(), nullable=False, server_default='0', comment='Неудачных попыток'
+        ),
+        sa.ForeignKeyConstraint(['resource'], ['sw_core_resources.id']),
+    ]
+
+
+def copy_rows(source: str, target: str):
+    columns = ', '.join(STATISTICS_COLUMNS)
+    op.execute(f"INSERT INTO {target} ({columns}) SELECT {columns} FROM {source}")
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    interval = settings.RAW_STATISTICS_PARTITION_INTERVAL
+    now = datetime.now(timezone.utc)
+    for table_name in STATISTICS_TABLES:
+        legacy_name = f'{table_name}_legacy'
+        op.rename_table(table_name, legacy_name)
+        # Имена индексов уникальны в схеме, старые освобождаются для новой таблицы
+        op.execute(f"ALTER INDEX {table_name}_pkey RENAME TO {legacy_name}_pkey")
+        if table_name == 'sw_core_resource_availability_statistics':
+            op.execute(f"ALTER INDEX IF EXISTS {STATISTICS_INDEX} RENAME TO {STATISTICS_INDEX}_legacy")
+
+        op.create_table(
+            table_name,
+            *get_statistics_columns(),
+            sa.PrimaryKeyConstraint('id', 'created_at'),
+            postgresql_partition_by='RANGE (created_at)',
+        )
+        if table_name == 'sw_core_resource_availability_statistics':
+            op.create_index(
+                STATISTICS_INDEX, table_name, ['resource', 'created_at'],
+                postgresql_include=['is_available', 'avg_latency'],
+            )
+        op.execute(f"CREATE TABLE {table_name}_default PARTITION OF {table_name} DEFAULT")
+
+        # Секции на все еще не удаленные замеры и на RAW_STATISTICS_PARTITIONS_AHEAD периодов вперед
+        oldest = bind.execute(sa.text(f"SELECT min(created_at) FROM {legacy_name}")).scalar()
+        time_to = now + PARTITION_INTERVALS[interval] * settings.RAW_STATISTICS_PARTITIONS_AHEAD
+        for start in iter_partition_starts(oldest or now, time_to, interval):
+            op.execute(get_create_partition_sql(table_name, start, interval))
+
+        copy_rows(legacy_name, table_name)
+        op.drop_table(legacy_name)
+
+
+def downgrade() -> None:
+    for table_name in STATISTICS_TABLES:
+        partitioned_name = f'{table_name}_partitioned'
+        op.rename_table(table_name, partitioned_name)
+        op.execute(f"ALTER INDEX {table_name}_pkey RENAME TO {partitioned_name}_pkey")
+        if table_name == 'sw_core_resource_availability_statistics':
+            op.execute(f"ALTER INDEX {STATISTICS_INDEX} RENAME TO {STATISTICS_INDEX}_partitioned")
+
+        op.create_table(
+            table_name,
+            *get_statistics_columns(),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        if table_name == 'sw_core_resource_availability_statistics':
+            op.create_index(
+                STATISTICS_INDEX, table_name, ['resource', 'created_at'],
+                postgresql_include=['is_available', 'avg_latency'],
+            )
+
+        copy_rows(partitioned_name, table_name)
+        # Секции удаляются вместе с секционированной таблицей
+        op.drop_table(partitioned_name)
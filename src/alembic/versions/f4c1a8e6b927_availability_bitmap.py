@@ -0,0 +1,36 @@
+"""availability bitmap
+
+Revision ID: f4c1a8e6b927
+Revises: e2b7c9d4f318
+Create Date: 2026-10-18 14:50:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4c1a8e6b927'
+down_revision = 'e2b7c9d4f318'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'sw_core_resource_availability_bitmap',
+        sa.Column('resource', sa.UUID(), nullable=False),
+        sa.Column(
+            'bucket_start', sa.DateTime(timezone=True), nullable=False,
+            comment='Начало периода (выровнено по длительности периода)'
+        ),
+        sa.Column('slot_seconds', sa.SmallInteger(), nullable=False, comment='Длительность слота (в секундах)'),
+        sa.Column('probed', sa.LargeBinary(), nullable=False, comment='Битовая карта проверенных слотов'),
+        sa.Column('failed', sa.LargeBinary(), nullable=False, comment='Битовая карта слотов с отказом'),
+        sa.ForeignKeyConstraint(['resource'], ['sw_core_resources.id']),
+        sa.PrimaryKeyConstraint('resource', 'bucket_start')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('sw_core_resource_availability_bitmap')
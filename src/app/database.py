@@ -1,19 +1,65 @@
-from contextlib import contextmanager
+import time
+from typing import Iterator, List
+from contextlib import contextmanager, asynccontextmanager
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, MetaData
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import StaticPool
 
+from app import settings
+from app.services.metrics import METRICS
 from app.settings import DB_USER, DB_PASS, DB_HOST, DB_PORT, DB_NAME
 
 DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# SQLite в памяти процесса (для unit-тестов реестра и записи результатов без PostgreSQL, см. settings.DB_BACKEND)
+MEMORY_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 
 Base = declarative_base()
 
+# Наибольшее количество параметров одного запроса в протоколе PostgreSQL (asyncpg откажет в запросе с большим)
+MAX_QUERY_PARAMETERS = 32767
+
+DB_COMMIT_SECONDS = METRICS.histogram('sw_core_db_commit_seconds', 'Длительность commit асинхронной сессии')
+
 engine = create_engine(DATABASE_URL)
 Session = sessionmaker(engine)
 
 
+def get_async_engine(backend: str = settings.DB_BACKEND) -> AsyncEngine:
+    """ Создаст асинхронный движок с настроенным долгоживущим пулом соединений. """
+    if backend == 'memory':
+        # Одно общее соединение, иначе каждое соединение получит свою пустую БД
+        return create_async_engine(
+            MEMORY_DATABASE_URL,
+            poolclass=StaticPool,
+            connect_args={'check_same_thread': False},
+        )
+    return create_async_engine(
+        ASYNC_DATABASE_URL,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_POOL_MAX_OVERFLOW,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        pool_recycle=settings.DB_POOL_RECYCLE_IN_SECONDS,
+        connect_args={'prepared_statement_cache_size': settings.DB_STATEMENT_CACHE_SIZE},
+    )
+
+
+async_engine = get_async_engine()
+AsyncSession = async_sessionmaker(async_engine, expire_on_commit=False)
+
+
+def get_rows_chunks(rows: List[dict], max_parameters: int = MAX_QUERY_PARAMETERS) -> Iterator[List[dict]]:
+    """ Части строк для многострочных INSERT ... VALUES, каждая из которых укладывается в max_parameters. """
+    if not rows:
+        return
+    size = max(1, max_parameters // len(rows[0]))
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
 class DBAdapter:
     @contextmanager
     def get_session(self):
@@ -26,3 +72,27 @@ class DBAdapter:
             raise
         finally:
             session.close()
+
+
+class AsyncDBAdapter:
+    """ Асинхронные сессии поверх общего пула соединений async_engine. """
+
+    @asynccontextmanager
+    async def get_session(self):
+        session = AsyncSession()
+        try:
+            yield session
+            start = time.perf_counter()
+            await session.commit()
+            DB_COMMIT_SECONDS.observe(time.perf_counter() - start)
+        except:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+    @staticmethod
+    async def create_schema(metadata: MetaData):
+        """ Создаст таблицы (для бэкенда 'memory' в unit-тестах). """
+        async with async_engine.begin() as connection:
+            await connection.run_sync(metadata.create_all)
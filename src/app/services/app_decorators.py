@@ -1,13 +1,16 @@
 import asyncio
-import sys
 import time
-import traceback
 from functools import wraps
 
 from app.services.logger import SWCoreLogger
+from app.services.metrics import METRICS
 
 LOGGER = SWCoreLogger().get_logger()
 
+FUNCTION_SECONDS = METRICS.histogram(
+    'sw_core_function_seconds', 'Длительность функций с декоратором log_execution_time', ['function']
+)
+
 
 # Декоратор для ожидания выполнения функции по настройкам
 def settings_sleep(seconds_for_sleep):
@@ -33,6 +36,22 @@ def settings_sleep(seconds_for_sleep):
     return wrapper
 
 
+def log_error(func, error: Exception, kwargs: dict):
+    """
+    Запишет ошибку с трассировкой (форматируется в потоке записи логов). Повторы одной ошибки
+    по одному ресурсу (аргумент app) схлопываются RateLimitFilter.
+    """
+    LOGGER.error(
+        "Ошибка в %s: %r", func.__qualname__, error,
+        exc_info=error,
+        extra={
+            'function': func.__qualname__,
+            'error_type': type(error).__name__,
+            'resource': getattr(kwargs.get('app'), 'id', None),
+        },
+    )
+
+
 # Декоратор для логирования ошибок
 def error_logger(func):
     @wraps(func)
@@ -41,9 +60,7 @@ def error_logger(func):
             func_result = func(*args, **kwargs)
             return func_result
         except Exception as error:
-            error_type, error_value, error_trace = sys.exc_info()
-            traceback.print_exception(error_type, error_value, error_trace, limit=5, file=sys.stdout)
-            LOGGER.error(f"{error} {error_type} {error_value} {traceback.extract_tb(error_trace)}")
+            log_error(func, error, kwargs)
 
     @wraps(func)
     async def async_inner(*args, **kwargs):
@@ -51,23 +68,28 @@ def error_logger(func):
             func_result = await func(*args, **kwargs)
             return func_result
         except Exception as error:
-            error_type, error_value, error_trace = sys.exc_info()
-            traceback.print_exception(error_type, error_value, error_trace, limit=5, file=sys.stdout)
-            LOGGER.error(f"{error} {error_type} {error_value} {traceback.extract_tb(error_trace)}")
+            log_error(func, error, kwargs)
 
     if asyncio.iscoroutinefunction(func):
         return async_inner
     return sync_inner
 
 
-# Декоратор для логирования времени выполнения функции
+# Аргументы форматируются лениво, только если запись отладочного уровня будет выведена
+DEBUG_MESSAGE = "Выполнение %s за %0.2f секунд. Данные args=%r kwargs=%r"
+
+
+# Декоратор для логирования времени выполнения функции (и записи его в метрику sw_core_function_seconds)
 def log_execution_time(func):
+    labels = (func.__name__,)
+
     @wraps(func)
     def sync_inner(*args, **kwargs):
         start = time.perf_counter()
         func_result = func(*args, **kwargs)
         executing_time = time.perf_counter() - start
-        LOGGER.debug(f"Выполнение {func.__name__} за {executing_time:0.2f} секунд. Данные {args=} {kwargs=}")
+        FUNCTION_SECONDS.observe(executing_time, labels)
+        LOGGER.debug(DEBUG_MESSAGE, func.__name__, executing_time, args, kwargs)
         return func_result
 
     @wraps(func)
@@ -75,7 +97,8 @@ def log_execution_time(func):
         start = time.perf_counter()
         func_result = await func(*args, **kwargs)
         executing_time = time.perf_counter() - start
-        LOGGER.debug(f"Выполнение {func.__name__} за {executing_time:0.2f} секунд. Данные {args=} {kwargs=}")
+        FUNCTION_SECONDS.observe(executing_time, labels)
+        LOGGER.debug(DEBUG_MESSAGE, func.__name__, executing_time, args, kwargs)
         return func_result
 
     if asyncio.iscoroutinefunction(func):
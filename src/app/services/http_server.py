@@ -0,0 +1,92 @@
+import asyncio
+import json
+from http import HTTPStatus
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from app.services.logger import SWCoreLogger
+
+LOGGER = SWCoreLogger().get_logger()
+
+# Ответ обработчика: код, Content-Type и тело
+Response = Tuple[int, str, bytes]
+Handler = Callable[[Dict[str, str]], Awaitable[Response]]
+
+# Максимальный размер строки запроса и заголовков (в байтах)
+MAX_REQUEST_HEAD_SIZE = 16 * 1024
+# Сколько ждать запрос от подключившегося клиента (в секундах)
+REQUEST_TIMEOUT_IN_SECONDS = 10
+
+
+def json_response(data, status: int = HTTPStatus.OK) -> Response:
+    return status, 'application/json; charset=utf-8', json.dumps(data, ensure_ascii=False, default=str).encode()
+
+
+def text_response(text: str, status: int = HTTPStatus.OK, content_type: str = 'text/plain; charset=utf-8') -> Response:
+    return status, content_type, text.encode()
+
+
+class LocalHTTPServer:
+    """
+    Минимальный HTTP/1.1 сервер на потоках asyncio для служебных API sw-core (только GET, без тела запроса).
+    Работает в цикле событий приложения, поэтому обработчики видят его состояние напрямую.
+    """
+
+    def __init__(self, host: str, port: int, name: str = 'http'):
+        self.host = host
+        self.port = port
+        self.name = name
+        self.routes: Dict[str, Handler] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def route(self, path: str, handler: Handler):
+        self.routes[path] = handler
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str]]:
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=REQUEST_TIMEOUT_IN_SECONDS)
+        request_line = head.split(b'\r\n', 1)[0].decode('latin-1')
+        method, target, _ = request_line.split(' ', 2)
+        url = urlsplit(target)
+        return method, url.path, dict(parse_qsl(url.query))
+
+    async def _get_response(self, reader: asyncio.StreamReader) -> Response:
+        try:
+            method, path, query = await self._read_request(reader)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError):
+            return text_response('Bad Request', HTTPStatus.BAD_REQUEST)
+
+        handler = self.routes.get(path)
+        if handler is None:
+            return text_response('Not Found', HTTPStatus.NOT_FOUND)
+        if method != 'GET':
+            return text_response('Method Not Allowed', HTTPStatus.METHOD_NOT_ALLOWED)
+        try:
+            return await handler(query)
+        except Exception as error:
+            LOGGER.error("%s: ошибка обработки %s: %r", self.name, path, error)
+            return text_response('Internal Server Error', HTTPStatus.INTERNAL_SERVER_ERROR)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        status, content_type, body = await self._get_response(reader)
+        writer.write(
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode('latin-1') + body
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, limit=MAX_REQUEST_HEAD_SIZE)
+        LOGGER.info("%s: слушает http://%s:%s", self.name, self.host, self.port)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
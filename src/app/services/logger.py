@@ -1,9 +1,115 @@
+import atexit
+import json
 import logging
 import logging.handlers
+import multiprocessing
+import queue
 import sys
+import threading
+import time
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Dict, List
 
-from app.settings import APP_LOG_FILE, APP_LOGGER_NAME, APP_LOGGING_LEVEL
+from app.settings import APP_LOG_FILE, APP_LOGGER_NAME, APP_LOGGING_LEVEL, APP_LOG_FORMAT, APP_LOG_QUEUE_SIZE, \
+    APP_LOG_RATE_LIMIT_WINDOW_IN_SECONDS, APP_LOG_RATE_LIMIT_MAX_KEYS
+
+# Атрибуты, которые есть у любой записи лога: остальные пришли из extra и попадают в структурированную запись
+STANDARD_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Кладет запись в очередь без форматирования: сообщение, аргументы и трассировка форматируются
+    в потоке QueueListener, а не в цикле событий. Очередь ограничена, при переполнении запись отбрасывается
+    (счетчик dropped), чтобы логирование никогда не блокировало проверки.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Схлопывает повторы предупреждений и ошибок: из одинаковых записей (место вызова, шаблон сообщения,
+    функция, тип ошибки и ресурс из extra) за окно window проходит первая, остальные только считаются.
+    Первая запись после окна получает атрибут repeated - сколько повторов было подавлено.
+    """
+
+    def __init__(
+            self,
+            window: float = APP_LOG_RATE_LIMIT_WINDOW_IN_SECONDS,
+            max_keys: int = APP_LOG_RATE_LIMIT_MAX_KEYS,
+            min_level: int = logging.WARNING,
+    ):
+        super().__init__()
+        self.window = window
+        self.max_keys = max_keys
+        self.min_level = min_level
+        # Ключ записи -> [начало окна, подавлено повторов]
+        self._windows: Dict[tuple, List] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.min_level or not self.window:
+            return True
+        key = (
+            record.levelno, record.pathname, record.lineno, record.msg,
+            getattr(record, 'function', None), getattr(record, 'error_type', None), getattr(record, 'resource', None),
+        )
+        now = time.monotonic()
+        with self._lock:
+            state = self._windows.get(key)
+            if state is not None and now - state[0] < self.window:
+                state[1] += 1
+                return False
+            if state is not None and state[1]:
+                record.repeated = state[1]
+            if state is None and len(self._windows) >= self.max_keys:
+                self._windows = {
+                    other_key: other_state for other_key, other_state in self._windows.items()
+                    if now - other_state[0] < self.window
+                }
+            self._windows[key] = [now, 0]
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    """ Текстовый формат с количеством подавленных повторов. """
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        repeated = getattr(record, 'repeated', None)
+        return f"{text} (повторов за окно: {repeated})" if repeated else text
+
+
+class StructuredFormatter(logging.Formatter):
+    """ Запись лога одной JSON-строкой: время, уровень, место вызова, сообщение и поля из extra. """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'file': record.filename,
+            'line': record.lineno,
+            'message': record.getMessage(),
+        }
+        data.update(
+            (name, value) for name, value in vars(record).items() if name not in STANDARD_RECORD_ATTRIBUTES
+        )
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
 
 
 class GetLogger:
@@ -23,13 +129,15 @@ class GetLogger:
             log_encoding: str = 'utf-8',
             log_level: int = logging.DEBUG,
             logger_name: str = 'canvas_logger',
+            log_format: str = 'text',
 
     ):
         # Создаём формировщик логов (formatter):
         self.log_file = log_file
         self.log_level = log_level
         self.log_encoding = log_encoding
-        self.server_formatter = logging.Formatter(self.logger_format)
+        self.server_formatter = TextFormatter(self.logger_format)
+        self.file_formatter = StructuredFormatter() if log_format == 'json' else self.server_formatter
         # Подготовка имени файла для логирования
         self.logger = logging.getLogger(logger_name)
         self._add_handlers()
@@ -60,7 +168,7 @@ class GetLogger:
             interval=interval_value,
             when=interval_period
         )
-        log_file.setFormatter(self.server_formatter)
+        log_file.setFormatter(self.file_formatter)
         return log_file
 
     def _get_simple_file_handler(self):
@@ -69,14 +177,28 @@ class GetLogger:
             self.log_file,
             encoding=self.log_encoding
         )
-        log_file.setFormatter(self.server_formatter)
+        log_file.setFormatter(self.file_formatter)
         return log_file
 
     def _add_handlers(self):
-        """ Создаём и настраиваем регистраторы. """
+        """
+        Создаём и настраиваем регистраторы. Логгер пишет только в очередь, а файл и поток ошибок
+        обслуживает фоновый поток QueueListener, поэтому запись на диск не выполняется в цикле событий.
+        Файл с ротацией ведет только основной процесс: дочерние процессы (процессы проверок) пишут
+        в поток ошибок, иначе несколько процессов ротировали бы один файл.
+        """
         if not self.logger.hasHandlers():
-            self.logger.addHandler(self._get_stderr_handler())
-            self.logger.addHandler(self._get_rotating_file_handler())
+            log_queue = queue.Queue(APP_LOG_QUEUE_SIZE)
+            queue_handler = LazyQueueHandler(log_queue)
+            queue_handler.addFilter(RateLimitFilter())
+            handlers = [self._get_stderr_handler()]
+            if multiprocessing.parent_process() is None:
+                handlers.append(self._get_rotating_file_handler())
+            listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+            self.logger.addHandler(queue_handler)
+            listener.start()
+            # Оставшиеся в очереди записи дописываются при завершении процесса
+            atexit.register(listener.stop)
 
     def get_logger(self):
         return self.logger
@@ -95,7 +217,8 @@ class SWCoreLogger(GetLogger):
         super().__init__(
             log_file=APP_LOG_FILE,
             logger_name=APP_LOGGER_NAME,
-            log_level=APP_LOGGING_LEVEL
+            log_level=APP_LOGGING_LEVEL,
+            log_format=APP_LOG_FORMAT,
         )
 
 
@@ -0,0 +1,124 @@
+import asyncio
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from typing import List, Optional
+
+from app import settings
+from app.services.logger import SWCoreLogger
+from app.services.metrics import METRICS
+
+LOGGER = SWCoreLogger().get_logger()
+
+EMAILS = METRICS.counter('sw_core_emails_total', 'Отправлено писем', ['result'])
+SMTP_CONNECTS = METRICS.counter('sw_core_smtp_connects_total', 'Открыто SMTP-соединений')
+
+
+class SMTPConnectionPool:
+    """
+    Отправка писем через постоянные SMTP-соединения вне цикла событий: у каждого из pool_size потоков
+    отправки свое соединение, которое открывается при первой отправке и переиспользуется.
+    Соединение после простоя проверяется NOOP, разорванное соединение открывается заново с одним повтором отправки.
+    """
+
+    def __init__(
+            self,
+            host: str = settings.EMAIL_SERVER_HOST,
+            port: int = settings.EMAIL_SERVER_PORT,
+            pool_size: int = settings.ALERTING_SMTP_POOL_SIZE,
+            timeout: float = settings.ALERTING_SMTP_TIMEOUT_IN_SECONDS,
+            use_starttls: bool = settings.EMAIL_USE_STARTTLS,
+            user: Optional[str] = settings.EMAIL_USER,
+            password: Optional[str] = settings.EMAIL_PASSWORD,
+            idle_check_in_seconds: float = settings.ALERTING_SMTP_IDLE_CHECK_IN_SECONDS,
+    ):
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.use_starttls = use_starttls
+        self.user = user
+        self.password = password
+        self.idle_check_in_seconds = idle_check_in_seconds
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._local = threading.local()
+        self._connections: List[smtplib.SMTP] = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> smtplib.SMTP:
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_starttls:
+            connection.starttls()
+        if self.user:
+            connection.login(self.user, self.password)
+        SMTP_CONNECTS.inc()
+        with self._lock:
+            self._connections.append(connection)
+        return connection
+
+    def _drop_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is None:
+            return
+        with self._lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+        try:
+            connection.close()
+        except OSError:
+            pass
+
+    def _get_connection(self) -> smtplib.SMTP:
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and time.monotonic() - self._local.used_at > self.idle_check_in_seconds:
+            try:
+                if connection.noop()[0] != 250:
+                    raise smtplib.SMTPServerDisconnected('NOOP')
+            except (smtplib.SMTPException, OSError):
+                self._drop_connection()
+                connection = None
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    def _send_sync(self, message: EmailMessage):
+        """ Выполняется в потоке отправки. """
+        for attempt in range(2):
+            try:
+                self._get_connection().send_message(message)
+                self._local.used_at = time.monotonic()
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # Сервер мог закрыть простаивающее соединение: повтор через новое
+                self._drop_connection()
+                if attempt:
+                    raise
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='smtp')
+        return self._executor
+
+    async def send(self, message: EmailMessage):
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._get_executor(), self._send_sync, message)
+        except Exception:
+            EMAILS.inc(1, ('failed',))
+            raise
+        EMAILS.inc(1, ('sent',))
+
+    def close(self):
+        """ Дождется отправки начатых писем и закроет соединения. """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            try:
+                connection.quit()
+            except (smtplib.SMTPException, OSError):
+                connection.close()
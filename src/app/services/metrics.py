@@ -0,0 +1,196 @@
+import math
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app import settings
+from app.services.http_server import LocalHTTPServer, Response, text_response
+
+# Content-Type текстового формата Prometheus
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Границы корзин гистограмм по умолчанию
+LATENCY_MS_BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+DURATION_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ROWS_BUCKETS = (1, 10, 100, 1000, 10_000, 100_000)
+
+LabelValues = Tuple[str, ...]
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    pairs = (
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in zip(names, values)
+    )
+    return '{' + ','.join(pairs) + '}'
+
+
+class Metric:
+    """
+    Метрика с необязательными метками. Значения хранятся в словаре по кортежу значений меток,
+    запись - одна операция со словарем без блокировок: метрики пишутся только из цикла событий процесса.
+    """
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, object] = {}
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        """ Строки выдачи: (суффикс имени, метки, значение). """
+        for labels, value in self._values.items():
+            yield '', format_labels(self.labelnames, labels), value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(f"{self.name}{suffix}{labels} {format_value(value)}" for suffix, labels, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    """ Монотонно растущий счетчик. """
+    type = 'counter'
+
+    def inc(self, amount: float = 1, labels: LabelValues = ()):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, labels: LabelValues = ()) -> float:
+        return self._values.get(labels, 0)
+
+
+class Gauge(Metric):
+    """ Текущее значение. Вместо записи значения можно задать функцию, которая читается при выдаче. """
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set(self, value: float, labels: LabelValues = ()):
+        self._values[labels] = value
+
+    def inc(self, amount: float = 1, labels: LabelValues = ()):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set_function(self, function: Callable[[], float], labels: LabelValues = ()):
+        self._functions[labels] = function
+
+    def get(self, labels: LabelValues = ()) -> float:
+        function = self._functions.get(labels)
+        return function() if function is not None else self._values.get(labels, 0)
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        yield from super().samples()
+        for labels, function in self._functions.items():
+            yield '', format_labels(self.labelnames, labels), function()
+
+
+class Histogram(Metric):
+    """
+    Гистограмма с фиксированными корзинами: запись - поиск корзины делением пополам и два сложения.
+    Накопительные значения корзин (как требует формат Prometheus) считаются только при выдаче.
+    """
+    type = 'histogram'
+
+    def __init__(
+            self, name: str, documentation: str, labelnames: Sequence[str] = (),
+            buckets: Sequence[float] = DURATION_SECONDS_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, labels: LabelValues = ()):
+        state = self._values.get(labels)
+        if state is None:
+            # Количество по корзинам (последняя - +Inf) и сумма
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def get_count(self, labels: LabelValues = ()) -> int:
+        state = self._values.get(labels)
+        return sum(state[0]) if state is not None else 0
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                yield '_bucket', format_labels((*self.labelnames, 'le'), (*labels, format_value(bound))), cumulative
+            yield '_sum', format_labels(self.labelnames, labels), total
+            yield '_count', format_labels(self.labelnames, labels), cumulative
+
+
+class MetricsRegistry:
+    """ Метрики процесса по имени. Повторная регистрация с тем же именем вернет существующую метрику. """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric_class, name: str, *args, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = metric_class(name, *args, **kwargs)
+        elif not isinstance(metric, metric_class):
+            raise ValueError(f"Метрика {name} уже зарегистрирована с типом {metric.type}")
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(
+            self, name: str, documentation: str, labelnames: Sequence[str] = (),
+            buckets: Sequence[float] = DURATION_SECONDS_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets)
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """ Все метрики в текстовом формате Prometheus. """
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Общий реестр метрик процесса
+METRICS = MetricsRegistry()
+
+
+class MetricsAPI:
+    """ Локальный HTTP-эндпоинт GET /metrics для сбора метрик Prometheus. """
+
+    def __init__(
+            self,
+            registry: MetricsRegistry = METRICS,
+            host: str = settings.METRICS_API_HOST,
+            port: int = settings.METRICS_API_PORT,
+    ):
+        self.registry = registry
+        self.server = LocalHTTPServer(host, port, name='metrics api')
+        self.server.route('/metrics', self.get_metrics)
+
+    async def get_metrics(self, query: Dict[str, str]) -> Response:
+        return text_response(self.registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+    async def start(self):
+        await self.server.start()
+
+    async def stop(self):
+        await self.server.stop()
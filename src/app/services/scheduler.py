@@ -0,0 +1,81 @@
+import asyncio
+import math
+from typing import Awaitable, Callable
+
+from app.services.logger import SWCoreLogger
+from app.services.metrics import METRICS
+
+LOGGER = SWCoreLogger().get_logger()
+
+SCHEDULER_LAG_SECONDS = METRICS.histogram(
+    'sw_core_scheduler_lag_seconds', 'Опоздание запуска задачи относительно тика', ['task'],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+CYCLE_SECONDS = METRICS.histogram('sw_core_cycle_seconds', 'Длительность выполнения задачи на тике', ['task'])
+MISSED_TICKS = METRICS.counter('sw_core_scheduler_missed_ticks_total', 'Пропущено тиков из-за overrun', ['task'])
+
+
+class TickScheduler:
+    """
+    Запуск задачи на фиксированных тиках монотонных часов цикла событий: тик n наступает
+    в момент start + n * period независимо от длительности предыдущих запусков, поэтому период не плывет.
+    Запуски не накладываются друг на друга: если задача выполнялась дольше периода (overrun),
+    пропущенные тики не догоняются, а учитываются в missed_ticks и попадают в лог.
+    """
+
+    def __init__(self, name: str, period: float, func: Callable[[int], Awaitable]):
+        """
+        :param name: Имя задачи для логов
+        :param period: Период тиков (в секундах)
+        :param func: Корутина-функция, которой передается номер тика
+        """
+        self.name = name
+        self.period = period
+        self.func = func
+        self.ticks = 0
+        self.missed_ticks = 0
+        self.overruns = 0
+        # Опоздание запуска относительно тика в последнем запуске (в секундах)
+        self.last_lag = 0.0
+        self.last_duration = 0.0
+
+    async def _run_tick(self, tick_index: int):
+        try:
+            await self.func(tick_index)
+        except Exception as error:
+            LOGGER.error("%s: ошибка на тике %s: %r", self.name, tick_index, error, extra={'task': self.name})
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        tick_index = 0
+        labels = (self.name,)
+        while True:
+            tick_time = start + tick_index * self.period
+            await asyncio.sleep(max(0.0, tick_time - loop.time()))
+
+            run_start = loop.time()
+            self.last_lag = run_start - tick_time
+            SCHEDULER_LAG_SECONDS.observe(self.last_lag, labels)
+            await self._run_tick(tick_index)
+            self.ticks += 1
+            self.last_duration = loop.time() - run_start
+            CYCLE_SECONDS.observe(self.last_duration, labels)
+
+            if self.last_duration > self.period:
+                self.overruns += 1
+                LOGGER.warning(
+                    "%s: выполнение %0.2f секунд дольше периода %s секунд", self.name, self.last_duration, self.period,
+                    extra={'task': self.name},
+                )
+
+            # Следующий тик - ближайший в будущем, пропущенные не догоняем
+            next_tick_index = max(tick_index + 1, math.floor((loop.time() - start) / self.period) + 1)
+            missed = next_tick_index - tick_index - 1
+            if missed:
+                self.missed_ticks += missed
+                MISSED_TICKS.inc(missed, labels)
+                LOGGER.warning(
+                    "%s: пропущено тиков %s (всего %s)", self.name, missed, self.missed_ticks, extra={'task': self.name}
+                )
+            tick_index = next_tick_index
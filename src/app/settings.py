@@ -14,6 +14,22 @@ DB_PASS = os.environ.get('DB_PASS')
 DB_HOST = os.environ.get('DB_HOST')
 DB_PORT = os.environ.get('DB_PORT')
 
+# -------------- Настройки асинхронного слоя БД
+# Бэкенд БД: 'postgresql' - рабочая БД, 'memory' - SQLite в памяти процесса для unit-тестов реестра ресурсов
+# и записи результатов (statistics_writer, очередь записи, спул). Компоновка, итоги, секции, битовые карты
+# и шардирование используют SQL PostgreSQL и на 'memory' не работают (CompactionEngine откажет сразу)
+DB_BACKEND = os.environ.get('DB_BACKEND', 'postgresql')
+# Постоянное количество соединений в пуле
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+# Сколько соединений можно открыть сверх DB_POOL_SIZE при пиковой нагрузке
+DB_POOL_MAX_OVERFLOW = int(os.environ.get('DB_POOL_MAX_OVERFLOW', 5))
+# Проверять соединение перед выдачей из пула
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+# Через сколько секунд пересоздавать соединение пула
+DB_POOL_RECYCLE_IN_SECONDS = int(os.environ.get('DB_POOL_RECYCLE_IN_SECONDS', 1800))
+# Размер кэша подготовленных выражений на одно соединение
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 500))
+
 # -------------- Настройки логирования
 # Уровень логирования
 APP_LOGGING_LEVEL = logging.DEBUG
@@ -23,12 +39,200 @@ APP_LOG_FOLDER = BASE_DIR.parent / 'logs'
 APP_LOG_FILE = APP_LOG_FOLDER / 'sw_core.r2_log'
 # Имя логера для создания бэкапов
 APP_LOGGER_NAME = 'sw_core_logger'
+# Формат файла логов: 'json' - структурированные записи (по одной JSON-строке), 'text' - прежний текстовый
+APP_LOG_FORMAT = os.environ.get('APP_LOG_FORMAT', 'json')
+# Размер очереди записей между приложением и потоком записи логов (при переполнении записи отбрасываются)
+APP_LOG_QUEUE_SIZE = 10000
+# Окно (в секундах), в котором повторы одного предупреждения или ошибки (по ресурсу) схлопываются в одну запись
+APP_LOG_RATE_LIMIT_WINDOW_IN_SECONDS = int(os.environ.get('APP_LOG_RATE_LIMIT_WINDOW_IN_SECONDS', 60))
+# Сколько различных повторяющихся записей отслеживать одновременно
+APP_LOG_RATE_LIMIT_MAX_KEYS = 10000
 
 # -------------- Настройки сканирования ресурсов на доступность
 # Периодичность запуска сбора доступности (в секундах)
 FREQUENCY_OF_LAUNCHING_AVAILABILITY_COLLECTION = 5
+# Доля периода сбора, по которой равномерно разносятся проверки ресурсов внутри тика
+PROBE_JITTER_RATIO = float(os.environ.get('PROBE_JITTER_RATIO', 0.5))
 # Периодичность запуска обработки результатов сбора
 FREQUENCY_OF_LAUNCHING_AVAILABILITY_COMPILE = 20
+# Временной буфер (в секундах), в течении которого не учитываются изменения состояний доступности
+TIME_BUFFER_IN_SECONDS = 60
+# Максимальное время (в секундах) между проверками версии таблицы ресурсов, если уведомления недоступны
+RESOURCE_REGISTRY_TTL_IN_SECONDS = int(os.environ.get('RESOURCE_REGISTRY_TTL_IN_SECONDS', 60))
+# Канал PostgreSQL NOTIFY об изменении таблицы ресурсов (создается миграцией)
+RESOURCE_REGISTRY_NOTIFY_CHANNEL = 'sw_core_resources_changed'
+# Количество ресурсов, компонуемых одной транзакцией
+COMPACTION_BATCH_SIZE = int(os.environ.get('COMPACTION_BATCH_SIZE', 500))
+# Компонуются только замеры старше указанного количества секунд (запас на незавершенные транзакции записи)
+COMPACTION_DELAY_IN_SECONDS = 5
 # Колличество проверок ресурса на доступность
-COUNT_OF_AVAILABLE_ATTEMPT = 2
+COUNT_OF_AVAILABLE_ATTEMPT = int(os.environ.get('COUNT_OF_AVAILABLE_ATTEMPT', 2))
+# Таймаут одной попытки подключения к ресурсу (в секундах)
+PROBE_TIMEOUT_IN_SECONDS = float(os.environ.get('PROBE_TIMEOUT_IN_SECONDS', 1))
+# Максимальное количество одновременных попыток подключения (открытых сокетов)
+PROBE_CONCURRENCY_LIMIT = int(os.environ.get('PROBE_CONCURRENCY_LIMIT', 1000))
+# Количество процессов для проверок (0 - проверки выполняются в цикле событий основного процесса)
+PROBE_WORKER_PROCESSES = int(os.environ.get('PROBE_WORKER_PROCESSES', 0))
+# Запас ко времени ответа процесса проверок сверх таймаутов его заданий: не ответивший процесс перезапускается
+PROBE_WORKER_RESPONSE_SLACK_IN_SECONDS = 5
+# Проверки HTTP(S): простаивающее keep-alive соединение дольше этого времени не переиспользуется (в секундах)
+HTTP_PROBE_IDLE_TIMEOUT_IN_SECONDS = float(os.environ.get('HTTP_PROBE_IDLE_TIMEOUT_IN_SECONDS', 30))
+# Сколько простаивающих keep-alive соединений хранить на один ресурс
+HTTP_PROBE_MAX_IDLE_CONNECTIONS = 2
+# Сколько байт тела ответа читать для проверки (ответ длиннее дочитывается не будет, соединение закрывается)
+HTTP_PROBE_MAX_BODY_BYTES = 64 * 1024
+# Кэш разрешения имен ресурсов (check_resources.dns_cache). Системный резолвер не сообщает TTL записей,
+# поэтому срок жизни задается настройкой (в секундах), для ошибок разрешения - отдельно
+DNS_CACHE_TTL_IN_SECONDS = float(os.environ.get('DNS_CACHE_TTL_IN_SECONDS', 60))
+DNS_CACHE_NEGATIVE_TTL_IN_SECONDS = float(os.environ.get('DNS_CACHE_NEGATIVE_TTL_IN_SECONDS', 10))
+# Наибольшее количество записей кэша (вытесняются давно не использованные)
+DNS_CACHE_MAX_SIZE = int(os.environ.get('DNS_CACHE_MAX_SIZE', 10000))
+# Доля TTL, после которой запись при обращении обновляется в фоне, не дожидаясь истечения (1 - без обновления)
+DNS_CACHE_REFRESH_AHEAD_RATIO = 0.8
+# Режим записи результатов проверок: 'orm' - через unit of work,
+# 'insert' - один многострочный INSERT, 'copy' - PostgreSQL COPY
+AVAILABILITY_STATISTICS_WRITE_MODE = os.environ.get('AVAILABILITY_STATISTICS_WRITE_MODE', 'insert')
+# Дублировать результаты проверок в SwCoreResourceAvailabilityStatisticsTestStorage
+IS_WRITE_TEST_STORAGE = os.environ.get('IS_WRITE_TEST_STORAGE', 'false').lower() == 'true'
+# Очередь записи результатов проверок (check_resources.write_behind): максимальное количество результатов,
+# размер пачки записи (пишется запросами в пределах MAX_QUERY_PARAMETERS, make check-write-limits)
+# и наибольшее ожидание добора пачки (в секундах)
+WRITE_QUEUE_MAX_SIZE = int(os.environ.get('WRITE_QUEUE_MAX_SIZE', 100000))
+WRITE_QUEUE_BATCH_SIZE = int(os.environ.get('WRITE_QUEUE_BATCH_SIZE', 5000))
+WRITE_QUEUE_FLUSH_INTERVAL_IN_SECONDS = float(os.environ.get('WRITE_QUEUE_FLUSH_INTERVAL_IN_SECONDS', 1))
+# Политика переполнения очереди: 'block' - проверки ждут места, 'drop_new' - отбросить новый результат,
+# 'drop_oldest' - отбросить самый старый
+WRITE_QUEUE_OVERFLOW_POLICY = os.environ.get('WRITE_QUEUE_OVERFLOW_POLICY', 'block')
+# Наибольшая пауза между повторами неудачной записи пачки (в секундах)
+WRITE_QUEUE_RETRY_MAX_DELAY_IN_SECONDS = 30
+# Спул результатов на диске на время недоступности БД (check_resources.spool)
+IS_WRITE_SPOOL_ENABLED = os.environ.get('IS_WRITE_SPOOL_ENABLED', 'true').lower() == 'true'
+WRITE_SPOOL_DIR = Path(os.environ.get('WRITE_SPOOL_DIR', BASE_DIR.parent / 'data' / 'spool'))
+# Размер сегмента спула, после которого начинается следующий (в байтах)
+WRITE_SPOOL_SEGMENT_MAX_BYTES = int(os.environ.get('WRITE_SPOOL_SEGMENT_MAX_BYTES', 16 * 1024 * 1024))
+# Период пакетного fsync активного сегмента (в секундах)
+WRITE_SPOOL_FSYNC_INTERVAL_IN_SECONDS = float(os.environ.get('WRITE_SPOOL_FSYNC_INTERVAL_IN_SECONDS', 1))
+# Запись в БД дольше этого времени считается отказом БД, и пачка уходит в спул (в секундах)
+WRITE_SPOOL_DB_TIMEOUT_IN_SECONDS = float(os.environ.get('WRITE_SPOOL_DB_TIMEOUT_IN_SECONDS', 5))
+# После отказа БД результаты пишутся сразу в спул, попытка переноса спула в БД - не чаще этого периода (в секундах)
+WRITE_SPOOL_RETRY_IN_SECONDS = float(os.environ.get('WRITE_SPOOL_RETRY_IN_SECONDS', 10))
+# Размер пачки записи при переносе спула в БД (транзакции; запросы делятся по MAX_QUERY_PARAMETERS)
+WRITE_SPOOL_REPLAY_BATCH_SIZE = 5000
+# Сегмент, перенос которого столько раз подряд отклонен ошибкой запроса, переносится в папку failed спула
+# и больше не задерживает отсечку компоновки и срок хранения сырых замеров
+WRITE_SPOOL_MAX_REPLAY_FAILURES = int(os.environ.get('WRITE_SPOOL_MAX_REPLAY_FAILURES', 5))
 #
+
+# -------------- Настройки скетча квантилей задержки
+# Относительная точность оценки квантилей задержки
+LATENCY_SKETCH_RELATIVE_ACCURACY = 0.01
+# Максимальное количество корзин скетча (ограничивает память на один интервал)
+LATENCY_SKETCH_MAX_BUCKETS = 2048
+
+# -------------- Настройки шардирования ресурсов между экземплярами sw-core
+# Включить режим шардирования (каждый экземпляр проверяет и компонует только арендованные партиции)
+IS_SHARDING_ENABLED = os.environ.get('IS_SHARDING_ENABLED', 'false').lower() == 'true'
+# Идентификатор экземпляра (по умолчанию - имя хоста и pid)
+WORKER_ID = os.environ.get('WORKER_ID')
+# Количество партиций ресурсов (одинаковое для всех экземпляров)
+SHARDING_PARTITIONS_COUNT = int(os.environ.get('SHARDING_PARTITIONS_COUNT', 64))
+# Время аренды партиции и жизни экземпляра без сигнала (в секундах)
+SHARDING_LEASE_TTL_IN_SECONDS = int(os.environ.get('SHARDING_LEASE_TTL_IN_SECONDS', 30))
+# Периодичность продления аренды (в секундах)
+SHARDING_HEARTBEAT_IN_SECONDS = int(os.environ.get('SHARDING_HEARTBEAT_IN_SECONDS', 10))
+
+# -------------- Настройки адаптивной частоты проверок
+# Включить адаптивный режим (по умолчанию выключен): стабильно доступные ресурсы проверяются реже,
+# смена состояния сразу перепроверяется. Отказ стабильного ресурса замечается позже - см. ProbePlanner
+IS_ADAPTIVE_PROBING_ENABLED = os.environ.get('IS_ADAPTIVE_PROBING_ENABLED', 'false').lower() == 'true'
+# Максимальное время (в секундах) между проверками стабильно доступного ресурса: на столько может опоздать
+# обнаружение его отказа. По умолчанию - в масштабе ALERTING_MIN_OUTAGE_IN_SECONDS, чтобы оповещение об отказе
+# запаздывало не больше, чем на минимальную длительность отказа
+ADAPTIVE_PROBING_MAX_STALENESS_IN_SECONDS = int(os.environ.get('ADAPTIVE_PROBING_MAX_STALENESS_IN_SECONDS', 30))
+# После скольких подряд успешных проверок период проверки ресурса удваивается
+ADAPTIVE_PROBING_BACKOFF_STEP = 3
+# Количество попыток подключения к стабильно доступному ресурсу
+ADAPTIVE_PROBING_STABLE_ATTEMPTS = 1
+# Сколько раз перепроверить ресурс после смены состояния
+ADAPTIVE_PROBING_CONFIRM_PROBES = 3
+# Пауза между перепроверками после смены состояния (в секундах)
+ADAPTIVE_PROBING_CONFIRM_INTERVAL_IN_SECONDS = 1
+
+# -------------- Настройки секционирования таблиц сырых замеров
+# Размер секции: 'day' - сутки, 'hour' - час
+RAW_STATISTICS_PARTITION_INTERVAL = os.environ.get('RAW_STATISTICS_PARTITION_INTERVAL', 'day')
+# На сколько секций вперед создавать секции заранее
+RAW_STATISTICS_PARTITIONS_AHEAD = int(os.environ.get('RAW_STATISTICS_PARTITIONS_AHEAD', 3))
+# Срок хранения сырых замеров (в часах), секции старше удаляются целиком, но не раньше компоновки их строк
+RAW_STATISTICS_RETENTION_IN_HOURS = int(os.environ.get('RAW_STATISTICS_RETENTION_IN_HOURS', 48))
+# Что делать с устаревшими секциями: 'drop' - удалить, 'detach' - отсоединить (например, для архивации)
+RAW_STATISTICS_RETENTION_ACTION = os.environ.get('RAW_STATISTICS_RETENTION_ACTION', 'drop')
+# Периодичность обслуживания секций (в секундах)
+RAW_STATISTICS_PARTITION_MAINTENANCE_IN_SECONDS = 600
+
+# -------------- Настройки компактной истории проверок (битовые карты)
+# Где хранить сырую историю проверок: 'rows' - строки SwCoreResourceAvailabilityStatistics,
+# 'bitmap' - битовые карты SwCoreResourceAvailabilityBitmap (компоновка читает их),
+# 'both' - и строки, и карты (компоновка читает строки)
+RAW_HISTORY_STORE = os.environ.get('RAW_HISTORY_STORE', 'rows')
+# Длительность периода одной битовой карты (в секундах)
+BITMAP_HISTORY_BUCKET_IN_SECONDS = 86400
+# Длительность слота битовой карты (в секундах)
+BITMAP_HISTORY_SLOT_IN_SECONDS = FREQUENCY_OF_LAUNCHING_AVAILABILITY_COLLECTION
+
+# -------------- Настройки итогов доступности и API для запросов uptime
+# Обновлять почасовые и суточные итоги при компоновке
+IS_AVAILABILITY_ROLLUPS_ENABLED = os.environ.get('IS_AVAILABILITY_ROLLUPS_ENABLED', 'true').lower() == 'true'
+# Запускать локальный HTTP API для запросов uptime, количества отказов и MTTR
+IS_UPTIME_API_ENABLED = os.environ.get('IS_UPTIME_API_ENABLED', 'false').lower() == 'true'
+UPTIME_API_HOST = os.environ.get('UPTIME_API_HOST', '127.0.0.1')
+UPTIME_API_PORT = int(os.environ.get('UPTIME_API_PORT', 8081))
+# Количество ответов в LRU-кэше API
+UPTIME_API_CACHE_SIZE = 1024
+# Окно по умолчанию, если в запросе не указано начало (в днях)
+UPTIME_API_DEFAULT_WINDOW_IN_DAYS = 30
+
+# -------------- Настройки метрик
+# Запускать локальный HTTP-эндпоинт метрик в текстовом формате Prometheus (метрики собираются всегда)
+IS_METRICS_API_ENABLED = os.environ.get('IS_METRICS_API_ENABLED', 'false').lower() == 'true'
+METRICS_API_HOST = os.environ.get('METRICS_API_HOST', '127.0.0.1')
+METRICS_API_PORT = int(os.environ.get('METRICS_API_PORT', 9108))
+
+# -------------- Настройки оповещений о смене доступности ресурсов
+# Отправлять оповещения по email при смене состояния ресурсов (по результатам компоновки)
+IS_ALERTING_ENABLED = os.environ.get('IS_ALERTING_ENABLED', 'false').lower() == 'true'
+EMAIL_SERVER_HOST = os.environ.get('EMAIL_SERVER_HOST', '127.0.0.1')
+EMAIL_SERVER_PORT = int(os.environ.get('EMAIL_SERVER_PORT', 25))
+EMAIL_USE_STARTTLS = os.environ.get('EMAIL_USE_STARTTLS', 'false').lower() == 'true'
+EMAIL_USER = os.environ.get('EMAIL_USER')
+EMAIL_PASSWORD = os.environ.get('EMAIL_PASSWORD')
+# Адрес отправителя оповещений
+EMAIL_FOR_SEND = os.environ.get('EMAIL_FOR_SEND', 'sw-core@localhost')
+# Получатели оповещений (через запятую)
+ALERTING_RECIPIENTS = [
+    address.strip() for address in os.environ.get('ALERTING_RECIPIENTS', '').split(',') if address.strip()
+]
+# Количество постоянных SMTP-соединений (и потоков отправки)
+ALERTING_SMTP_POOL_SIZE = int(os.environ.get('ALERTING_SMTP_POOL_SIZE', 2))
+ALERTING_SMTP_TIMEOUT_IN_SECONDS = 10
+# Соединение, простаивавшее дольше, проверяется командой NOOP перед отправкой (в секундах)
+ALERTING_SMTP_IDLE_CHECK_IN_SECONDS = 60
+# Сколько оповещений одного вида за компоновку отправляются одним письмом-сводкой
+ALERTING_DIGEST_THRESHOLD = int(os.environ.get('ALERTING_DIGEST_THRESHOLD', 5))
+# Оповещать об отказе, только если он длится не меньше указанного времени (в секундах)
+ALERTING_MIN_OUTAGE_IN_SECONDS = int(os.environ.get('ALERTING_MIN_OUTAGE_IN_SECONDS', 30))
+# Не чаще одного оповещения об отказе ресурса за указанное время (в секундах), защита от мигания
+ALERTING_RESOURCE_COOLDOWN_IN_SECONDS = int(os.environ.get('ALERTING_RESOURCE_COOLDOWN_IN_SECONDS', 900))
+# Сколько последних инцидентов помнить для дедупликации
+ALERTING_MAX_INCIDENTS = 10000
+# Попыток отправки события оповещения (повтор - при следующей отправке после компоновки), затем событие отбрасывается
+ALERTING_MAX_SEND_ATTEMPTS = int(os.environ.get('ALERTING_MAX_SEND_ATTEMPTS', 5))
+
+# -------------- Настройки архива интервалов доступности (нужен numpy)
+# Переносить старые закрытые интервалы из SwCoreResourceAvailabilityCompare в колоночные файлы ресурсов
+IS_INTERVAL_ARCHIVE_ENABLED = os.environ.get('IS_INTERVAL_ARCHIVE_ENABLED', 'false').lower() == 'true'
+INTERVAL_ARCHIVE_DIR = Path(os.environ.get('INTERVAL_ARCHIVE_DIR', BASE_DIR.parent / 'data' / 'archive'))
+# Переносятся интервалы, закончившиеся раньше указанного количества дней назад
+INTERVAL_ARCHIVE_AFTER_DAYS = int(os.environ.get('INTERVAL_ARCHIVE_AFTER_DAYS', 90))
+# Периодичность переноса (в секундах)
+INTERVAL_ARCHIVE_PERIOD_IN_SECONDS = 3600
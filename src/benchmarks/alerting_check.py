@@ -0,0 +1,121 @@
+"""
+Проверка оповещений на локальном SMTP-сервере (benchmarks.stand_ins.LocalSMTPServer) без БД:
+по синтетическим интервалам проверяются отдельные письма и сводки, дедупликация по инциденту и по ресурсу,
+отказ, закрытый внутри пачки компоновки, повторная отправка после ошибки SMTP и переиспользование
+SMTP-соединений. Завершится с ошибкой при расхождении.
+
+Запуск из папки src: python -m benchmarks.alerting_check
+"""
+import asyncio
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from app.services.mailer import SMTPConnectionPool
+from benchmarks.stand_ins import LocalSMTPServer
+from check_resources.alerting import AlertManager
+from check_resources.compaction import OpenInterval
+from check_resources.latency_sketch import LatencySketch
+
+POOL_SIZE = 2
+DIGEST_THRESHOLD = 5
+
+
+class FailingMailer:
+    """ Первые failures отправок завершаются ошибкой, остальные уходят в mailer. """
+
+    def __init__(self, mailer: SMTPConnectionPool, failures: int):
+        self.mailer = mailer
+        self.failures = failures
+
+    async def send(self, message):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionRefusedError("SMTP недоступен")
+        await self.mailer.send(message)
+
+
+def get_row(resource: uuid.UUID, interval: OpenInterval) -> dict:
+    return {
+        'id': interval.id, 'time_from': interval.time_from, 'time_to': interval.time_to,
+        'is_available': interval.is_available, 'resource': resource,
+    }
+
+
+def get_interval(is_available: bool, time_from: datetime, seconds: float, interval_id=None) -> OpenInterval:
+    return OpenInterval(
+        id=interval_id or uuid.uuid4(),
+        time_from=time_from,
+        time_to=time_from + timedelta(seconds=seconds),
+        is_available=is_available,
+        latency_sketch=LatencySketch(),
+    )
+
+
+async def check_alerting() -> List[str]:
+    errors = []
+    server = LocalSMTPServer()
+    await server.start()
+    mailer = SMTPConnectionPool(host=server.host, port=server.port, pool_size=POOL_SIZE, use_starttls=False, user=None)
+    manager = AlertManager(
+        mailer, recipients=['ops@localhost'], sender='sw-core@localhost',
+        digest_threshold=DIGEST_THRESHOLD, min_outage_in_seconds=30, cooldown_in_seconds=3600,
+    )
+    now = datetime.now(timezone.utc)
+    single = [uuid.uuid4() for _ in range(DIGEST_THRESHOLD - 1)]
+    storm = [uuid.uuid4() for _ in range(100)]
+
+    async def expect(step: str, observed: dict, messages_count: int, intervals: List[dict] = None):
+        sent_before = len(server.messages)
+        manager.observe(observed, intervals)
+        await manager.dispatch({})
+        if len(server.messages) - sent_before != messages_count:
+            errors.append(f"{step}: писем {len(server.messages) - sent_before}, ожидалось {messages_count}")
+
+    try:
+        incidents = {resource: get_interval(False, now, 60) for resource in single}
+        await expect("короткий отказ", {resource: get_interval(False, now, 5) for resource in single}, 0)
+        await expect("отдельные отказы", incidents, len(single))
+        await expect("повтор инцидента", incidents, 0)
+        await expect("отказ многих ресурсов", {resource: get_interval(False, now, 60) for resource in storm}, 1)
+        recovered = {resource: get_interval(True, now + timedelta(seconds=60), 5) for resource in single + storm}
+        await expect("восстановление", recovered, 1)
+        flap = {single[0]: get_interval(False, now + timedelta(seconds=90), 60)}
+        await expect("мигание в пределах cooldown", flap, 0)
+
+        # Отказ начался и закончился между запусками компоновки: в пачке он только среди закрытых интервалов
+        closed = uuid.uuid4()
+        closed_intervals = [
+            get_interval(True, now, 10), get_interval(False, now + timedelta(seconds=10), 60),
+            get_interval(True, now + timedelta(seconds=70), 10),
+        ]
+        await expect(
+            "отказ внутри пачки", {closed: closed_intervals[-1]}, 2,
+            [get_row(closed, interval) for interval in closed_intervals],
+        )
+
+        failed = uuid.uuid4()
+        manager.mailer = FailingMailer(mailer, failures=1)
+        await expect("ошибка отправки", {failed: get_interval(False, now, 60)}, 0)
+        if len(manager.pending) != 1:
+            errors.append(f"После ошибки отправки в очереди событий {len(manager.pending)}, ожидалось 1")
+        await expect("повтор отправки", {}, 1)
+        manager.mailer = mailer
+        if server.messages and 'Недоступно ресурсов: 100' not in server.messages[len(single)]['Subject']:
+            errors.append(f"Тема сводки: {server.messages[len(single)]['Subject']}")
+    finally:
+        await asyncio.get_running_loop().run_in_executor(None, mailer.close)
+        await server.stop()
+
+    if server.connections_count > POOL_SIZE:
+        errors.append(f"SMTP-подключений {server.connections_count}, ожидалось не больше {POOL_SIZE}")
+    return errors
+
+
+if __name__ == '__main__':
+    alerting_errors = asyncio.run(check_alerting())
+    for alerting_error in alerting_errors:
+        print(alerting_error)
+    print("Оповещения: ошибок нет" if not alerting_errors else f"Оповещения: ошибок {len(alerting_errors)}")
+    sys.exit(1 if alerting_errors else 0)
@@ -0,0 +1,153 @@
+"""
+Бенчмарк отчетов по архиву интервалов (check_resources.archive) без БД: для --resources ресурсов
+синтетическая история за --days дней (доступность с экспоненциальными длительностями, отказы и мигание)
+дописывается в архив во временной папке, затем замеряются отчеты IntervalArchive.get_report за всю историю
+и за случайные окна. Те же отчеты считаются эталонной реализацией на Python по всем интервалам ресурса
+(как при чтении строк через ORM): расхождение с эталоном - код возврата 1.
+
+Запуск из папки src: python -m benchmarks.archive_benchmark --resources 10 --days 365
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+from benchmarks.results import get_distribution, print_results, write_results
+from check_resources.archive import ArchiveReport, IntervalArchive, to_epoch
+
+# Допустимое расхождение секунд с эталоном (суммы в другом порядке)
+TOLERANCE_SECONDS = 1e-3
+
+Interval = Tuple[int, int, bool]
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resources', type=int, default=10, help='Количество ресурсов')
+    parser.add_argument('--days', type=float, default=365, help='Длительность истории (в днях)')
+    parser.add_argument('--up-mean', type=float, default=3600, help='Средняя длительность доступности (в секундах)')
+    parser.add_argument('--down-mean', type=float, default=120, help='Средняя длительность отказа (в секундах)')
+    parser.add_argument('--windows', type=int, default=200, help='Количество случайных окон на ресурс')
+    parser.add_argument('--seed', type=int, default=0, help='Зерно генератора истории')
+    parser.add_argument('--output', default=None, help='Файл результатов (по умолчанию - в data/benchmarks)')
+    return parser.parse_args()
+
+
+def generate_intervals(generator: np.random.Generator, start: int, end: int, up_mean: float, down_mean: float):
+    """ Чередующиеся интервалы доступности и отказа (микросекунды от эпохи) от start до end. """
+    expected_count = int(2 * (end - start) / 1_000_000 / (up_mean + down_mean)) + 16
+    means = np.tile([up_mean, down_mean], expected_count // 2 + 1)[:expected_count]
+    durations = np.maximum(1, generator.exponential(means) * 1_000_000).astype(np.int64)
+    bounds = start + np.concatenate([[0], np.cumsum(durations)])
+    count = max(1, int(np.searchsorted(bounds, end)))
+    time_from = bounds[:count]
+    time_to = np.minimum(bounds[1:count + 1], end)
+    states = np.arange(count) % 2 == 0
+    return time_from, time_to, states
+
+
+def get_reference_report(intervals: List[Interval], start: int, stop: int) -> Tuple:
+    """ Отчет перебором всех интервалов ресурса. """
+    up_seconds = down_seconds = 0.0
+    outages_count = 0
+    longest_outage = None
+    for time_from, time_to, is_available in intervals:
+        if time_to <= start or time_from >= stop:
+            continue
+        seconds = (min(time_to, stop) - max(time_from, start)) / 1_000_000
+        if is_available:
+            up_seconds += seconds
+            continue
+        down_seconds += seconds
+        outages_count += time_from >= start
+        longest_outage = seconds if longest_outage is None else max(longest_outage, seconds)
+    return up_seconds, down_seconds, outages_count, longest_outage
+
+
+def is_matching(report: ArchiveReport, reference: Tuple) -> bool:
+    up_seconds, down_seconds, outages_count, longest_outage = reference
+    if report.outages_count != outages_count or (report.longest_outage_seconds is None) != (longest_outage is None):
+        return False
+    values = [(report.up_seconds, up_seconds), (report.down_seconds, down_seconds)]
+    if longest_outage is not None:
+        values.append((report.longest_outage_seconds, longest_outage))
+    return all(abs(value - expected) <= TOLERANCE_SECONDS for value, expected in values)
+
+
+def run_benchmark(arguments, directory: Path) -> dict:
+    generator = np.random.default_rng(arguments.seed)
+    windows_random = random.Random(arguments.seed)
+    archive = IntervalArchive(directory)
+    end = datetime.now(timezone.utc).replace(microsecond=0)
+    start = end - timedelta(days=arguments.days)
+    start_epoch, end_epoch = to_epoch(start), to_epoch(end)
+
+    histories = {}
+    append_start = time.perf_counter()
+    for _ in range(arguments.resources):
+        resource = uuid.uuid4()
+        columns = generate_intervals(generator, start_epoch, end_epoch, arguments.up_mean, arguments.down_mean)
+        archive.append(resource, *columns)
+        histories[resource] = list(zip(*(column.tolist() for column in columns)))
+    append_seconds = time.perf_counter() - append_start
+    intervals_count = sum(len(intervals) for intervals in histories.values())
+
+    full_ms, window_ms, reference_ms = [], [], []
+    mismatches = 0
+    for resource, intervals in histories.items():
+        windows = [(start, end)]
+        for _ in range(arguments.windows):
+            window_from = start + timedelta(seconds=windows_random.uniform(0, arguments.days * 86400))
+            window_to = window_from + timedelta(seconds=windows_random.uniform(60, 30 * 86400))
+            windows.append((window_from, min(window_to, end)))
+        for number, (window_from, window_to) in enumerate(windows):
+            report_start = time.perf_counter()
+            report = archive.get_report(resource, window_from, window_to)
+            (window_ms if number else full_ms).append((time.perf_counter() - report_start) * 1000)
+            reference_start = time.perf_counter()
+            reference = get_reference_report(intervals, to_epoch(window_from), to_epoch(window_to))
+            if not number:
+                reference_ms.append((time.perf_counter() - reference_start) * 1000)
+            if not is_matching(report, reference):
+                mismatches += 1
+                print(f"Расхождение {resource} [{window_from}, {window_to}): {report}, эталон {reference}")
+
+    return {
+        'append': {
+            'intervals': intervals_count,
+            'seconds': append_seconds,
+            'intervals_per_second': intervals_count / append_seconds if append_seconds else None,
+        },
+        'full_history_report_ms': get_distribution(full_ms),
+        'window_report_ms': get_distribution(window_ms),
+        'full_history_reference_ms': get_distribution(reference_ms),
+        'verification': {'reports': len(full_ms) + len(window_ms), 'mismatches': mismatches},
+    }
+
+
+def main():
+    arguments = get_arguments()
+    with tempfile.TemporaryDirectory() as directory:
+        results = run_benchmark(arguments, Path(directory))
+    output = write_results('archive', vars(arguments), results, arguments.output)
+    print_results(
+        'archive',
+        {case: results[case] for case in ('full_history_report_ms', 'window_report_ms', 'full_history_reference_ms')},
+        ['p50', 'p95', 'max'],
+    )
+    mismatches = results['verification']['mismatches']
+    print(f"Интервалов: {results['append']['intervals']}, расхождений с эталоном: {mismatches}")
+    print(f"Результаты: {output}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+"""
+Бенчмарк компоновки на детерминированной синтетической истории (benchmarks.history_generator):
+N ресурсов за M дней с миганием, долгими отказами и пропусками сбора загружаются COPY в локальную БД,
+затем CompactionEngine компонует их за --steps запусков с растущей отсечкой.
+Замеряются время, пик памяти (tracemalloc и ru_maxrss) и строк в секунду; интервалы
+SwCoreResourceAvailabilityCompare сверяются с эталонной реализацией на Python (расхождение - код возврата 1).
+
+Запуск из папки src: python -m benchmarks.compaction_benchmark --resources 100 --days 1
+Нужен PostgreSQL (DB_BACKEND=postgresql) с примененными миграциями. Ресурсы бенчмарка неактивны,
+поэтому работающий sw-core их не проверяет; после замера они удаляются (кроме запуска с --keep).
+"""
+import argparse
+import asyncio
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from resource import RUSAGE_SELF, getrusage
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from benchmarks.history_generator import HistoryConfig, generate_resource_history, generate_statistics_records, \
+    get_resource_id
+from benchmarks.results import print_results, write_results
+
+# Строк в одном COPY
+COPY_CHUNK_SIZE = 50_000
+# Сколько расхождений с эталоном попадает в результаты
+MISMATCH_EXAMPLES = 10
+
+STATISTICS_COLUMNS = (
+    'id', 'created_at', 'is_available', 'resource', 'min_latency', 'avg_latency', 'max_latency', 'failures_count',
+)
+
+Interval = Tuple[datetime, datetime, bool]
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resources', type=int, default=100, help='Количество ресурсов')
+    parser.add_argument('--days', type=float, default=1, help='Длительность истории (в днях)')
+    parser.add_argument('--period', type=float, default=5, help='Период проверок (в секундах)')
+    parser.add_argument('--flap-probability', type=float, default=0.001, help='Вероятность мигания на проверку')
+    parser.add_argument('--outage-probability', type=float, default=0.0001, help='Вероятность начала отказа')
+    parser.add_argument('--outage-mean', type=float, default=1800, help='Средняя длительность отказа (в секундах)')
+    parser.add_argument('--gap-probability', type=float, default=0.00005, help='Вероятность пропуска сбора')
+    parser.add_argument('--gap-mean', type=float, default=600, help='Средняя длительность пропуска (в секундах)')
+    parser.add_argument('--steps', type=int, default=4, help='Количество запусков компоновки по истории')
+    parser.add_argument('--seed', type=int, default=0, help='Зерно генератора истории')
+    parser.add_argument('--keep', action='store_true', help='Не удалять данные бенчмарка после замера')
+    parser.add_argument('--output', default=None, help='Файл результатов (по умолчанию - в data/benchmarks)')
+    return parser.parse_args()
+
+
+def get_history_config(arguments) -> HistoryConfig:
+    # История заканчивается в прошлом, чтобы все замеры были старше любой отсечки компоновки
+    end = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)
+    return HistoryConfig(
+        seed=arguments.seed,
+        resources_count=arguments.resources,
+        start=end - timedelta(days=arguments.days),
+        end=end,
+        period=arguments.period,
+        flap_probability=arguments.flap_probability,
+        outage_probability=arguments.outage_probability,
+        gap_probability=arguments.gap_probability,
+        outage_mean_seconds=arguments.outage_mean,
+        gap_mean_seconds=arguments.gap_mean,
+    )
+
+
+def get_reference_intervals(
+        history: Iterable[Tuple[datetime, bool, Optional[float]]], max_gap: timedelta
+) -> List[Interval]:
+    """
+    Эталон компоновки за один проход: новый интервал начинается при смене доступности
+    или при разрыве между соседними замерами больше max_gap.
+    """
+    intervals = []
+    for moment, is_available, _ in history:
+        if intervals:
+            time_from, time_to, last_is_available = intervals[-1]
+            if last_is_available == is_available and moment - time_to <= max_gap:
+                intervals[-1] = (time_from, moment, is_available)
+                continue
+        intervals.append((moment, moment, is_available))
+    return intervals
+
+
+def get_max_gap(config: HistoryConfig) -> timedelta:
+    from app import settings
+    from check_resources.compaction import get_gap_in_seconds
+
+    return timedelta(seconds=get_gap_in_seconds(round(config.period)) + settings.TIME_BUFFER_IN_SECONDS)
+
+
+async def load_history(config: HistoryConfig) -> int:
+    """ Создаст ресурсы и секции на промежуток истории и загрузит замеры COPY. :return: Количество строк """
+    from app import settings
+    from app.database import AsyncDBAdapter
+    from check_resources.models import SwCoreResources, SwCoreResourceAvailabilityStatistics
+    from check_resources.partitions import get_create_partition_sql, iter_partition_starts
+    from sqlalchemy import insert, text
+
+    table = SwCoreResourceAvailabilityStatistics.__tablename__
+    interval = settings.RAW_STATISTICS_PARTITION_INTERVAL
+    async with AsyncDBAdapter().get_session() as session:
+        for start in iter_partition_starts(config.start, config.end, interval):
+            await session.execute(text(get_create_partition_sql(table, start, interval)))
+        await session.execute(insert(SwCoreResources).values([
+            {
+                'id': get_resource_id(config, index),
+                'name': f"bench-history-{config.seed}-{index}",
+                'description': 'benchmarks.compaction_benchmark',
+                'host': '127.0.0.1',
+                'port': 9,
+                'is_active': False,
+                'probe_interval': round(config.period),
+            }
+            for index in range(config.resources_count)
+        ]))
+
+    rows_count = 0
+    for index in range(config.resources_count):
+        records = generate_statistics_records(config, index)
+        while True:
+            chunk = list(islice(records, COPY_CHUNK_SIZE))
+            if not chunk:
+                break
+            async with AsyncDBAdapter().get_session() as session:
+                connection = await (await session.connection()).get_raw_connection()
+                await connection.driver_connection.copy_records_to_table(
+                    table, records=chunk, columns=STATISTICS_COLUMNS
+                )
+            rows_count += len(chunk)
+    return rows_count
+
+
+async def run_compaction(resources: List, config: HistoryConfig, steps: int) -> dict:
+    """ Компоновка истории за steps запусков с равномерно растущей отсечкой. """
+    from check_resources.compaction import CompactionEngine
+
+    engine = CompactionEngine()
+    step = (config.end - config.start) / steps
+    cutoffs = [config.start + step * (index + 1) for index in range(steps)]
+    # Последняя отсечка строго после последнего замера
+    cutoffs[-1] = config.end + timedelta(seconds=1)
+
+    step_seconds = []
+    compacted_rows = 0
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    for cutoff in cutoffs:
+        step_started_at = time.perf_counter()
+        compacted_rows += await engine.run(resources, cutoff)
+        step_seconds.append(time.perf_counter() - step_started_at)
+    seconds = time.perf_counter() - started_at
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'compacted_rows': compacted_rows,
+        'seconds': seconds,
+        'step_seconds': step_seconds,
+        'rows_per_second': compacted_rows / seconds if seconds else None,
+        'tracemalloc_peak_mb': peak_bytes / 2 ** 20,
+        'max_rss_mb': getrusage(RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+async def read_intervals(resources: List) -> Dict:
+    from app.database import AsyncDBAdapter
+    from check_resources.models import SwCoreResourceAvailabilityCompare
+    from sqlalchemy import select
+
+    compare = SwCoreResourceAvailabilityCompare
+    intervals = {resource: [] for resource in resources}
+    async with AsyncDBAdapter().get_session() as session:
+        query = await session.execute(
+            select(compare.resource, compare.time_from, compare.time_to, compare.is_available).where(
+                compare.resource.in_(resources)
+            ).order_by(compare.resource, compare.time_from)
+        )
+        for row in query:
+            intervals[row.resource].append((row.time_from, row.time_to, row.is_available))
+    return intervals
+
+
+async def verify_intervals(config: HistoryConfig) -> dict:
+    """ Сверит интервалы компоновки с эталоном по каждому ресурсу. """
+    max_gap = get_max_gap(config)
+    resources = [get_resource_id(config, index) for index in range(config.resources_count)]
+    actual = await read_intervals(resources)
+
+    mismatches = []
+    intervals_count = 0
+    for index, resource in enumerate(resources):
+        expected = get_reference_intervals(generate_resource_history(config, index), max_gap)
+        intervals_count += len(expected)
+        if actual[resource] != expected:
+            mismatches.append({
+                'resource': str(resource),
+                'expected_intervals': len(expected),
+                'actual_intervals': len(actual[resource]),
+                'first_difference': next(
+                    (
+                        position for position, (left, right) in enumerate(zip(expected, actual[resource]))
+                        if left != right
+                    ),
+                    min(len(expected), len(actual[resource])),
+                ),
+            })
+    return {
+        'intervals': intervals_count,
+        'mismatched_resources': len(mismatches),
+        'mismatches': mismatches[:MISMATCH_EXAMPLES],
+    }
+
+
+async def cleanup(config: HistoryConfig):
+    from app.database import AsyncDBAdapter
+    from check_resources.models import SwCoreResources, SwCoreResourceAvailabilityStatistics, \
+        SwCoreResourceAvailabilityCompare, SwCoreCompactionCheckpoint
+    from check_resources.rollups import ROLLUP_MODELS
+    from sqlalchemy import delete
+
+    resources = [get_resource_id(config, index) for index in range(config.resources_count)]
+    async with AsyncDBAdapter().get_session() as session:
+        for model in (
+                *ROLLUP_MODELS.values(),
+                SwCoreCompactionCheckpoint,
+                SwCoreResourceAvailabilityCompare,
+                SwCoreResourceAvailabilityStatistics,
+        ):
+            await session.execute(delete(model).where(model.resource.in_(resources)))
+        await session.execute(delete(SwCoreResources).where(SwCoreResources.id.in_(resources)))
+
+
+async def run_benchmark(arguments, config: HistoryConfig) -> dict:
+    resources = [get_resource_id(config, index) for index in range(config.resources_count)]
+    try:
+        started_at = time.perf_counter()
+        rows_count = await load_history(config)
+        load_seconds = time.perf_counter() - started_at
+        results = {
+            'load': {
+                'rows': rows_count,
+                'seconds': load_seconds,
+                'rows_per_second': rows_count / load_seconds if load_seconds else None,
+            },
+            'compaction': await run_compaction(resources, config, arguments.steps),
+        }
+        results['verification'] = await verify_intervals(config)
+        return results
+    finally:
+        if not arguments.keep:
+            await cleanup(config)
+
+
+def main():
+    arguments = get_arguments()
+    from app import settings
+
+    if settings.DB_BACKEND != 'postgresql':
+        sys.exit("Компоновка выполняется только на PostgreSQL: запустите с DB_BACKEND=postgresql")
+    config = get_history_config(arguments)
+    results = asyncio.run(run_benchmark(arguments, config))
+    output = write_results(
+        'compaction',
+        {
+            **vars(arguments),
+            'history_start': config.start.isoformat(),
+            'history_end': config.end.isoformat(),
+            'compaction_batch_size': settings.COMPACTION_BATCH_SIZE,
+            'time_buffer_in_seconds': settings.TIME_BUFFER_IN_SECONDS,
+            'is_rollups_enabled': settings.IS_AVAILABILITY_ROLLUPS_ENABLED,
+        },
+        results,
+        arguments.output,
+    )
+    print_results('compaction', {case: results[case] for case in ('load', 'compaction')}, ['seconds', 'rows_per_second'])
+    print(f"Интервалов: {results['verification']['intervals']}, "
+          f"ресурсов с расхождениями: {results['verification']['mismatched_resources']}")
+    print(f"Результаты: {output}")
+    if results['verification']['mismatched_resources']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Проверка кэша разрешения имен (check_resources.dns_cache) на резолвере-заменителе, который считает обращения:
+попадания, истечение TTL, отрицательные записи, вытеснение давно не использованных записей, объединение
+одновременных промахов и фоновое обновление до истечения без ожидания резолвера в проверке.
+Завершится с ошибкой при расхождении.
+
+Запуск из папки src: python -m benchmarks.dns_cache_check
+"""
+import asyncio
+import socket
+import sys
+import time
+from typing import Dict, List
+
+from check_resources.dns_cache import DNSCache
+
+TTL = 0.4
+NEGATIVE_TTL = 0.2
+RESOLVE_DELAY = 0.05
+
+
+class CountingResolver:
+    """ Резолвер-заменитель: имена, начинающиеся с 'missing', не разрешаются. """
+
+    def __init__(self):
+        self.calls: Dict[str, int] = {}
+        self.version = 1
+
+    async def getaddrinfo(self, host: str, port: int, type: int = 0):
+        self.calls[host] = self.calls.get(host, 0) + 1
+        await asyncio.sleep(RESOLVE_DELAY)
+        if host.startswith('missing'):
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', (f"127.0.0.{self.version}", port))]
+
+
+async def check_dns_cache() -> List[str]:
+    errors = []
+    resolver = CountingResolver()
+    cache = DNSCache(
+        ttl=TTL, negative_ttl=NEGATIVE_TTL, max_size=3, refresh_ahead_ratio=0.5, getaddrinfo=resolver.getaddrinfo
+    )
+
+    def expect_calls(step: str, host: str, calls: int):
+        if resolver.calls.get(host, 0) != calls:
+            errors.append(f"{step}: обращений к резолверу {resolver.calls.get(host, 0)}, ожидалось {calls}")
+
+    async def resolve_failed(host: str) -> bool:
+        try:
+            await cache.resolve(host, 80)
+        except socket.gaierror:
+            return True
+        return False
+
+    try:
+        await asyncio.gather(*(cache.resolve('a.example', 80) for _ in range(10)))
+        expect_calls("одновременные промахи", 'a.example', 1)
+        await cache.resolve('a.example', 80)
+        expect_calls("попадание", 'a.example', 1)
+
+        if not all([await resolve_failed('missing.example'), await resolve_failed('missing.example')]):
+            errors.append("Неразрешаемое имя разрешилось")
+        expect_calls("отрицательная запись", 'missing.example', 1)
+        await asyncio.sleep(NEGATIVE_TTL * 1.5)
+        await resolve_failed('missing.example')
+        expect_calls("истечение отрицательной записи", 'missing.example', 2)
+
+        # После половины TTL обращение обновляет запись в фоне и не ждет резолвер
+        await cache.resolve('b.example', 80)
+        await asyncio.sleep(TTL * 0.6)
+        resolver.version = 2
+        start = time.perf_counter()
+        address = await cache.resolve('b.example', 80)
+        if time.perf_counter() - start > RESOLVE_DELAY / 2 or address[3][0] != '127.0.0.1':
+            errors.append(f"Обновление до истечения ждало резолвер или вернуло новый адрес: {address[3]}")
+        await asyncio.sleep(RESOLVE_DELAY * 2)
+        expect_calls("обновление до истечения", 'b.example', 2)
+        address = await cache.resolve('b.example', 80)
+        if address[3][0] != '127.0.0.2':
+            errors.append(f"После фонового обновления адрес {address[3][0]}, ожидался 127.0.0.2")
+
+        # Истечение TTL без обращений: промах
+        await asyncio.sleep(TTL * 1.2)
+        await cache.resolve('b.example', 80)
+        expect_calls("истечение TTL", 'b.example', 3)
+
+        for host in ('c.example', 'd.example', 'e.example'):
+            await cache.resolve(host, 80)
+        if len(cache) != 3:
+            errors.append(f"Записей кэша {len(cache)}, ожидалось не больше 3")
+        await cache.resolve('b.example', 80)
+        expect_calls("вытеснение", 'b.example', 4)
+    finally:
+        await cache.close()
+    return errors
+
+
+if __name__ == '__main__':
+    dns_errors = asyncio.run(check_dns_cache())
+    for dns_error in dns_errors:
+        print(dns_error)
+    print("Кэш имен: ошибок нет" if not dns_errors else f"Кэш имен: ошибок {len(dns_errors)}")
+    sys.exit(1 if dns_errors else 0)
@@ -0,0 +1,95 @@
+"""
+Проверка планов горячих запросов: завершится с ошибкой, если хотя бы один из них
+читает горячую таблицу последовательным сканированием.
+
+Запуск из папки src: python -m benchmarks.explain_check
+"""
+import asyncio
+import json
+import sys
+import uuid
+from datetime import timedelta
+from typing import Iterator, List, Tuple
+
+from sqlalchemy import select, func, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from app import settings
+from app.database import AsyncDBAdapter
+from check_resources.compaction import get_islands_query, get_last_intervals_query, get_checkpoints_query
+from check_resources.models import SwCoreResources
+from check_resources.partitions import PARTITIONED_TABLES
+
+# Таблицы, которые растут с количеством ресурсов и замеров
+HOT_TABLES = (
+    'sw_core_resources',
+    'sw_core_resource_availability_statistics',
+    'sw_core_resource_availability_compare',
+    'sw_core_compaction_checkpoint',
+)
+# Сколько ресурсов подставлять в запросы по пачке
+SAMPLE_RESOURCES_COUNT = 100
+
+
+class Explain(Executable, ClauseElement):
+    """ EXPLAIN (FORMAT JSON) для произвольного запроса SQLAlchemy (сам запрос не выполняется). """
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, 'postgresql')
+def _compile_explain(element, compiler, **kwargs):
+    return f"EXPLAIN (FORMAT JSON) {compiler.process(element.statement, **kwargs)}"
+
+
+def iter_plan_nodes(plan: dict) -> Iterator[dict]:
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from iter_plan_nodes(child)
+
+
+def get_hot_queries(resources: List) -> List[Tuple[str, object]]:
+    time_cutoff = func.now() - timedelta(seconds=settings.COMPACTION_DELAY_IN_SECONDS)
+    return [
+        ('active_resources', select(SwCoreResources).filter(SwCoreResources.is_active == True)),
+        ('compaction_islands', get_islands_query(resources, time_cutoff, settings.TIME_BUFFER_IN_SECONDS)),
+        ('compaction_checkpoints', get_checkpoints_query(resources)),
+        ('compaction_last_intervals', get_last_intervals_query(resources)),
+    ]
+
+
+def is_hot_relation(name: str) -> bool:
+    # Секции таблиц замеров называются <таблица>_p<период> и <таблица>_default
+    return name in HOT_TABLES or any(name.startswith(f"{table}_") for table in PARTITIONED_TABLES)
+
+
+async def check_query_plans() -> List[str]:
+    """ Вернет описания последовательных сканирований горячих таблиц (пустой список - все в порядке). """
+    errors = []
+    async with AsyncDBAdapter().get_session() as session:
+        query = await session.execute(select(SwCoreResources.id).limit(SAMPLE_RESOURCES_COUNT))
+        resources = list(query.scalars()) or [uuid.uuid4()]
+
+        # На маленьких таблицах планировщик выбирает seq scan и при наличии индекса.
+        # С выключенным seq scan он останется в плане, только если подходящего индекса нет.
+        await session.execute(text("SET LOCAL enable_seqscan = off"))
+        for name, statement in get_hot_queries(resources):
+            plan = (await session.execute(Explain(statement))).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            for node in iter_plan_nodes(plan[0]['Plan']):
+                if node['Node Type'] == 'Seq Scan' and is_hot_relation(node.get('Relation Name', '')):
+                    errors.append(f"{name}: Seq Scan on {node['Relation Name']}")
+        await session.rollback()
+    return errors
+
+
+if __name__ == '__main__':
+    plan_errors = asyncio.run(check_query_plans())
+    for plan_error in plan_errors:
+        print(plan_error)
+    print("Планы запросов: ошибок нет" if not plan_errors else f"Планы запросов: ошибок {len(plan_errors)}")
+    sys.exit(1 if plan_errors else 0)
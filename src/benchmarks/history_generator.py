@@ -0,0 +1,82 @@
+"""
+Детерминированный генератор сырой истории проверок: для одного и того же зерна всегда получается
+одна и та же история с кратковременными отказами (миганием), долгими отказами и пропусками сбора.
+"""
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterator, NamedTuple, Optional, Tuple
+
+# Параметры логнормального распределения задержки доступного ресурса (медиана около 20 мс)
+LATENCY_LOG_MEAN = 3.0
+LATENCY_LOG_SIGMA = 0.5
+# Разброс момента проверки относительно периода (доля периода в каждую сторону)
+PROBE_JITTER_RATIO = 0.1
+
+
+class HistoryConfig(NamedTuple):
+    seed: int
+    resources_count: int
+    start: datetime
+    end: datetime
+    # Период проверок (в секундах)
+    period: float = 5
+    # Вероятность на каждую проверку: кратковременный отказ, начало долгого отказа, начало пропуска сбора
+    flap_probability: float = 0.001
+    outage_probability: float = 0.0001
+    gap_probability: float = 0.00005
+    # Средняя длительность долгого отказа и пропуска сбора (в секундах)
+    outage_mean_seconds: float = 1800
+    gap_mean_seconds: float = 600
+
+
+def get_resource_id(config: HistoryConfig, resource_index: int) -> uuid.UUID:
+    return uuid.UUID(int=random.Random(f"{config.seed}-id-{resource_index}").getrandbits(128), version=4)
+
+
+def generate_resource_history(
+        config: HistoryConfig, resource_index: int
+) -> Iterator[Tuple[datetime, bool, Optional[float]]]:
+    """ Замеры ресурса по возрастанию времени: (момент, доступность, задержка в мс или None). """
+    rng = random.Random(f"{config.seed}-history-{resource_index}")
+    period_in_microseconds = int(config.period * 1_000_000)
+    jitter_in_microseconds = int(period_in_microseconds * PROBE_JITTER_RATIO)
+    moment = config.start + timedelta(microseconds=rng.randrange(period_in_microseconds))
+    outage_end = config.start
+
+    while moment < config.end:
+        roll = rng.random()
+        if roll < config.gap_probability:
+            moment += timedelta(microseconds=int(rng.expovariate(1 / config.gap_mean_seconds) * 1_000_000) + 1)
+            continue
+        if moment >= outage_end and roll < config.gap_probability + config.outage_probability:
+            outage_end = moment + timedelta(
+                microseconds=int(rng.expovariate(1 / config.outage_mean_seconds) * 1_000_000) + 1
+            )
+
+        is_available = moment >= outage_end and rng.random() >= config.flap_probability
+        latency = rng.lognormvariate(LATENCY_LOG_MEAN, LATENCY_LOG_SIGMA) if is_available else None
+        yield moment, is_available, latency
+        moment += timedelta(
+            microseconds=period_in_microseconds + rng.randint(-jitter_in_microseconds, jitter_in_microseconds)
+        )
+
+
+def generate_statistics_records(config: HistoryConfig, resource_index: int) -> Iterator[tuple]:
+    """
+    Строки SwCoreResourceAvailabilityStatistics для COPY в порядке колонок
+    (id, created_at, is_available, resource, min_latency, avg_latency, max_latency, failures_count).
+    """
+    resource = get_resource_id(config, resource_index)
+    rng = random.Random(f"{config.seed}-rows-{resource_index}")
+    for moment, is_available, latency in generate_resource_history(config, resource_index):
+        yield (
+            uuid.UUID(int=rng.getrandbits(128), version=4),
+            moment,
+            is_available,
+            resource,
+            latency,
+            latency,
+            latency,
+            0 if is_available else 1,
+        )
@@ -0,0 +1,180 @@
+"""
+Бенчмарк пропускной способности проверок на парке синтетических локальных ресурсов.
+Ресурсы SwCoreResources указывают на локальные TCP-сокеты с заданным поведением
+(accept, задержка accept, отказ, blackhole, мигание), замеряются get_measure_latency
+и availability_check_task_func: проверок в секунду, длительность цикла и ее хвосты,
+задержка отдельной проверки и процессорное время на проверку. Результаты пишутся в JSON.
+
+Запуск из папки src: python -m benchmarks.probe_throughput --targets 2000 --cycles 5
+По умолчанию используется бэкенд БД 'memory' (DB_BACKEND), чтобы замерять проверки, а не сервер БД.
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+from typing import List
+
+from benchmarks.results import get_distribution, print_results, write_results
+from benchmarks.stand_ins import SyntheticFleet
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--targets', type=int, default=2000, help='Количество синтетических ресурсов')
+    parser.add_argument('--cycles', type=int, default=5, help='Количество циклов проверок в каждом замере')
+    parser.add_argument('--refuse-ratio', type=float, default=0.05, help='Доля ресурсов с отказом подключения')
+    parser.add_argument('--blackhole-ratio', type=float, default=0.01, help='Доля ресурсов без ответа на SYN')
+    parser.add_argument('--flap-ratio', type=float, default=0.02, help='Доля мигающих ресурсов')
+    parser.add_argument('--accept-delay-ratio', type=float, default=0.0, help='Доля ресурсов с задержкой accept')
+    parser.add_argument('--accept-delay', type=float, default=0.05, help='Задержка accept (в секундах)')
+    parser.add_argument('--flap-period', type=float, default=10.0, help='Период мигания (в секундах)')
+    parser.add_argument('--jitter-ratio', type=float, default=0.0, help='PROBE_JITTER_RATIO планировщика')
+    parser.add_argument('--seed', type=int, default=0, help='Зерно распределения поведений')
+    parser.add_argument('--output', default=None, help='Файл результатов (по умолчанию - в data/benchmarks)')
+    return parser.parse_args()
+
+
+async def create_resources(fleet: SyntheticFleet):
+    """ Создаст схему и ресурсы SwCoreResources, указывающие на синтетические ресурсы. """
+    from app.database import AsyncDBAdapter
+    from check_resources.models import Base, SwCoreResources
+    from sqlalchemy import insert
+
+    await AsyncDBAdapter.create_schema(Base.metadata)
+    async with AsyncDBAdapter().get_session() as session:
+        await session.execute(insert(SwCoreResources).values([
+            {
+                'id': uuid.uuid4(),
+                'name': f"bench-{target.behavior}-{index}",
+                'description': 'benchmarks.probe_throughput',
+                'host': target.host,
+                'port': target.port,
+                'is_active': True,
+            }
+            for index, target in enumerate(fleet.targets)
+        ]))
+
+
+async def count_statistics_rows() -> int:
+    from app.database import AsyncDBAdapter
+    from check_resources.models import SwCoreResourceAvailabilityStatistics
+    from sqlalchemy import select, func
+
+    async with AsyncDBAdapter().get_session() as session:
+        return (await session.execute(select(func.count()).select_from(SwCoreResourceAvailabilityStatistics))).scalar()
+
+
+def get_summary(probes_count: int, cycle_durations: List[float], cpu_seconds: float) -> dict:
+    wall_seconds = sum(cycle_durations)
+    return {
+        'probes': probes_count,
+        'probes_per_second': probes_count / wall_seconds if wall_seconds else None,
+        'cycle_seconds': get_distribution(cycle_durations),
+        'cpu_seconds': cpu_seconds,
+        'cpu_per_probe_ms': 1000 * cpu_seconds / probes_count if probes_count else None,
+    }
+
+
+async def bench_measure_latency(main_module, apps: List, cycles: int) -> dict:
+    """ Циклы get_measure_latency по всем ресурсам без записи в БД. """
+    probe_latencies = []
+    cycle_durations = []
+    available_count = 0
+    cpu_started_at = time.process_time()
+
+    async def timed_probe(app):
+        started_at = time.perf_counter()
+        answer = await main_module.get_measure_latency(app=app)
+        probe_latencies.append(time.perf_counter() - started_at)
+        return answer
+
+    for _ in range(cycles):
+        started_at = time.perf_counter()
+        answers = await asyncio.gather(*(timed_probe(app) for app in apps))
+        cycle_durations.append(time.perf_counter() - started_at)
+        available_count += sum(1 for answer in answers if answer is not None and answer.is_available)
+
+    summary = get_summary(len(apps) * cycles, cycle_durations, time.process_time() - cpu_started_at)
+    summary['probe_seconds'] = get_distribution(probe_latencies)
+    summary['available_ratio'] = available_count / (len(apps) * cycles) if apps else None
+    return summary
+
+
+async def bench_availability_check_task(main_module, cycles: int) -> dict:
+    """ Полные циклы availability_check_task_func: планирование, проверки и запись результатов. """
+    cycle_durations = []
+    rows_before = await count_statistics_rows()
+    cpu_started_at = time.process_time()
+    for tick_index in range(cycles):
+        started_at = time.perf_counter()
+        await main_module.availability_check_task_func(tick_index)
+        cycle_durations.append(time.perf_counter() - started_at)
+    # Запись идет корутиной записи очереди, строки считаются после ее завершения
+    await main_module.WRITE_QUEUE.join()
+    cpu_seconds = time.process_time() - cpu_started_at
+    rows_written = await count_statistics_rows() - rows_before
+
+    summary = get_summary(rows_written, cycle_durations, cpu_seconds)
+    summary['rows_written'] = rows_written
+    return summary
+
+
+async def run_benchmark(arguments) -> dict:
+    fleet = SyntheticFleet(
+        count=arguments.targets,
+        refuse_ratio=arguments.refuse_ratio,
+        blackhole_ratio=arguments.blackhole_ratio,
+        flap_ratio=arguments.flap_ratio,
+        accept_delay_ratio=arguments.accept_delay_ratio,
+        accept_delay=arguments.accept_delay,
+        flap_period=arguments.flap_period,
+        seed=arguments.seed,
+    )
+    await fleet.start()
+    try:
+        await create_resources(fleet)
+        import main_v_2
+
+        main_v_2.init_services()
+        main_v_2.PROBE_PLANNER.jitter_ratio = arguments.jitter_ratio
+        apps = await main_v_2.get_active_apps()
+        if main_v_2.PROBE_WORKER_POOL is not None:
+            main_v_2.PROBE_WORKER_POOL.start()
+        main_v_2.WRITE_QUEUE.start()
+        try:
+            return {
+                'get_measure_latency': await bench_measure_latency(main_v_2, apps, arguments.cycles),
+                'availability_check_task_func': await bench_availability_check_task(main_v_2, arguments.cycles),
+            }
+        finally:
+            await main_v_2.WRITE_QUEUE.stop()
+            if main_v_2.PROBE_WORKER_POOL is not None:
+                main_v_2.PROBE_WORKER_POOL.stop()
+    finally:
+        await fleet.stop()
+
+
+def main():
+    arguments = get_arguments()
+    # Настройки читаются при импорте модулей приложения, поэтому бэкенд выбирается до импорта
+    os.environ.setdefault('DB_BACKEND', 'memory')
+    from app import settings
+
+    results = asyncio.run(run_benchmark(arguments))
+    config = {
+        **vars(arguments),
+        'db_backend': settings.DB_BACKEND,
+        'probe_timeout_in_seconds': settings.PROBE_TIMEOUT_IN_SECONDS,
+        'probe_concurrency_limit': settings.PROBE_CONCURRENCY_LIMIT,
+        'count_of_available_attempt': settings.COUNT_OF_AVAILABLE_ATTEMPT,
+        'probe_worker_processes': settings.PROBE_WORKER_PROCESSES,
+        'write_mode': settings.AVAILABILITY_STATISTICS_WRITE_MODE,
+    }
+    output = write_results('probe_throughput', config, results, arguments.output)
+    print_results('probe_throughput', results, ['probes', 'probes_per_second', 'cpu_per_probe_ms'])
+    print(f"Результаты: {output}")
+
+
+if __name__ == '__main__':
+    main()
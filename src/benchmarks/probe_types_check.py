@@ -0,0 +1,93 @@
+"""
+Проверка типов проверок ресурсов (check_resources.probes) на локальных серверах без БД:
+TCP, TLS (время рукопожатия и срок действия сертификата, который забывается при отказе TLS) и HTTP(S)
+с проверкой кода и тела ответа, переиспользованием keep-alive соединений между циклами (только при тех же
+параметрах TLS) и заменой соединения, закрытого сервером.
+Нужна утилита openssl (самоподписанный сертификат стенда). Завершится с ошибкой при расхождении.
+
+Запуск из папки src: python -m benchmarks.probe_types_check
+"""
+import asyncio
+import sys
+import tempfile
+from pathlib import Path
+from typing import List
+
+from benchmarks.stand_ins import KeepAliveHTTPServer, generate_self_signed_certificate
+from check_resources.probes import PROBE_HTTP, PROBE_TCP, PROBE_TLS, ProbeEngine
+
+CERTIFICATE_DAYS = 30
+CYCLES = 5
+ATTEMPTS = 2
+ROUTES = {
+    '/health': (200, b'{"status": "ok"}', False),
+    '/chunked': (200, b'status: ok, chunked', True),
+    '/broken': (503, b'maintenance', False),
+}
+
+
+async def check_probe_types(directory: Path) -> List[str]:
+    errors = []
+    certificate, key = generate_self_signed_certificate(directory, CERTIFICATE_DAYS)
+    http_server = KeepAliveHTTPServer(ROUTES, idle_timeout=0.3)
+    https_server = KeepAliveHTTPServer(ROUTES, certificate=certificate, key=key)
+    engine = ProbeEngine(timeout=2, attempts=ATTEMPTS)
+    await http_server.start()
+    await https_server.start()
+
+    async def expect(step: str, server: KeepAliveHTTPServer, probe_type: str, options: dict, is_available: bool):
+        points = await engine.measure('127.0.0.1', server.port, probe_type=probe_type, options=options)
+        if all(point is not None for point in points) != is_available:
+            errors.append(f"{step}: {points}, ожидалась {'доступность' if is_available else 'недоступность'}")
+
+    try:
+        await expect("tcp", http_server, PROBE_TCP, {}, True)
+        connections_before = http_server.connections_count
+        for _ in range(CYCLES):
+            await expect("http", http_server, PROBE_HTTP, {'path': '/health', 'body_match': r'"status": "ok"'}, True)
+        if http_server.connections_count - connections_before != 1:
+            errors.append(
+                f"http keep-alive: подключений {http_server.connections_count - connections_before} "
+                f"на {CYCLES * ATTEMPTS} запросов, ожидалось 1"
+            )
+        await expect("http chunked", http_server, PROBE_HTTP, {'path': '/chunked', 'body_match': 'chunked$'}, True)
+        await expect("http код ответа", http_server, PROBE_HTTP, {'path': '/broken'}, False)
+        await expect("http ожидаемый код", http_server, PROBE_HTTP, {'path': '/broken', 'expected_status': 503}, True)
+        await expect("http тело ответа", http_server, PROBE_HTTP, {'path': '/health', 'body_match': 'down'}, False)
+        await expect("http неизвестный путь", http_server, PROBE_HTTP, {'path': '/missing'}, False)
+        # Сервер закрывает простаивающие соединения: проверка должна пройти через новое
+        await asyncio.sleep(http_server.idle_timeout * 2)
+        await expect("http после закрытия сервером", http_server, PROBE_HTTP, {'path': '/health'}, True)
+
+        tls_options = {'server_name': 'localhost', 'ca_file': str(certificate)}
+        await expect("tls", https_server, PROBE_TLS, tls_options, True)
+        await expect("tls без доверия к сертификату", https_server, PROBE_TLS, {'server_name': 'localhost'}, False)
+        if engine.get_cert_expires_in_days('127.0.0.1', https_server.port) is not None:
+            errors.append("Срок действия сертификата сообщается после отказа TLS")
+        await expect("tls без проверки", https_server, PROBE_TLS, {'verify': False}, True)
+        cert_days = engine.get_cert_expires_in_days('127.0.0.1', https_server.port)
+        if cert_days is None or abs(cert_days - CERTIFICATE_DAYS) > 1:
+            errors.append(f"Срок действия сертификата: {cert_days} дней, ожидалось {CERTIFICATE_DAYS}")
+        connections_before = https_server.connections_count
+        for _ in range(CYCLES):
+            await expect("https", https_server, PROBE_HTTP, {'tls': True, 'path': '/health', **tls_options}, True)
+        if https_server.connections_count - connections_before != 1:
+            errors.append(f"https keep-alive: подключений {https_server.connections_count - connections_before}")
+        # Соединение, проверенное с ca_file, не должно достаться проверке без доверия к сертификату
+        await expect("https без доверия к сертификату", https_server, PROBE_HTTP, {
+            'tls': True, 'path': '/health', 'server_name': 'localhost',
+        }, False)
+    finally:
+        await engine.close()
+        await http_server.stop()
+        await https_server.stop()
+    return errors
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        probe_errors = asyncio.run(check_probe_types(Path(temporary_directory)))
+    for probe_error in probe_errors:
+        print(probe_error)
+    print("Типы проверок: ошибок нет" if not probe_errors else f"Типы проверок: ошибок {len(probe_errors)}")
+    sys.exit(1 if probe_errors else 0)
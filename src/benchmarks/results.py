@@ -0,0 +1,69 @@
+"""
+Общие функции бенчмарков: статистика замеров и запись результатов в JSON для отслеживания регрессий.
+"""
+import json
+import os
+import platform
+import sys
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+# Папка результатов бенчмарков (относительно папки src)
+RESULTS_DIR = os.path.join('..', 'data', 'benchmarks')
+
+
+def get_percentile(values: Sequence[float], percent: float) -> Optional[float]:
+    """ Перцентиль методом ближайшего ранга (None для пустой выборки). """
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, -(-len(ordered) * percent // 100) - 1))
+    return ordered[int(index)]
+
+
+def get_distribution(values: Sequence[float]) -> Dict[str, Optional[float]]:
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values) if values else None,
+        'p50': get_percentile(values, 50),
+        'p95': get_percentile(values, 95),
+        'p99': get_percentile(values, 99),
+        'max': max(values) if values else None,
+    }
+
+
+def get_environment() -> dict:
+    return {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def write_results(name: str, config: dict, results: dict, output: Optional[str] = None) -> str:
+    """
+    Запишет результаты бенчмарка в JSON. По умолчанию - новый файл с отметкой времени
+    в RESULTS_DIR, чтобы запуски можно было сравнивать между собой.
+    :return: Путь к файлу результатов
+    """
+    started_at = datetime.now(timezone.utc)
+    if output is None:
+        output = os.path.join(RESULTS_DIR, f"{name}-{started_at.strftime('%Y%m%dT%H%M%SZ')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump({
+            'benchmark': name,
+            'created_at': started_at.isoformat(),
+            'environment': get_environment(),
+            'config': config,
+            'results': results,
+        }, file, ensure_ascii=False, indent=2, default=str)
+    return output
+
+
+def print_results(name: str, results: Dict[str, dict], columns: List[str]):
+    print(name)
+    for case_name, case_results in results.items():
+        values = ', '.join(f"{column}={case_results.get(column)}" for column in columns)
+        print(f"  {case_name}: {values}")
@@ -0,0 +1,368 @@
+"""
+Локальные заменители внешних систем для бенчмарков и проверок: парк синтетических TCP-ресурсов,
+SMTP-сервер, который сохраняет принятые письма в памяти, и HTTP(S)-сервер с keep-alive.
+"""
+import asyncio
+import email
+import email.policy
+import random
+import resource
+import socket
+import ssl
+import subprocess
+from email.message import EmailMessage
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Поведение синтетического ресурса
+BEHAVIOR_ACCEPT = 'accept'
+BEHAVIOR_ACCEPT_DELAY = 'accept_delay'
+BEHAVIOR_REFUSE = 'refuse'
+BEHAVIOR_BLACKHOLE = 'blackhole'
+BEHAVIOR_FLAP = 'flap'
+BEHAVIORS = (BEHAVIOR_ACCEPT, BEHAVIOR_ACCEPT_DELAY, BEHAVIOR_REFUSE, BEHAVIOR_BLACKHOLE, BEHAVIOR_FLAP)
+
+# Очередь accept ресурса с задержкой accept: при ее переполнении ядро отбрасывает SYN и connect ждет повтора
+ACCEPT_DELAY_BACKLOG = 8
+# Сколько ждать подключения, заполняющего очередь blackhole-ресурса (в секундах)
+BLACKHOLE_FILL_TIMEOUT_IN_SECONDS = 0.2
+
+
+def raise_open_files_limit(required: int):
+    """ Поднимет мягкий лимит открытых файлов (до жесткого), чтобы хватило на тысячи сокетов. """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < required:
+        limit = required if hard == resource.RLIM_INFINITY else min(required, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+
+
+class SyntheticTarget:
+    """
+    Синтетический TCP-ресурс на неблокирующем сокете в цикле событий:
+    accept - принимает и сразу закрывает подключения;
+    accept_delay - принимает подключения с задержкой accept_delay (connect замедляется при переполнении очереди);
+    refuse - порт занят, но не слушается (ECONNREFUSED);
+    blackhole - очередь accept заполнена и не разбирается, новые SYN отбрасываются (connect до таймаута);
+    flap - каждые flap_period секунд переключается между accept и refuse.
+    """
+
+    def __init__(
+            self,
+            behavior: str = BEHAVIOR_ACCEPT,
+            host: str = '127.0.0.1',
+            accept_delay: float = 0.0,
+            flap_period: float = 10.0,
+    ):
+        if behavior not in BEHAVIORS:
+            raise ValueError(f"Неизвестное поведение ресурса: {behavior}")
+        self.behavior = behavior
+        self.host = host
+        self.accept_delay = accept_delay
+        self.flap_period = flap_period
+        self.port: Optional[int] = None
+        self.is_listening = False
+        self._socket: Optional[socket.socket] = None
+        self._fillers: List[socket.socket] = []
+        self._flap_task: Optional[asyncio.Task] = None
+
+    def _bind(self):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.setblocking(False)
+        self._socket.bind((self.host, self.port or 0))
+        self.port = self._socket.getsockname()[1]
+
+    def _listen(self, backlog: int = 128):
+        self._socket.listen(backlog)
+        self.is_listening = True
+        asyncio.get_running_loop().add_reader(self._socket.fileno(), self._on_readable)
+
+    def _close(self):
+        if self._socket is None:
+            return
+        if self.is_listening:
+            asyncio.get_running_loop().remove_reader(self._socket.fileno())
+        self._socket.close()
+        self._socket = None
+        self.is_listening = False
+
+    def _accept_all(self):
+        while self._socket is not None:
+            try:
+                connection, _ = self._socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            connection.close()
+
+    def _on_readable(self):
+        if self.behavior != BEHAVIOR_ACCEPT_DELAY:
+            self._accept_all()
+            return
+        # Очередь не разбирается до истечения задержки
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(self._socket.fileno())
+        loop.call_later(self.accept_delay, self._accept_delayed)
+
+    def _accept_delayed(self):
+        if self._socket is None:
+            return
+        self._accept_all()
+        asyncio.get_running_loop().add_reader(self._socket.fileno(), self._on_readable)
+
+    async def _fill_backlog(self):
+        """ Заполнит очередь accept так, чтобы следующие SYN отбрасывались. """
+        loop = asyncio.get_running_loop()
+        while True:
+            filler = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            filler.setblocking(False)
+            try:
+                await asyncio.wait_for(
+                    loop.sock_connect(filler, (self.host, self.port)), timeout=BLACKHOLE_FILL_TIMEOUT_IN_SECONDS
+                )
+            except (OSError, asyncio.TimeoutError):
+                filler.close()
+                return
+            self._fillers.append(filler)
+
+    async def _flap(self):
+        # Случайная фаза, чтобы ресурсы не переключались одновременно
+        await asyncio.sleep(random.uniform(0, self.flap_period))
+        while True:
+            if self.is_listening:
+                self._close()
+                self._bind()
+            else:
+                self._listen()
+            await asyncio.sleep(self.flap_period)
+
+    async def start(self):
+        self._bind()
+        if self.behavior in (BEHAVIOR_ACCEPT, BEHAVIOR_FLAP):
+            self._listen()
+        elif self.behavior == BEHAVIOR_ACCEPT_DELAY:
+            self._listen(ACCEPT_DELAY_BACKLOG)
+        elif self.behavior == BEHAVIOR_BLACKHOLE:
+            self._socket.listen(0)
+            await self._fill_backlog()
+        if self.behavior == BEHAVIOR_FLAP:
+            self._flap_task = asyncio.create_task(self._flap())
+
+    async def stop(self):
+        if self._flap_task is not None:
+            self._flap_task.cancel()
+        for filler in self._fillers:
+            filler.close()
+        self._fillers = []
+        self._close()
+
+
+class SyntheticFleet:
+    """ Парк синтетических ресурсов с заданными долями поведений (остальные - accept). """
+
+    def __init__(
+            self,
+            count: int,
+            refuse_ratio: float = 0.0,
+            blackhole_ratio: float = 0.0,
+            flap_ratio: float = 0.0,
+            accept_delay_ratio: float = 0.0,
+            accept_delay: float = 0.05,
+            flap_period: float = 10.0,
+            seed: int = 0,
+    ):
+        behaviors = []
+        for behavior, ratio in (
+                (BEHAVIOR_REFUSE, refuse_ratio),
+                (BEHAVIOR_BLACKHOLE, blackhole_ratio),
+                (BEHAVIOR_FLAP, flap_ratio),
+                (BEHAVIOR_ACCEPT_DELAY, accept_delay_ratio),
+        ):
+            behaviors += [behavior] * round(count * ratio)
+        behaviors += [BEHAVIOR_ACCEPT] * max(0, count - len(behaviors))
+        random.Random(seed).shuffle(behaviors)
+        self.targets = [
+            SyntheticTarget(behavior, accept_delay=accept_delay, flap_period=flap_period)
+            for behavior in behaviors[:count]
+        ]
+
+    def get_behavior_counts(self) -> dict:
+        counts = {}
+        for target in self.targets:
+            counts[target.behavior] = counts.get(target.behavior, 0) + 1
+        return counts
+
+    async def start(self):
+        # Сокет ресурса, сокеты проверок и заполнители очередей
+        raise_open_files_limit(len(self.targets) * 4 + 1024)
+        await asyncio.gather(*(target.start() for target in self.targets))
+
+    async def stop(self):
+        for target in self.targets:
+            await target.stop()
+
+
+class LocalSMTPServer:
+    """
+    Минимальный SMTP-сервер (HELO/EHLO, MAIL, RCPT, DATA, RSET, NOOP, QUIT) без авторизации и TLS.
+    Принятые письма попадают в messages, количество подключений - в connections_count.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.host = host
+        self.port = port
+        self.messages: List[EmailMessage] = []
+        self.connections_count = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def _read_data(self, reader: asyncio.StreamReader) -> bytes:
+        lines = []
+        while True:
+            line = await reader.readline()
+            if not line or line in (b'.\r\n', b'.\n'):
+                break
+            # Точка в начале строки удваивается отправителем
+            lines.append(line[1:] if line.startswith(b'..') else line)
+        return b''.join(lines)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections_count += 1
+        writer.write(b'220 localhost stand-in ESMTP\r\n')
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode('latin-1').strip().split(' ', 1)[0].upper()
+                if command == 'EHLO':
+                    writer.write(b'250-localhost\r\n250 8BITMIME\r\n')
+                elif command in ('HELO', 'MAIL', 'RCPT', 'RSET', 'NOOP'):
+                    writer.write(b'250 OK\r\n')
+                elif command == 'DATA':
+                    writer.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+                    await writer.drain()
+                    data = await self._read_data(reader)
+                    self.messages.append(email.message_from_bytes(data, policy=email.policy.default))
+                    writer.write(b'250 OK\r\n')
+                elif command == 'QUIT':
+                    writer.write(b'221 Bye\r\n')
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(b'502 Command not implemented\r\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+
+def generate_self_signed_certificate(directory: Path, days: int) -> Tuple[Path, Path]:
+    """ Самоподписанный сертификат localhost/127.0.0.1 сроком days дней (нужна утилита openssl). """
+    certificate, key = directory / 'stand_in.crt', directory / 'stand_in.key'
+    subprocess.run(
+        [
+            'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', str(days),
+            '-keyout', str(key), '-out', str(certificate), '-subj', '/CN=localhost',
+            '-addext', 'subjectAltName=DNS:localhost,IP:127.0.0.1',
+        ],
+        check=True, capture_output=True,
+    )
+    return certificate, key
+
+
+class KeepAliveHTTPServer:
+    """
+    Минимальный HTTP/1.1-сервер с keep-alive и, если заданы сертификат и ключ, TLS.
+    routes - ответы по пути: (код, тело, chunked), на остальные пути - 404. Соединение закрывается
+    после idle_timeout секунд простоя или по заголовку Connection: close в запросе.
+    Количество подключений - в connections_count, запросов - в requests_count.
+    """
+
+    def __init__(
+            self,
+            routes: Dict[str, Tuple[int, bytes, bool]],
+            host: str = '127.0.0.1',
+            port: int = 0,
+            certificate: Optional[Path] = None,
+            key: Optional[Path] = None,
+            idle_timeout: float = 60.0,
+    ):
+        self.routes = routes
+        self.host = host
+        self.port = port
+        self.idle_timeout = idle_timeout
+        self.connections_count = 0
+        self.requests_count = 0
+        self._context: Optional[ssl.SSLContext] = None
+        if certificate is not None:
+            self._context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            self._context.load_cert_chain(certificate, key)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._handlers = set()
+
+    @staticmethod
+    def _get_response(status: int, body: bytes, is_chunked: bool, is_closing: bool) -> bytes:
+        headers = [f"HTTP/1.1 {status} Stand-in", 'Content-Type: text/plain']
+        if is_chunked:
+            headers.append('Transfer-Encoding: chunked')
+            middle = len(body) // 2
+            chunks = [part for part in (body[:middle], body[middle:]) if part]
+            body = b''.join(b'%x\r\n%s\r\n' % (len(chunk), chunk) for chunk in chunks) + b'0\r\n\r\n'
+        else:
+            headers.append(f"Content-Length: {len(body)}")
+        if is_closing:
+            headers.append('Connection: close')
+        return ('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1') + body
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections_count += 1
+        self._handlers.add((asyncio.current_task(), writer))
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), timeout=self.idle_timeout)
+                if not request_line:
+                    break
+                is_closing = False
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    if line.lower().startswith(b'connection:') and b'close' in line.lower():
+                        is_closing = True
+                self.requests_count += 1
+                path = request_line.split()[1].decode('latin-1')
+                status, body, is_chunked = self.routes.get(path, (404, b'not found', False))
+                writer.write(self._get_response(status, body, is_chunked, is_closing))
+                await writer.drain()
+                if is_closing:
+                    break
+        except (asyncio.TimeoutError, ConnectionError, IndexError):
+            pass
+        finally:
+            self._handlers.discard((asyncio.current_task(), writer))
+            writer.close()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, ssl=self._context)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # Открытые keep-alive соединения закрываются, обработчики завершаются до остановки цикла событий
+            handlers = list(self._handlers)
+            for _, writer in handlers:
+                writer.close()
+            await asyncio.gather(*(handler for handler, _ in handlers), return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
@@ -0,0 +1,159 @@
+"""
+Проверка записи результатов большими пачками на бэкенде БД 'memory': полные пачки очереди записи
+(WRITE_QUEUE_BATCH_SIZE) и перенос большого сегмента спула должны записываться запросами не больше
+MAX_QUERY_PARAMETERS параметров, иначе на PostgreSQL (asyncpg) каждая полная пачка отклоняется и бесконечно
+повторяется. Ошибка запроса при записи через спул не должна переводить спул в режим недоступной БД,
+сегмент спула с такой ошибкой после нескольких попыток переноса откладывается в failed,
+а результат, запись которого отклоняется запросом, должен отбрасываться очередью, не останавливая запись остальных.
+SQLite допускает больше параметров, поэтому количество параметров каждого запроса считается отдельно.
+Завершится с ошибкой при расхождении.
+
+Запуск из папки src: python -m benchmarks.write_limits_check
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+# Пачек очереди записи в проверке
+BATCHES_COUNT = 3
+
+
+async def check_write_limits() -> List[str]:
+    from sqlalchemy import event, func, select
+    from sqlalchemy.exc import DBAPIError, IntegrityError
+
+    from app import settings
+    from app.database import MAX_QUERY_PARAMETERS, AsyncDBAdapter, async_engine
+    from check_resources.models import SwCoreResourceAvailabilityStatistics, SwCoreResources
+    from check_resources.probes import AvailableAnswer
+    from check_resources.spool import ResultSpool
+    from check_resources.statistics_writer import get_statistics_rows, write_statistics_rows
+    from check_resources.write_behind import WriteBehindQueue
+
+    errors = []
+    parameters_counts = []
+
+    def count_parameters(connection, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            parameters_counts.append(len(parameters))
+
+    event.listen(async_engine.sync_engine, 'before_cursor_execute', count_parameters)
+    await AsyncDBAdapter().create_schema(SwCoreResources.metadata)
+    resource = uuid.uuid4()
+    async with AsyncDBAdapter().get_session() as session:
+        session.add(SwCoreResources(id=resource, name='write limits', host='localhost', port=1, is_active=False))
+
+    async def write(answers):
+        async with AsyncDBAdapter().get_session() as session:
+            await write_statistics_rows(session, get_statistics_rows(answers))
+
+    queue = WriteBehindQueue(write=write, max_size=settings.WRITE_QUEUE_BATCH_SIZE * BATCHES_COUNT)
+    start = datetime.now(timezone.utc)
+    answers = [
+        AvailableAnswer(resource, 'write limits', True, 1.0, 1.0, 1.0, 0, start + timedelta(milliseconds=number))
+        for number in range(settings.WRITE_QUEUE_BATCH_SIZE * BATCHES_COUNT)
+    ]
+    queue.start()
+    try:
+        await queue.put(answers)
+        await asyncio.wait_for(queue.join(), timeout=60)
+    except asyncio.TimeoutError:
+        errors.append("Очередь записи не записала полные пачки за 60 секунд")
+    finally:
+        await queue.stop(timeout=1)
+
+    # Результат ресурса, удаленного, пока результат ждал в очереди: запрос с ним отклоняется всегда
+    rejected = AvailableAnswer(uuid.uuid4(), 'deleted', True, 1.0, 1.0, 1.0, 0, start - timedelta(hours=1))
+
+    async def write_with_rejected(batch):
+        if rejected in batch:
+            raise IntegrityError('INSERT', {}, Exception('violates foreign key constraint'))
+        await write(batch)
+
+    queue = WriteBehindQueue(write=write_with_rejected, flush_interval=0.01)
+    queued_at = start - timedelta(hours=2)
+    poisoned = [
+        AvailableAnswer(resource, 'write limits', True, 1.0, 1.0, 1.0, 0, queued_at - timedelta(milliseconds=offset))
+        for offset in range(BATCHES_COUNT * 100)
+    ]
+    poisoned.insert(len(poisoned) // 2, rejected)
+    queue.start()
+    try:
+        await queue.put(poisoned)
+        await asyncio.wait_for(queue.join(), timeout=60)
+    except asyncio.TimeoutError:
+        errors.append("Результат с ошибкой запроса остановил очередь записи")
+    finally:
+        await queue.stop(timeout=1)
+    if queue.dead_letters != 1:
+        errors.append(f"Отброшено результатов {queue.dead_letters}, ожидался 1")
+
+    async def write_rows(rows, **kwargs):
+        async with AsyncDBAdapter().get_session() as session:
+            await write_statistics_rows(session, rows, **kwargs)
+
+    async def fail_statement(rows):
+        raise DBAPIError('INSERT', {}, Exception('the number of query arguments cannot exceed 32767'))
+
+    spooled = [
+        AvailableAnswer(resource, 'write limits', False, None, None, None, 1, start - timedelta(milliseconds=number))
+        for number in range(1, settings.WRITE_SPOOL_REPLAY_BATCH_SIZE * BATCHES_COUNT + 1)
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        spool = ResultSpool(
+            write_rows=fail_statement,
+            replay_rows=lambda rows: write_rows(rows, mode='insert_ignore'),
+            directory=Path(directory),
+        )
+        try:
+            await spool.write(get_statistics_rows(spooled[:1]))
+            errors.append("Ошибка запроса при записи через спул не проброшена")
+        except DBAPIError:
+            pass
+        if not spool.is_db_available() or spool.pending_bytes:
+            errors.append("Ошибка запроса перевела спул в режим недоступной БД")
+        await spool.append(get_statistics_rows(spooled))
+        replayed = await spool.replay()
+        await spool.stop()
+
+        # Сегмент, перенос которого всегда отклоняется запросом, не должен бесконечно держать отсечку компоновки
+        rejecting = ResultSpool(
+            write_rows=fail_statement, replay_rows=fail_statement, directory=Path(directory), max_replay_failures=2,
+        )
+        await rejecting.append(get_statistics_rows(spooled[:1]))
+        for _ in range(rejecting.max_replay_failures):
+            await rejecting.replay()
+        await rejecting.stop()
+        if rejecting.get_unwritten_since() is not None or not list(Path(directory).glob("failed/*")):
+            errors.append("Отклоняемый сегмент спула не отложен в failed и держит отсечку компоновки")
+    if replayed != len(spooled):
+        errors.append(f"Из спула перенесено {replayed} строк, ожидалось {len(spooled)}")
+
+    async with AsyncDBAdapter().get_session() as session:
+        query = select(func.count()).select_from(SwCoreResourceAvailabilityStatistics)
+        written = (await session.execute(query)).scalar()
+    expected = len(answers) + len(poisoned) - 1 + len(spooled)
+    if written != expected:
+        errors.append(f"Записано строк {written}, ожидалось {expected}")
+    if max(parameters_counts, default=0) > MAX_QUERY_PARAMETERS:
+        errors.append(f"Запрос с {max(parameters_counts)} параметрами (предел {MAX_QUERY_PARAMETERS})")
+    return errors
+
+
+def main():
+    # Настройки читаются при импорте модулей приложения, поэтому бэкенд выбирается до импорта
+    os.environ['DB_BACKEND'] = 'memory'
+    limit_errors = asyncio.run(check_write_limits())
+    for limit_error in limit_errors:
+        print(limit_error)
+    print("Запись большими пачками: " + (f"ошибок {len(limit_errors)}" if limit_errors else "ошибок нет"))
+    sys.exit(1 if limit_errors else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from email.message import EmailMessage
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from app import settings
+from app.services.logger import SWCoreLogger
+from app.services.mailer import SMTPConnectionPool
+from app.services.metrics import METRICS
+
+LOGGER = SWCoreLogger().get_logger()
+
+ALERTS = METRICS.counter('sw_core_alerts_total', 'Оповещения о смене доступности', ['kind', 'delivery'])
+
+ALERT_DOWN = 'down'
+ALERT_RECOVERED = 'recovered'
+
+
+class AlertEvent(NamedTuple):
+    kind: str
+    resource: uuid.UUID
+    # Инцидент - интервал недоступности (идентификатор интервала SwCoreResourceAvailabilityCompare)
+    incident: uuid.UUID
+    # Начало отказа
+    time_from: datetime
+    # Для ALERT_RECOVERED - начало доступности
+    time_to: Optional[datetime] = None
+    # Неудачных попыток отправки
+    attempts: int = 0
+
+
+def describe_resource(resource: uuid.UUID, apps: Dict) -> str:
+    app = apps.get(resource)
+    if app is None:
+        return str(resource)
+    return f"{app.name} ({app.host}:{app.port})"
+
+
+def describe_event(event: AlertEvent, apps: Dict) -> str:
+    resource = describe_resource(event.resource, apps)
+    if event.kind == ALERT_DOWN:
+        return f"{resource} недоступен с {event.time_from.isoformat()}"
+    outage_seconds = (event.time_to - event.time_from).total_seconds()
+    return f"{resource} снова доступен с {event.time_to.isoformat()} (отказ {outage_seconds:0.0f} секунд)"
+
+
+class AlertManager:
+    """
+    Оповещения о смене доступности по интервалам пачки после компоновки (CompactionEngine.on_batch_committed).
+    Отказ - интервал недоступности (открытый или закрытый внутри пачки) длительностью не меньше
+    min_outage_in_seconds, восстановление - доступный интервал после отказа, о котором было оповещение.
+    Дедупликация: по инциденту (интервалу) - не больше одного оповещения, по ресурсу - не больше одного
+    оповещения об отказе за cooldown_in_seconds.
+    События копятся в pending и отправляются dispatch: если событий одного вида не меньше digest_threshold,
+    уходит одно письмо-сводка вместо отдельных писем. События неотправленных писем отправляются повторно.
+    Состояние хранится в памяти: после перезапуска об уже идущем отказе оповещение придет еще раз.
+    """
+
+    def __init__(
+            self,
+            mailer: SMTPConnectionPool,
+            recipients: Sequence[str] = settings.ALERTING_RECIPIENTS,
+            sender: str = settings.EMAIL_FOR_SEND,
+            digest_threshold: int = settings.ALERTING_DIGEST_THRESHOLD,
+            min_outage_in_seconds: float = settings.ALERTING_MIN_OUTAGE_IN_SECONDS,
+            cooldown_in_seconds: float = settings.ALERTING_RESOURCE_COOLDOWN_IN_SECONDS,
+            max_incidents: int = settings.ALERTING_MAX_INCIDENTS,
+            max_send_attempts: int = settings.ALERTING_MAX_SEND_ATTEMPTS,
+    ):
+        self.mailer = mailer
+        self.recipients = list(recipients)
+        self.sender = sender
+        self.digest_threshold = digest_threshold
+        self.min_outage_in_seconds = min_outage_in_seconds
+        self.cooldown_in_seconds = cooldown_in_seconds
+        self.max_incidents = max_incidents
+        self.max_send_attempts = max_send_attempts
+        self.pending: List[AlertEvent] = []
+        # Обработанные инциденты (по порядку появления, старые вытесняются)
+        self._incidents: OrderedDict = OrderedDict()
+        # Отказ ресурса, о котором было оповещение и еще не было восстановления
+        self._open_incidents: Dict[uuid.UUID, AlertEvent] = {}
+        self._last_alert_at: Dict[uuid.UUID, float] = {}
+
+    def _remember(self, incident: uuid.UUID):
+        self._incidents[incident] = None
+        while len(self._incidents) > self.max_incidents:
+            self._incidents.popitem(last=False)
+
+    def observe(self, open_intervals: Dict, intervals: Optional[List[dict]] = None):
+        """
+        Проверит интервалы пачки компоновки (синхронно, без обращений к сети).
+        :param open_intervals: Новые открытые интервалы ресурсов
+        :param intervals: Все строки интервалов пачки: отказ, начавшийся и закончившийся между запусками
+        компоновки (например, после переноса спула), есть только среди закрытых. Без них - только открытые
+        """
+        if intervals is None:
+            intervals = [
+                {
+                    'id': interval.id, 'time_from': interval.time_from, 'time_to': interval.time_to,
+                    'is_available': interval.is_available, 'resource': resource,
+                }
+                for resource, interval in open_intervals.items()
+            ]
+        now = time.monotonic()
+        # По каждому ресурсу интервалы по порядку: восстановление относится к отказу перед ним
+        for interval in sorted(intervals, key=lambda row: row['time_from']):
+            self._observe_interval(interval, now)
+
+    def _observe_interval(self, interval: dict, now: float):
+        resource = interval['resource']
+        if interval['is_available']:
+            incident = self._open_incidents.pop(resource, None)
+            if incident is not None:
+                self.pending.append(incident._replace(kind=ALERT_RECOVERED, time_to=interval['time_from']))
+            return
+
+        if interval['id'] in self._incidents:
+            return
+        if (interval['time_to'] - interval['time_from']).total_seconds() < self.min_outage_in_seconds:
+            # Открытый интервал еще может продлиться до минимальной длительности отказа, закрытый - короткий сбой
+            return
+        self._remember(interval['id'])
+        last_alert_at = self._last_alert_at.get(resource)
+        if last_alert_at is not None and now - last_alert_at < self.cooldown_in_seconds:
+            ALERTS.inc(1, (ALERT_DOWN, 'suppressed'))
+            return
+        self._last_alert_at[resource] = now
+        event = AlertEvent(
+            kind=ALERT_DOWN, resource=resource, incident=interval['id'], time_from=interval['time_from'],
+        )
+        self._open_incidents[resource] = event
+        self.pending.append(event)
+
+    def forget(self, active_resources: set):
+        """ Сбросит состояние ресурсов, которых больше нет среди активных. """
+        for resource in [resource for resource in self._last_alert_at if resource not in active_resources]:
+            del self._last_alert_at[resource]
+            self._open_incidents.pop(resource, None)
+
+    def _get_message(self, subject: str, lines: List[str]) -> EmailMessage:
+        message = EmailMessage()
+        message['Subject'] = subject
+        message['From'] = self.sender
+        message['To'] = ', '.join(self.recipients)
+        message.set_content('\n'.join(lines) + '\n')
+        return message
+
+    def get_messages(
+            self, events: List[AlertEvent], apps: Dict,
+    ) -> List[Tuple[EmailMessage, str, List[AlertEvent]]]:
+        """ Письма с видом доставки (отдельное письмо или сводка) и событиями каждого письма. """
+        messages = []
+        for kind, title in ((ALERT_DOWN, 'Недоступно ресурсов'), (ALERT_RECOVERED, 'Восстановлено ресурсов')):
+            kind_events = [event for event in events if event.kind == kind]
+            if len(kind_events) >= self.digest_threshold:
+                messages.append((self._get_message(
+                    f"[sw-core] {title}: {len(kind_events)}",
+                    [describe_event(event, apps) for event in kind_events],
+                ), 'digest', kind_events))
+                continue
+            for event in kind_events:
+                state = 'недоступен' if kind == ALERT_DOWN else 'снова доступен'
+                messages.append((self._get_message(
+                    f"[sw-core] Ресурс {describe_resource(event.resource, apps)} {state}",
+                    [describe_event(event, apps)],
+                ), 'single', [event]))
+        return messages
+
+    async def dispatch(self, apps: Dict):
+        """
+        Отправит накопленные события. Выполняется фоновой задачей, чтобы отправка не задерживала компоновку.
+        События неотправленных писем возвращаются в начало pending и уходят при следующей отправке
+        (не больше max_send_attempts попыток).
+        :param apps: Ресурсы по идентификатору (для имен в письмах)
+        """
+        events, self.pending = self.pending, []
+        if not events or not self.recipients:
+            return
+        messages = self.get_messages(events, apps)
+        results = await asyncio.gather(
+            *(self.mailer.send(message) for message, _, _ in messages), return_exceptions=True
+        )
+        errors = []
+        retry = []
+        for (_, delivery, message_events), result in zip(messages, results):
+            if not isinstance(result, Exception):
+                for kind in (ALERT_DOWN, ALERT_RECOVERED):
+                    ALERTS.inc(sum(event.kind == kind for event in message_events), (kind, delivery))
+                continue
+            errors.append(result)
+            for event in message_events:
+                if event.attempts + 1 < self.max_send_attempts:
+                    retry.append(event._replace(attempts=event.attempts + 1))
+                else:
+                    ALERTS.inc(1, (event.kind, 'dropped'))
+        if errors:
+            self.pending = retry + self.pending
+            LOGGER.error(
+                "Не отправлено оповещений %s из %s, событий на повтор %s: %r",
+                len(errors), len(messages), len(retry), errors[0],
+                extra={'error_type': type(errors[0]).__name__},
+            )
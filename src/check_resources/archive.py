@@ -0,0 +1,269 @@
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import and_, delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import settings
+from app.database import AsyncDBAdapter
+from app.services.logger import SWCoreLogger
+from app.services.metrics import METRICS
+from check_resources.models import SwCoreCompactionCheckpoint, SwCoreResourceAvailabilityCompare
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+LOGGER = SWCoreLogger().get_logger()
+
+ARCHIVED_INTERVALS = METRICS.counter('sw_core_archived_intervals_total', 'Интервалов, перенесенных в архив')
+ARCHIVE_SECONDS = METRICS.histogram('sw_core_archive_seconds', 'Длительность переноса интервалов в архив')
+
+# Колонки архива ресурса: начало и конец интервалов (микросекунды от эпохи, int64 little-endian)
+# и доступность интервалов (по биту на интервал, numpy.packbits)
+TIME_FROM_FILE = 'time_from.i8'
+TIME_TO_FILE = 'time_to.i8'
+STATE_FILE = 'state.bits'
+EPOCH_DTYPE = '<i8'
+EPOCH_SIZE = 8
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def to_epoch(moment: datetime) -> int:
+    """ Микросекунды от эпохи; время без часового пояса (SQLite) считается UTC. """
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return (moment - EPOCH) // MICROSECOND
+
+
+class ArchiveReport(NamedTuple):
+    resource: uuid.UUID
+    time_from: datetime
+    time_to: datetime
+    up_seconds: float
+    down_seconds: float
+    # None - за окно нет данных
+    uptime_percent: Optional[float]
+    # Отказов, начавшихся в окне
+    outages_count: int
+    # Самый долгий отказ в пределах окна (в секундах), None - отказов в окне нет
+    longest_outage_seconds: Optional[float]
+    intervals_count: int
+
+
+class ArchivedIntervals(NamedTuple):
+    """ Отображенные в память колонки архива ресурса. """
+    time_from: 'np.ndarray'
+    time_to: 'np.ndarray'
+    states: 'np.ndarray'
+    count: int
+
+    def get_states(self, start: int, stop: int) -> 'np.ndarray':
+        """ Доступность интервалов [start, stop) как массив bool. """
+        packed = self.states[start // 8:(stop + 7) // 8]
+        offset = start % 8
+        return np.unpackbits(packed)[offset:offset + stop - start].astype(bool)
+
+
+class IntervalArchive:
+    """
+    Колоночный архив закрытых интервалов доступности: по каталогу на ресурс в directory с колонками
+    начала, конца и битовой маски доступности. Колонки только дописываются в конец и читаются через
+    отображение в память, поэтому отчет за любое окно - двоичный поиск границ окна и векторные операции numpy
+    над срезом, без чтения всей истории. Интервалы ресурса в архиве не пересекаются и идут по времени.
+    Количество интервалов определяет колонка начала, которая дописывается последней: хвосты колонок
+    после сбоя во время дописывания отрезаются при следующем дописывании.
+    """
+
+    def __init__(self, directory: Path = settings.INTERVAL_ARCHIVE_DIR):
+        if np is None:
+            raise RuntimeError("Для архива интервалов нужен numpy (pip install numpy)")
+        self.directory = Path(directory)
+
+    def _get_directory(self, resource) -> Path:
+        return self.directory / str(resource)
+
+    @staticmethod
+    def _get_count(directory: Path) -> int:
+        try:
+            return min(
+                (directory / TIME_FROM_FILE).stat().st_size // EPOCH_SIZE,
+                (directory / TIME_TO_FILE).stat().st_size // EPOCH_SIZE,
+                (directory / STATE_FILE).stat().st_size * 8,
+            )
+        except FileNotFoundError:
+            return 0
+
+    @staticmethod
+    def _write(path: Path, offset: int, data: bytes):
+        """ Запишет данные с позиции offset, отрежет все после них и дождется записи на диск. """
+        with open(path, 'r+b') as file:
+            file.seek(offset)
+            file.write(data)
+            file.truncate()
+            file.flush()
+            os.fsync(file.fileno())
+
+    def append(self, resource, time_from: 'np.ndarray', time_to: 'np.ndarray', states: 'np.ndarray') -> int:
+        """
+        Допишет интервалы ресурса (по времени, микросекунды от эпохи). Интервалы, начавшиеся не позже последнего
+        архивного (уже перенесенные прошлым запуском, который не успел удалить их из БД), пропускаются.
+        :return: Количество дописанных интервалов
+        """
+        directory = self._get_directory(resource)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in (TIME_FROM_FILE, TIME_TO_FILE, STATE_FILE):
+            (directory / name).touch()
+        count = self._get_count(directory)
+        if count:
+            with open(directory / TIME_FROM_FILE, 'rb') as file:
+                file.seek((count - 1) * EPOCH_SIZE)
+                last_time_from = int(np.frombuffer(file.read(EPOCH_SIZE), dtype=EPOCH_DTYPE)[0])
+            is_new = time_from > last_time_from
+            time_from, time_to, states = time_from[is_new], time_to[is_new], states[is_new]
+        if not len(time_from):
+            return 0
+
+        # Неполный последний байт маски дополняется новыми битами
+        bits = states.astype(np.uint8)
+        tail = count % 8
+        if tail:
+            with open(directory / STATE_FILE, 'rb') as file:
+                file.seek(count // 8)
+                previous = np.unpackbits(np.frombuffer(file.read(1), dtype=np.uint8))[:tail]
+            bits = np.concatenate([previous, bits])
+        self._write(directory / STATE_FILE, count // 8, np.packbits(bits).tobytes())
+        self._write(directory / TIME_TO_FILE, count * EPOCH_SIZE, time_to.astype(EPOCH_DTYPE).tobytes())
+        self._write(directory / TIME_FROM_FILE, count * EPOCH_SIZE, time_from.astype(EPOCH_DTYPE).tobytes())
+        return len(time_from)
+
+    def append_many(self, columns: Dict[uuid.UUID, Tuple]) -> int:
+        return sum(self.append(resource, *resource_columns) for resource, resource_columns in columns.items())
+
+    def read(self, resource) -> Optional[ArchivedIntervals]:
+        directory = self._get_directory(resource)
+        count = self._get_count(directory)
+        if not count:
+            return None
+        return ArchivedIntervals(
+            time_from=np.memmap(directory / TIME_FROM_FILE, dtype=EPOCH_DTYPE, mode='r', shape=(count,)),
+            time_to=np.memmap(directory / TIME_TO_FILE, dtype=EPOCH_DTYPE, mode='r', shape=(count,)),
+            states=np.memmap(directory / STATE_FILE, dtype=np.uint8, mode='r', shape=((count + 7) // 8,)),
+            count=count,
+        )
+
+    def get_resources(self) -> List[uuid.UUID]:
+        if not self.directory.exists():
+            return []
+        return [uuid.UUID(path.name) for path in self.directory.iterdir() if path.is_dir()]
+
+    def get_report(self, resource, time_from: datetime, time_to: datetime) -> ArchiveReport:
+        """
+        Uptime, количество отказов и самый долгий отказ ресурса за окно [time_from, time_to) по архиву.
+        Интервалы на границах окна учитываются только своей частью внутри окна.
+        """
+        start, stop = to_epoch(time_from), to_epoch(time_to)
+        intervals = self.read(resource)
+        first = last = 0
+        if intervals is not None:
+            # Конец и начало интервалов возрастают: окно - непрерывный срез колонок
+            first = int(np.searchsorted(intervals.time_to, start, side='right'))
+            last = int(np.searchsorted(intervals.time_from, stop, side='left'))
+        if first >= last:
+            return ArchiveReport(resource, time_from, time_to, 0.0, 0.0, None, 0, None, 0)
+
+        starts = intervals.time_from[first:last]
+        durations = (np.minimum(intervals.time_to[first:last], stop) - np.maximum(starts, start)) / 1_000_000
+        states = intervals.get_states(first, last)
+        outages = ~states
+        up_seconds = float(durations[states].sum())
+        down_seconds = float(durations[outages].sum())
+        observed_seconds = up_seconds + down_seconds
+        return ArchiveReport(
+            resource=resource,
+            time_from=time_from,
+            time_to=time_to,
+            up_seconds=up_seconds,
+            down_seconds=down_seconds,
+            uptime_percent=100 * up_seconds / observed_seconds if observed_seconds else None,
+            outages_count=int(np.count_nonzero(outages & (starts >= start))),
+            longest_outage_seconds=float(durations[outages].max()) if outages.any() else None,
+            intervals_count=last - first,
+        )
+
+
+def get_archive_columns(rows) -> Dict[uuid.UUID, Tuple]:
+    """ Колонки архива по ресурсам из строк интервалов (по ресурсу и времени). """
+    grouped: Dict[uuid.UUID, List] = {}
+    for row in rows:
+        grouped.setdefault(row.resource, []).append(row)
+    return {
+        resource: (
+            np.array([to_epoch(row.time_from) for row in resource_rows], dtype=np.int64),
+            np.array([to_epoch(row.time_to) for row in resource_rows], dtype=np.int64),
+            np.array([row.is_available for row in resource_rows], dtype=bool),
+        )
+        for resource, resource_rows in grouped.items()
+    }
+
+
+async def archive_intervals(
+        archive: IntervalArchive,
+        after_days: int = settings.INTERVAL_ARCHIVE_AFTER_DAYS,
+        batch_size: int = settings.COMPACTION_BATCH_SIZE,
+        lease_guard: Optional[Callable[[AsyncSession, List], Awaitable[List]]] = None,
+) -> int:
+    """
+    Перенесет в архив интервалы SwCoreResourceAvailabilityCompare, закончившиеся раньше after_days дней назад,
+    кроме открытых интервалов контрольных точек компоновки. Колонки пачки ресурсов дописываются в пуле потоков,
+    строки удаляются из БД в той же транзакции после записи архива на диск; если транзакция не завершится,
+    следующий запуск перенесет эти строки еще раз, а архив пропустит уже записанные интервалы.
+    Почасовые и суточные итоги не меняются, но rebuild_rollups после переноса увидит только интервалы в БД.
+    :param lease_guard: В режиме шардирования - оставит ресурсы арендованных партиций (архив локален экземпляру)
+    :return: Количество перенесенных интервалов
+    """
+    start = time.perf_counter()
+    compare = SwCoreResourceAvailabilityCompare
+    cutoff = datetime.now(timezone.utc) - timedelta(days=after_days)
+    checkpoint = SwCoreCompactionCheckpoint
+    open_intervals = select(checkpoint.open_interval).where(checkpoint.open_interval.is_not(None))
+    is_closed = and_(compare.time_to < cutoff, compare.id.not_in(open_intervals))
+    async with AsyncDBAdapter().get_session() as session:
+        resources = list((await session.execute(select(compare.resource).where(is_closed).distinct())).scalars())
+
+    loop = asyncio.get_running_loop()
+    archived = 0
+    for batch_start in range(0, len(resources), batch_size):
+        batch = resources[batch_start:batch_start + batch_size]
+        async with AsyncDBAdapter().get_session() as session:
+            if lease_guard is not None:
+                batch = await lease_guard(session, batch)
+                if not batch:
+                    continue
+            condition = and_(compare.resource.in_(batch), is_closed)
+            query = await session.execute(
+                select(compare.resource, compare.time_from, compare.time_to, compare.is_available).where(
+                    condition
+                ).order_by(compare.resource, compare.time_from)
+            )
+            rows = query.all()
+            await loop.run_in_executor(None, archive.append_many, get_archive_columns(rows))
+            await session.execute(delete(compare).where(condition))
+        archived += len(rows)
+        ARCHIVED_INTERVALS.inc(len(rows))
+
+    elapsed = time.perf_counter() - start
+    ARCHIVE_SECONDS.observe(elapsed)
+    LOGGER.info("В архив перенесено %s интервалов %s ресурсов за %0.3f секунд", archived, len(resources), elapsed)
+    return archived
+
+
+if __name__ == '__main__':
+    asyncio.run(archive_intervals(IntervalArchive()))
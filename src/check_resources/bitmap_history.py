@@ -0,0 +1,250 @@
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import settings
+from app.database import MAX_QUERY_PARAMETERS, AsyncDBAdapter
+from app.services.logger import SWCoreLogger
+from check_resources.compaction import PreparedAvailableRows, get_gap_in_seconds
+from check_resources.latency_sketch import LatencySketch
+from check_resources.models import SwCoreResourceAvailabilityBitmap, SwCoreResources
+
+LOGGER = SWCoreLogger().get_logger()
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# Карт в одном запросе flush: upsert передает по 5 параметров на карту
+FLUSH_CHUNK_SIZE = MAX_QUERY_PARAMETERS // 5
+
+
+def popcount(bits: int) -> int:
+    return bin(bits).count('1')
+
+
+def get_bucket_start(moment: datetime, bucket_in_seconds: int) -> datetime:
+    """ Начало периода, в который попадает момент (периоды выровнены от начала эпохи). """
+    seconds = (moment - EPOCH).total_seconds()
+    return EPOCH + timedelta(seconds=seconds // bucket_in_seconds * bucket_in_seconds)
+
+
+def get_slot_index(moment: datetime, bucket_start: datetime, slot_in_seconds: int) -> int:
+    return int((moment - bucket_start).total_seconds() // slot_in_seconds)
+
+
+def get_slots_mask(first_slot: int, last_slot: int) -> int:
+    """ Маска слотов [first_slot, last_slot). """
+    if last_slot <= first_slot:
+        return 0
+    return ((1 << (last_slot - first_slot)) - 1) << first_slot
+
+
+def to_bytes(bits: int, slots_count: int) -> bytes:
+    return bits.to_bytes((slots_count + 7) // 8, 'little')
+
+
+def from_bytes(value: Optional[bytes]) -> int:
+    return int.from_bytes(value, 'little') if value else 0
+
+
+class BitmapHistoryStore:
+    """
+    Компактная история проверок: по ресурсу и периоду bucket_in_seconds хранятся две битовые карты слотов
+    длиной slot_in_seconds - проверенные слоты и слоты с отказом (ресурс доступен в слоте, если проверен и не отказал).
+    Результаты копятся в памяти и записываются flush: карты пачки читаются с блокировкой,
+    объединяются с накопленными побитовым ИЛИ и записываются upsert (частями в пределах параметров запроса).
+    Доступность за любое окно считается подсчетом единичных битов, без чтения строк замеров.
+    """
+
+    def __init__(
+            self,
+            bucket_in_seconds: int = settings.BITMAP_HISTORY_BUCKET_IN_SECONDS,
+            slot_in_seconds: int = settings.BITMAP_HISTORY_SLOT_IN_SECONDS,
+    ):
+        self.bucket_in_seconds = bucket_in_seconds
+        self.slot_in_seconds = slot_in_seconds
+        self.slots_count = bucket_in_seconds // slot_in_seconds
+        # Не записанные в БД карты: (ресурс, начало периода) -> [проверенные слоты, слоты с отказом]
+        self._pending: Dict[Tuple, List[int]] = {}
+
+    def get_slot_time(self, bucket_start: datetime, slot_index: int) -> datetime:
+        return bucket_start + timedelta(seconds=slot_index * self.slot_in_seconds)
+
+    def record(self, answers: Iterable, moment: Optional[datetime] = None):
+        """
+        Отметит результаты проверок AvailableAnswer в слотах моментов проверки checked_at, поэтому результаты,
+        записанные с задержкой (из очереди записи или спула), попадают в свой слот.
+        :param moment: Момент для результатов без checked_at (по умолчанию - текущий)
+        """
+        moment = moment or datetime.now(timezone.utc)
+        for answer in answers:
+            checked_at = answer.checked_at or moment
+            bucket_start = get_bucket_start(checked_at, self.bucket_in_seconds)
+            bit = 1 << get_slot_index(checked_at, bucket_start, self.slot_in_seconds)
+            bits = self._pending.setdefault((answer.app_id, bucket_start), [0, 0])
+            bits[0] |= bit
+            # Слот доступен, только если доступны все проверки в нем (как bool_and при компоновке)
+            if not answer.is_available:
+                bits[1] |= bit
+
+    def get_unwritten_since(self) -> Optional[datetime]:
+        """ Начало самого раннего слота среди карт, еще не записанных в БД (None - все записано). """
+        moments = [
+            self.get_slot_time(bucket_start, (probed & -probed).bit_length() - 1)
+            for (_, bucket_start), (probed, _) in self._pending.items() if probed
+        ]
+        return min(moments, default=None)
+
+    async def _flush_chunk(self, session: AsyncSession, pending: Dict[Tuple, List[int]]):
+        """ Объединит часть накопленных карт с записанными и запишет одним upsert. """
+        bitmap = SwCoreResourceAvailabilityBitmap
+        query = await session.execute(
+            select(bitmap.resource, bitmap.bucket_start, bitmap.probed, bitmap.failed).where(
+                tuple_(bitmap.resource, bitmap.bucket_start).in_(list(pending))
+            ).with_for_update()
+        )
+        stored = {(row.resource, row.bucket_start): row for row in query}
+        rows = []
+        for key, (probed, failed) in pending.items():
+            if key in stored:
+                probed |= from_bytes(stored[key].probed)
+                failed |= from_bytes(stored[key].failed)
+            rows.append({
+                'resource': key[0],
+                'bucket_start': key[1],
+                'slot_seconds': self.slot_in_seconds,
+                'probed': to_bytes(probed, self.slots_count),
+                'failed': to_bytes(failed, self.slots_count),
+            })
+        statement = insert(bitmap).values(rows)
+        await session.execute(statement.on_conflict_do_update(
+            index_elements=[bitmap.resource, bitmap.bucket_start],
+            set_={'probed': statement.excluded.probed, 'failed': statement.excluded.failed},
+        ))
+
+    async def flush(self) -> int:
+        """ Запишет накопленные карты в БД. Вернет количество обновленных карт. """
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        start = time.perf_counter()
+        try:
+            # Все части пишутся в одной транзакции: при ошибке в очередь возвращаются все карты
+            async with AsyncDBAdapter().get_session() as session:
+                keys = list(pending)
+                for chunk_start in range(0, len(keys), FLUSH_CHUNK_SIZE):
+                    await self._flush_chunk(session, {
+                        key: pending[key] for key in keys[chunk_start:chunk_start + FLUSH_CHUNK_SIZE]
+                    })
+        except Exception:
+            # Несохраненные карты вернутся в очередь и будут записаны следующим flush
+            for key, (probed, failed) in pending.items():
+                bits = self._pending.setdefault(key, [0, 0])
+                bits[0] |= probed
+                bits[1] |= failed
+            raise
+        LOGGER.info("Запись %s битовых карт истории за %0.3f секунд", len(pending), time.perf_counter() - start)
+        return len(pending)
+
+    async def _get_bitmaps(
+            self, session: AsyncSession, resources: Iterable, time_from: datetime, time_to: datetime
+    ) -> List[SwCoreResourceAvailabilityBitmap]:
+        bitmap = SwCoreResourceAvailabilityBitmap
+        query = await session.execute(select(bitmap).where(
+            bitmap.resource.in_(resources),
+            bitmap.bucket_start >= get_bucket_start(time_from, self.bucket_in_seconds),
+            bitmap.bucket_start < time_to,
+        ).order_by(bitmap.resource, bitmap.bucket_start))
+        return list(query.scalars())
+
+    def _get_window_mask(self, bucket_start: datetime, time_from: datetime, time_to: datetime) -> int:
+        first_slot = max(0, -(-int((time_from - bucket_start).total_seconds()) // self.slot_in_seconds))
+        last_slot = min(self.slots_count, -(-int((time_to - bucket_start).total_seconds()) // self.slot_in_seconds))
+        return get_slots_mask(first_slot, last_slot)
+
+    async def get_availability(
+            self, session: AsyncSession, resource, time_from: datetime, time_to: datetime
+    ) -> Tuple[int, int]:
+        """
+        Доступность ресурса за окно [time_from, time_to).
+        :return: Количество проверенных слотов и количество слотов, в которых ресурс был доступен
+        """
+        probed_count = available_count = 0
+        for row in await self._get_bitmaps(session, [resource], time_from, time_to):
+            mask = self._get_window_mask(row.bucket_start, time_from, time_to)
+            probed = from_bytes(row.probed) & mask
+            probed_count += popcount(probed)
+            available_count += popcount(probed & ~from_bytes(row.failed))
+        return probed_count, available_count
+
+    async def read_islands(
+            self,
+            session: AsyncSession,
+            resources: List,
+            watermarks: Dict,
+            time_buffer_in_seconds: int,
+            time_cutoff: Optional[datetime] = None,
+    ) -> Tuple[List, int]:
+        """
+        Источник интервалов для CompactionEngine: проверенные слоты после водяного знака ресурса
+        собираются в интервалы по тем же правилам, что и сырые строки (смена состояния или разрыв
+        больше периода проверки плюс буфер). Задержки в картах не хранятся, скетчи интервалов пустые.
+        :param time_cutoff: Отсечка компоновки: слоты с нее и позже не компонуются, пока их проверки могут быть
+        еще не записаны (очередь записи, спул)
+        :return: Интервалы PreparedAvailableRows и количество обработанных слотов
+        """
+        # Слоты, которые еще могут получить проверки до следующего flush, не компонуются
+        slots_cutoff = datetime.now(timezone.utc) - timedelta(
+            seconds=max(settings.COMPACTION_DELAY_IN_SECONDS, self.slot_in_seconds)
+        )
+        time_cutoff = slots_cutoff if time_cutoff is None else min(time_cutoff, slots_cutoff)
+        default_time_from = time_cutoff - timedelta(hours=settings.RAW_STATISTICS_RETENTION_IN_HOURS)
+        time_from = min((watermark or default_time_from for watermark in watermarks.values()), default=time_cutoff)
+
+        query = await session.execute(select(SwCoreResources.id, SwCoreResources.probe_interval).where(
+            SwCoreResources.id.in_(resources)
+        ))
+        gaps = {resource: timedelta(seconds=get_gap_in_seconds(probe_interval) + time_buffer_in_seconds)
+                for resource, probe_interval in query}
+
+        islands = []
+        slots_count = 0
+        current = None
+        for row in await self._get_bitmaps(session, resources, time_from, time_cutoff):
+            watermark = watermarks.get(row.resource) or default_time_from
+            probed = from_bytes(row.probed)
+            failed = from_bytes(row.failed)
+            first_slot = max(0, get_slot_index(watermark, row.bucket_start, self.slot_in_seconds) + 1)
+            last_slot = min(self.slots_count, get_slot_index(time_cutoff, row.bucket_start, self.slot_in_seconds))
+            probed &= get_slots_mask(first_slot, last_slot)
+            while probed:
+                # Младший единичный бит - следующий проверенный слот
+                lowest_bit = probed & -probed
+                probed ^= lowest_bit
+                slot_index = lowest_bit.bit_length() - 1
+                slot_time = self.get_slot_time(row.bucket_start, slot_index)
+                is_available = not (failed >> slot_index) & 1
+                slots_count += 1
+                if (
+                        current is not None
+                        and current.resource == row.resource
+                        and current.is_available == is_available
+                        and slot_time - current.time_to <= gaps.get(row.resource, timedelta(0))
+                ):
+                    current = current._replace(time_to=slot_time)
+                else:
+                    if current is not None:
+                        islands.append(current)
+                    current = PreparedAvailableRows(
+                        time_from=slot_time,
+                        time_to=slot_time,
+                        is_available=is_available,
+                        resource=row.resource,
+                        latency_sketch=LatencySketch(),
+                        max_gap=gaps.get(row.resource),
+                    )
+        if current is not None:
+            islands.append(current)
+        return islands, slots_count
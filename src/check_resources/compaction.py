@@ -0,0 +1,447 @@
+import math
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select, func, case, or_, Integer
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import settings
+from app.database import AsyncDBAdapter, get_rows_chunks
+from app.services.logger import SWCoreLogger
+from app.services.metrics import METRICS
+from check_resources.latency_sketch import LatencySketch, MIN_LATENCY_VALUE
+from check_resources.models import SwCoreResourceAvailabilityStatistics, SwCoreResourceAvailabilityCompare, \
+    SwCoreCompactionCheckpoint, SwCoreResources
+from check_resources.rollups import get_rollup_deltas, upsert_rollups
+
+LOGGER = SWCoreLogger().get_logger()
+
+ROWS_COMPACTED = METRICS.counter('sw_core_rows_compacted_total', 'Скомпоновано сырых замеров')
+COMPACTION_SECONDS = METRICS.histogram('sw_core_compaction_seconds', 'Длительность компоновки всех ресурсов')
+
+
+class PreparedAvailableRows(NamedTuple):
+    time_from: datetime
+    time_to: datetime
+    is_available: bool
+    resource: int
+    latency_sketch: LatencySketch
+    # Наибольший разрыв между замерами, при котором замеры остаются в одном интервале
+    # (None - только TIME_BUFFER_IN_SECONDS)
+    max_gap: Optional[timedelta] = None
+
+
+def get_latency_columns(latency_sketch: LatencySketch) -> dict:
+    """ Значения колонок перцентилей задержки для SwCoreResourceAvailabilityCompare. """
+    return {
+        'latency_p50': latency_sketch.quantile(0.5),
+        'latency_p95': latency_sketch.quantile(0.95),
+        'latency_p99': latency_sketch.quantile(0.99),
+        'latency_sketch': latency_sketch.to_dict(),
+    }
+
+
+def get_gap_in_seconds(probe_interval: Optional[int]) -> int:
+    """ Наибольший ожидаемый разрыв между замерами ресурса (как в get_islands_query, без буфера). """
+    gap_in_seconds = probe_interval or settings.FREQUENCY_OF_LAUNCHING_AVAILABILITY_COLLECTION
+    if settings.IS_ADAPTIVE_PROBING_ENABLED:
+        gap_in_seconds = max(gap_in_seconds, settings.ADAPTIVE_PROBING_MAX_STALENESS_IN_SECONDS)
+    return gap_in_seconds
+
+
+def get_islands_query(
+        resources: Iterable, time_cutoff, time_buffer_in_seconds: int, time_lower_bound: Optional[datetime] = None
+):
+    """
+    Один запрос с оконными функциями, который собирает новые сырые строки пачки ресурсов в интервалы.
+    Новый интервал начинается, если поменялась метка доступности или разрыв между соседними
+    замерами больше периода проверки ресурса плюс time_buffer_in_seconds.
+    Заодно по каждому интервалу собираются корзины скетча задержки.
+    time_lower_bound (наименьший водяной знак пачки) отсекает старые секции таблицы замеров еще при планировании.
+    """
+    statistics = SwCoreResourceAvailabilityStatistics
+    checkpoint = SwCoreCompactionCheckpoint
+    resources_table = SwCoreResources
+    gap_in_seconds = func.coalesce(
+        resources_table.probe_interval, settings.FREQUENCY_OF_LAUNCHING_AVAILABILITY_COLLECTION
+    )
+    if settings.IS_ADAPTIVE_PROBING_ENABLED:
+        # Стабильно доступный ресурс проверяется реже, но не реже раза в максимальное время устаревания
+        gap_in_seconds = func.greatest(gap_in_seconds, settings.ADAPTIVE_PROBING_MAX_STALENESS_IN_SECONDS)
+    gap_in_seconds = gap_in_seconds + time_buffer_in_seconds
+    window = dict(partition_by=statistics.resource, order_by=statistics.created_at)
+    previous_is_available = func.lag(statistics.is_available).over(**window)
+    previous_created_at = func.lag(statistics.created_at).over(**window)
+
+    # Индекс корзины скетча считается так же, как LatencySketch.key
+    log_gamma = math.log(LatencySketch().gamma)
+    latency_bucket = func.cast(
+        func.ceil(func.ln(func.greatest(statistics.avg_latency, MIN_LATENCY_VALUE)) / log_gamma), Integer
+    )
+
+    marked = select(
+        statistics.resource,
+        statistics.created_at,
+        statistics.is_available,
+        latency_bucket.label('latency_bucket'),
+        gap_in_seconds.label('gap_in_seconds'),
+        case(
+            (or_(
+                previous_is_available.is_distinct_from(statistics.is_available),
+                statistics.created_at > previous_created_at + func.make_interval(0, 0, 0, 0, 0, 0, gap_in_seconds),
+            ), 1),
+            else_=0
+        ).label('is_island_start'),
+    ).join(
+        resources_table, resources_table.id == statistics.resource
+    ).outerjoin(
+        checkpoint, checkpoint.resource == statistics.resource
+    ).where(
+        statistics.resource.in_(resources),
+        statistics.created_at < time_cutoff,
+        # Только замеры новее водяного знака ресурса
+        or_(checkpoint.watermark.is_(None), statistics.created_at > checkpoint.watermark),
+        *([statistics.created_at > time_lower_bound] if time_lower_bound is not None else []),
+    ).cte('marked')
+
+    grouped = select(
+        marked,
+        func.sum(marked.c.is_island_start).over(
+            partition_by=marked.c.resource, order_by=marked.c.created_at
+        ).label('island'),
+    ).cte('grouped')
+
+    buckets = select(
+        grouped.c.resource, grouped.c.island, grouped.c.latency_bucket, func.count().label('bucket_count')
+    ).where(
+        grouped.c.latency_bucket.is_not(None)
+    ).group_by(grouped.c.resource, grouped.c.island, grouped.c.latency_bucket).cte('buckets')
+    sketches = select(
+        buckets.c.resource,
+        buckets.c.island,
+        func.jsonb_object_agg(buckets.c.latency_bucket, buckets.c.bucket_count).label('latency_sketch'),
+    ).group_by(buckets.c.resource, buckets.c.island).cte('sketches')
+
+    islands = select(
+        grouped.c.resource,
+        grouped.c.island,
+        func.min(grouped.c.created_at).label('time_from'),
+        func.max(grouped.c.created_at).label('time_to'),
+        func.bool_and(grouped.c.is_available).label('is_available'),
+        func.count().label('rows_count'),
+        func.max(grouped.c.gap_in_seconds).label('gap_in_seconds'),
+    ).group_by(grouped.c.resource, grouped.c.island).cte('islands')
+
+    return select(
+        islands.c.resource,
+        islands.c.time_from,
+        islands.c.time_to,
+        islands.c.is_available,
+        islands.c.rows_count,
+        islands.c.gap_in_seconds,
+        sketches.c.latency_sketch,
+    ).select_from(
+        islands.outerjoin(
+            sketches,
+            (sketches.c.resource == islands.c.resource) & (sketches.c.island == islands.c.island)
+        )
+    ).order_by(islands.c.resource, islands.c.time_from)
+
+
+def get_last_intervals_query(resources: Iterable):
+    """ Последний интервал результирующей таблицы по каждому ресурсу. """
+    compare = SwCoreResourceAvailabilityCompare
+    return select(compare).distinct(compare.resource).where(
+        compare.resource.in_(resources)
+    ).order_by(compare.resource, compare.time_to.desc())
+
+
+def get_checkpoints_query(resources: Iterable):
+    """ Контрольные точки ресурсов вместе с их открытыми интервалами. """
+    checkpoint = SwCoreCompactionCheckpoint
+    compare = SwCoreResourceAvailabilityCompare
+    return select(checkpoint.resource, compare).outerjoin(
+        compare, compare.id == checkpoint.open_interval
+    ).where(checkpoint.resource.in_(resources))
+
+
+class OpenInterval(NamedTuple):
+    id: uuid.UUID
+    time_from: datetime
+    time_to: datetime
+    is_available: bool
+    latency_sketch: LatencySketch
+
+
+def get_open_interval(interval: Optional[SwCoreResourceAvailabilityCompare]) -> Optional[OpenInterval]:
+    if interval is None:
+        return None
+    return OpenInterval(
+        id=interval.id,
+        time_from=interval.time_from,
+        time_to=interval.time_to,
+        is_available=interval.is_available,
+        latency_sketch=LatencySketch.from_dict(interval.latency_sketch),
+    )
+
+
+class CompactionEngine:
+    """
+    Инкрементальная компоновка сырых замеров в интервалы доступности пачками ресурсов.
+    На пачку выполняется постоянное число запросов: выборка новых (после водяного знака) интервалов
+    оконными функциями, upsert интервалов и upsert контрольных точек. Сырые замеры не удаляются:
+    водяной знак отсекает уже скомпонованные, а место освобождает удаление старых секций (PartitionManager).
+    Открытый интервал каждого ресурса хранится в памяти, поэтому для продления интервала
+    не нужен запрос к результирующей таблице. Кэш сохраняется в SwCoreCompactionCheckpoint
+    в одной транзакции с интервалами и восстанавливается оттуда после перезапуска.
+    Работает только на PostgreSQL: на других бэкендах compact_batch сразу завершится RuntimeError.
+    """
+
+    def __init__(
+            self,
+            batch_size: int = settings.COMPACTION_BATCH_SIZE,
+            time_buffer_in_seconds: int = settings.TIME_BUFFER_IN_SECONDS,
+            lease_guard: Optional[Callable[[AsyncSession, List], Awaitable[List]]] = None,
+            islands_reader: Optional[
+                Callable[[AsyncSession, List, Dict, int, datetime], Awaitable[Tuple[List, int]]]
+            ] = None,
+            is_rollups_enabled: bool = settings.IS_AVAILABILITY_ROLLUPS_ENABLED,
+            unwritten_since: Optional[Callable[[], Optional[datetime]]] = None,
+    ):
+        """
+        :param lease_guard: В режиме шардирования - блокирует аренду ресурсов пачки в ее транзакции
+        и возвращает только ресурсы, арендованные этим экземпляром
+        :param islands_reader: Другой источник сырой истории (например, BitmapHistoryStore.read_islands):
+        получает ресурсы пачки, их водяные знаки, буфер и отсечку компоновки (с учетом unwritten_since),
+        возвращает интервалы и количество обработанных замеров
+        :param is_rollups_enabled: Обновлять почасовые и суточные итоги в транзакции пачки
+        :param unwritten_since: Момент самого старого еще не записанного замера (например,
+        WriteBehindQueue.get_unwritten_since): отсечка по умолчанию не заходит дальше него
+        """
+        self.batch_size = batch_size
+        self.lease_guard = lease_guard
+        self.islands_reader = islands_reader
+        self.is_rollups_enabled = is_rollups_enabled
+        self.unwritten_since = unwritten_since
+        # Вызываются после commit пачки с ее новыми открытыми интервалами и всеми строками интервалов пачки
+        # (по ресурсу и времени, включая закрытые внутри пачки) - например, для сброса кэшей и оповещений
+        self.on_batch_committed: List[Callable[[Dict, List[dict]], None]] = []
+        self.time_buffer_in_seconds = time_buffer_in_seconds
+        self.time_buffer = timedelta(seconds=time_buffer_in_seconds)
+        # Открытый интервал по ресурсу (None - интервалов еще нет)
+        self.open_intervals: Dict[uuid.UUID, Optional[OpenInterval]] = {}
+
+    def forget(self, predicate: Callable[[uuid.UUID], bool]):
+        """ Сбросит кэш открытых интервалов ресурсов (например, перешедших от другого экземпляра). """
+        for resource in [resource for resource in self.open_intervals if predicate(resource)]:
+            del self.open_intervals[resource]
+
+    async def _get_last_intervals(self, session: AsyncSession, resources: List) -> Dict:
+        """ Последний интервал результирующей таблицы по каждому ресурсу. """
+        query = await session.execute(get_last_intervals_query(resources))
+        return {row.resource: row for row in query.scalars()}
+
+    async def _load_checkpoints(self, session: AsyncSession, resources: List):
+        """ Восстановит кэш открытых интервалов для ресурсов, которых в нем еще нет. """
+        missing = [resource for resource in resources if resource not in self.open_intervals]
+        if not missing:
+            return
+
+        query = await session.execute(get_checkpoints_query(missing))
+        for resource, interval in query:
+            self.open_intervals[resource] = get_open_interval(interval)
+
+        # Ресурсы без контрольной точки (первый запуск) продолжают свой последний интервал
+        without_checkpoint = [resource for resource in missing if resource not in self.open_intervals]
+        if without_checkpoint:
+            last_intervals = await self._get_last_intervals(session, without_checkpoint)
+            for resource in without_checkpoint:
+                self.open_intervals[resource] = get_open_interval(last_intervals.get(resource))
+
+    def get_watermarks(self, resources: List) -> Dict:
+        """ Водяной знак (конец открытого интервала) по ресурсу, None - интервалов еще нет. """
+        watermarks = {}
+        for resource in resources:
+            interval = self.open_intervals.get(resource)
+            watermarks[resource] = interval.time_to if interval is not None else None
+        return watermarks
+
+    def get_time_lower_bound(self, resources: List) -> Optional[datetime]:
+        """ Наименьший водяной знак пачки или None, если у какого-то ресурса его еще нет. """
+        watermarks = [self.open_intervals.get(resource) for resource in resources]
+        if not watermarks or any(interval is None for interval in watermarks):
+            return None
+        return min(interval.time_to for interval in watermarks)
+
+    def _merge_islands(self, islands: List[PreparedAvailableRows]) -> Tuple[List[dict], Dict]:
+        """
+        Подготовит строки для upsert: первый интервал ресурса может продлить открытый интервал из кэша.
+        :return: Строки интервалов и новые открытые интервалы ресурсов
+        """
+        rows = []
+        open_intervals = {}
+        for island in islands:
+            # Интервалы отсортированы по ресурсу и времени, в open_intervals - последний обработанный
+            open_interval = open_intervals.get(island.resource, self.open_intervals.get(island.resource))
+
+            # Интервал продлевается по тому же правилу разрыва, по которому замеры делятся на интервалы,
+            # поэтому результат не зависит от того, на какие запуски компоновки пришлись замеры
+            if (
+                    open_interval is not None
+                    and open_interval.is_available == island.is_available
+                    and island.time_from - open_interval.time_to <= (island.max_gap or self.time_buffer)
+            ):
+                latency_sketch = LatencySketch.from_dict(open_interval.latency_sketch.to_dict())
+                latency_sketch.merge(island.latency_sketch)
+                interval = OpenInterval(
+                    id=open_interval.id,
+                    time_from=open_interval.time_from,
+                    time_to=max(open_interval.time_to, island.time_to),
+                    is_available=island.is_available,
+                    latency_sketch=latency_sketch,
+                )
+                if island.resource in open_intervals:
+                    rows.pop()
+            else:
+                interval = OpenInterval(
+                    id=uuid.uuid4(),
+                    time_from=island.time_from,
+                    time_to=island.time_to,
+                    is_available=island.is_available,
+                    latency_sketch=island.latency_sketch,
+                )
+
+            rows.append({
+                'id': interval.id,
+                'time_from': interval.time_from,
+                'time_to': interval.time_to,
+                'is_available': interval.is_available,
+                'resource': island.resource,
+                **get_latency_columns(interval.latency_sketch),
+            })
+            open_intervals[island.resource] = interval
+        return rows, open_intervals
+
+    async def _upsert_intervals(self, session: AsyncSession, rows: List[dict]):
+        """ Интервалы пачки частями в пределах параметров запроса (после простоя их бывают тысячи). """
+        compare = SwCoreResourceAvailabilityCompare
+        for chunk in get_rows_chunks(rows):
+            statement = insert(compare).values(chunk)
+            await session.execute(statement.on_conflict_do_update(
+                index_elements=[compare.id],
+                set_={
+                    column: statement.excluded[column]
+                    for column in ('time_to', 'latency_p50', 'latency_p95', 'latency_p99', 'latency_sketch')
+                }
+            ))
+
+    async def _upsert_checkpoints(self, session: AsyncSession, open_intervals: Dict):
+        checkpoint = SwCoreCompactionCheckpoint
+        rows = [
+            {'resource': resource, 'watermark': interval.time_to, 'open_interval': interval.id}
+            for resource, interval in open_intervals.items()
+        ]
+        for chunk in get_rows_chunks(rows):
+            statement = insert(checkpoint).values(chunk)
+            await session.execute(statement.on_conflict_do_update(
+                index_elements=[checkpoint.resource],
+                set_={
+                    'watermark': statement.excluded.watermark,
+                    'open_interval': statement.excluded.open_interval,
+                }
+            ))
+
+    async def _read_islands(self, session: AsyncSession, resources: List, time_cutoff) -> Tuple[List, int]:
+        """ Интервалы из сырых строк SwCoreResourceAvailabilityStatistics. """
+        query = await session.execute(get_islands_query(
+            resources, time_cutoff, self.time_buffer_in_seconds, self.get_time_lower_bound(resources)
+        ))
+        rows_count = 0
+        islands = []
+        for row in query:
+            rows_count += row.rows_count
+            islands.append(PreparedAvailableRows(
+                time_from=row.time_from,
+                time_to=row.time_to,
+                is_available=row.is_available,
+                resource=row.resource,
+                latency_sketch=LatencySketch.from_dict(row.latency_sketch),
+                max_gap=timedelta(seconds=row.gap_in_seconds),
+            ))
+        return islands, rows_count
+
+    async def compact_batch(
+            self, session: AsyncSession, resources: List, time_cutoff,
+    ) -> Tuple[int, Dict, List[dict]]:
+        """
+        Скомпонует одну пачку ресурсов в транзакции session.
+        :return: Количество обработанных сырых строк, новые открытые интервалы,
+        которые попадают в кэш только после успешного commit, и строки интервалов пачки
+        """
+        if session.bind.dialect.name != 'postgresql':
+            # make_interval, jsonb_object_agg, DISTINCT ON и upsert есть только в PostgreSQL, а сырые замеры
+            # удаляет PartitionManager, которого на других бэкендах нет
+            raise RuntimeError(f"Компоновка выполняется только на PostgreSQL, бэкенд БД: {session.bind.dialect.name}")
+        # Все запросы пачки видят один снимок данных
+        await session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+        if self.lease_guard is not None:
+            resources = await self.lease_guard(session, resources)
+            if not resources:
+                return 0, {}, []
+        await self._load_checkpoints(session, resources)
+
+        if self.islands_reader is not None:
+            islands, rows_count = await self.islands_reader(
+                session, resources, self.get_watermarks(resources), self.time_buffer_in_seconds, time_cutoff
+            )
+        else:
+            islands, rows_count = await self._read_islands(session, resources, time_cutoff)
+        if not islands:
+            return 0, {}, []
+
+        rows, open_intervals = self._merge_islands(islands)
+        await self._upsert_intervals(session, rows)
+        await self._upsert_checkpoints(session, open_intervals)
+        if self.is_rollups_enabled:
+            previous_intervals = {resource: self.open_intervals.get(resource) for resource in open_intervals}
+            await upsert_rollups(session, get_rollup_deltas(rows, previous_intervals))
+        return rows_count, open_intervals, rows
+
+    async def run(self, resources: List, time_cutoff: Optional[datetime] = None) -> int:
+        """
+        Скомпонует все переданные ресурсы, по транзакции на пачку из batch_size ресурсов.
+        :param resources: Идентификаторы ресурсов
+        :param time_cutoff: Обрабатываются строки старше отсечки (по умолчанию - текущее время
+        минус COMPACTION_DELAY_IN_SECONDS, но не позже самого старого незаписанного замера)
+        :return: Количество обработанных сырых строк
+        """
+        if time_cutoff is None:
+            # created_at - момент проверки по часам приложения, поэтому и отсечка по ним
+            time_cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.COMPACTION_DELAY_IN_SECONDS)
+            unwritten_since = self.unwritten_since() if self.unwritten_since is not None else None
+            if unwritten_since is not None:
+                time_cutoff = min(time_cutoff, unwritten_since)
+
+        start = time.perf_counter()
+        compacted_rows = 0
+        for batch_start in range(0, len(resources), self.batch_size):
+            batch = resources[batch_start:batch_start + self.batch_size]
+            async with AsyncDBAdapter().get_session() as session:
+                batch_rows, open_intervals, intervals = await self.compact_batch(session, batch, time_cutoff)
+            self.open_intervals.update(open_intervals)
+            compacted_rows += batch_rows
+            if open_intervals:
+                for callback in self.on_batch_committed:
+                    callback(open_intervals, intervals)
+
+        executing_time = time.perf_counter() - start
+        ROWS_COMPACTED.inc(compacted_rows)
+        COMPACTION_SECONDS.observe(executing_time)
+        LOGGER.info(
+            "Компоновка %s ресурсов: %s строк за %0.3f секунд", len(resources), compacted_rows, executing_time,
+            extra={'resources': len(resources), 'rows': compacted_rows, 'seconds': executing_time},
+        )
+        return compacted_rows
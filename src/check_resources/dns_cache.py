@@ -0,0 +1,130 @@
+import asyncio
+import socket
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from app import settings
+from app.services.metrics import METRICS
+
+DNS_LOOKUPS = METRICS.counter('sw_core_dns_cache_lookups_total', 'Обращений к кэшу разрешения имен', ['result'])
+DNS_REFRESHES = METRICS.counter('sw_core_dns_cache_refreshes_total', 'Фоновых обновлений записей кэша до истечения')
+DNS_EVICTIONS = METRICS.counter('sw_core_dns_cache_evictions_total', 'Вытеснено записей кэша разрешения имен')
+DNS_RESOLVE_SECONDS = METRICS.histogram(
+    'sw_core_dns_resolve_seconds', 'Длительность разрешения имени системным резолвером (промахи и обновления кэша)'
+)
+
+
+class DNSEntry(NamedTuple):
+    # Семейство, тип сокета, протокол и адрес (None - имя не разрешилось)
+    address: Optional[Tuple]
+    # Аргументы socket.gaierror для отрицательной записи
+    error_args: Optional[tuple]
+    expires_at: float
+    refresh_at: float
+
+
+class DNSCache:
+    """
+    Общий асинхронный кэш разрешения имен ресурсов перед подключением. Ошибки разрешения тоже кэшируются
+    (на negative_ttl), одновременные промахи по одному имени ждут одного обращения к резолверу.
+    Количество записей ограничено max_size, вытесняются давно не использованные. Запись, к которой обратились
+    после refresh_ahead_ratio от ее TTL, обновляется в фоне, поэтому проверки, регулярно обращающиеся к имени,
+    не ждут резолвер; если обновление не удалось, до истечения TTL используется прежний адрес.
+    """
+
+    def __init__(
+            self,
+            ttl: float = settings.DNS_CACHE_TTL_IN_SECONDS,
+            negative_ttl: float = settings.DNS_CACHE_NEGATIVE_TTL_IN_SECONDS,
+            max_size: int = settings.DNS_CACHE_MAX_SIZE,
+            refresh_ahead_ratio: float = settings.DNS_CACHE_REFRESH_AHEAD_RATIO,
+            getaddrinfo: Optional[Callable[..., Awaitable]] = None,
+    ):
+        """
+        :param getaddrinfo: Корутина-функция разрешения имени (по умолчанию loop.getaddrinfo)
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.refresh_ahead_ratio = refresh_ahead_ratio
+        self.getaddrinfo = getaddrinfo
+        self._entries: OrderedDict = OrderedDict()
+        # Текущие обращения к резолверу по (хост, порт)
+        self._lookups: Dict[Tuple[str, int], asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _store(self, key: Tuple[str, int], address: Optional[Tuple], error: Optional[socket.gaierror]):
+        now = time.monotonic()
+        if address is None:
+            current = self._entries.get(key)
+            if current is not None and current.address is not None and now < current.expires_at:
+                # Неудачное фоновое обновление: прежний адрес действует до истечения, обновление - позже
+                self._entries[key] = current._replace(refresh_at=min(now + self.negative_ttl, current.expires_at))
+                return
+            entry = DNSEntry(None, error.args, now + self.negative_ttl, now + self.negative_ttl)
+        else:
+            entry = DNSEntry(address, None, now + self.ttl, now + self.ttl * self.refresh_ahead_ratio)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            DNS_EVICTIONS.inc()
+
+    async def _lookup(self, key: Tuple[str, int]) -> Tuple:
+        host, port = key
+        getaddrinfo = self.getaddrinfo or asyncio.get_running_loop().getaddrinfo
+        start = time.perf_counter()
+        try:
+            address_info = await getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except socket.gaierror as error:
+            self._store(key, None, error)
+            raise
+        finally:
+            DNS_RESOLVE_SECONDS.observe(time.perf_counter() - start)
+        family, sock_type, proto, _, address = address_info[0]
+        self._store(key, (family, sock_type, proto, address), None)
+        return family, sock_type, proto, address
+
+    def _on_lookup_done(self, key: Tuple[str, int], task: asyncio.Task):
+        self._lookups.pop(key, None)
+        # Ошибку фонового обновления никто не ждет: она уже учтена в кэше
+        if not task.cancelled():
+            task.exception()
+
+    def _start_lookup(self, key: Tuple[str, int]) -> asyncio.Task:
+        task = self._lookups.get(key)
+        if task is None:
+            task = self._lookups[key] = asyncio.get_running_loop().create_task(self._lookup(key))
+            task.add_done_callback(lambda done: self._on_lookup_done(key, done))
+        return task
+
+    async def resolve(self, host: str, port: int) -> Tuple:
+        """
+        Семейство, тип сокета, протокол и адрес для подключения (первый результат getaddrinfo).
+        :raises socket.gaierror: Имя не разрешается (в том числе по отрицательной записи кэша)
+        """
+        key = (host, port)
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None and now < entry.expires_at:
+            self._entries.move_to_end(key)
+            if now >= entry.refresh_at and key not in self._lookups:
+                DNS_REFRESHES.inc()
+                self._start_lookup(key)
+            if entry.address is None:
+                DNS_LOOKUPS.inc(1, ('negative_hit',))
+                raise socket.gaierror(*entry.error_args)
+            DNS_LOOKUPS.inc(1, ('hit',))
+            return entry.address
+        DNS_LOOKUPS.inc(1, ('miss',))
+        # Отмена проверки по таймауту не отменяет общее обращение к резолверу
+        return await asyncio.shield(self._start_lookup(key))
+
+    async def close(self):
+        lookups = list(self._lookups.values())
+        for task in lookups:
+            task.cancel()
+        await asyncio.gather(*lookups, return_exceptions=True)
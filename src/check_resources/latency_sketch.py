@@ -0,0 +1,75 @@
+import math
+from typing import Dict, Optional
+
+from app import settings
+
+# Минимальное учитываемое значение задержки (в миллисекундах), чтобы не брать логарифм от нуля
+MIN_LATENCY_VALUE = 0.001
+
+
+class LatencySketch:
+    """
+    Потоковый скетч квантилей задержки на логарифмических корзинах (по мотивам DDSketch).
+    Каждое значение попадает в корзину с индексом ceil(log(value, gamma)), поэтому память
+    ограничена количеством корзин и не зависит от количества замеров в интервале.
+    Скетчи объединяются сложением корзин, что позволяет продлевать интервалы.
+    """
+
+    def __init__(
+            self,
+            relative_accuracy: float = settings.LATENCY_SKETCH_RELATIVE_ACCURACY,
+            max_buckets: int = settings.LATENCY_SKETCH_MAX_BUCKETS,
+            buckets: Optional[Dict[int, int]] = None,
+    ):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = dict(buckets or {})
+        self.count = sum(self.buckets.values())
+
+    def key(self, value: float) -> int:
+        """ Индекс корзины для значения. """
+        return math.ceil(math.log(max(value, MIN_LATENCY_VALUE)) / self._log_gamma)
+
+    def add(self, value: float, count: int = 1):
+        bucket = self.key(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += count
+        self._collapse()
+
+    def merge(self, other: 'LatencySketch'):
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += other.count
+        self._collapse()
+
+    def _collapse(self):
+        """ При превышении лимита корзин объединяем самые нижние (теряем точность только на малых значениях). """
+        if len(self.buckets) <= self.max_buckets:
+            return
+        keys = sorted(self.buckets)
+        extra_count = len(keys) - self.max_buckets
+        target_key = keys[extra_count]
+        for bucket in keys[:extra_count]:
+            self.buckets[target_key] += self.buckets.pop(bucket)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """ Оценка квантиля q (0..1) с относительной ошибкой relative_accuracy. """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        accumulated = 0
+        for bucket in sorted(self.buckets):
+            accumulated += self.buckets[bucket]
+            if accumulated > rank:
+                return 2 * self.gamma ** bucket / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_dict(self) -> Dict[str, int]:
+        """ Представление для хранения в JSON колонке. """
+        return {str(bucket): count for bucket, count in self.buckets.items()}
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, int]]) -> 'LatencySketch':
+        return cls(buckets={int(bucket): count for bucket, count in (data or {}).items()})
@@ -4,7 +4,7 @@ from typing import List
 
 from sqlalchemy import MetaData, Table, Column, Date, Integer, String, TIMESTAMP, ForeignKey, PrimaryKeyConstraint, \
     ForeignKeyConstraint, BIGINT, VARCHAR, BigInteger, BOOLEAN, Boolean, UniqueConstraint, Text, DOUBLE_PRECISION, \
-    SMALLINT, SmallInteger, DateTime, func, UUID
+    SMALLINT, SmallInteger, DateTime, func, UUID, JSON, Index, text, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Mapped, relationship
 
@@ -39,43 +39,173 @@ class SwCoreResources(Base):
     """ Таблица для хранения отслеживаемых ресурсов. """
     __tablename__ = 'sw_core_resources'
 
+    __table_args__ = (
+        # Частичный индекс для выборки активных ресурсов
+        Index(
+            'ix_sw_core_resources_active', 'id',
+            postgresql_include=['name', 'host', 'port'],
+            postgresql_where=text('is_active'),
+        ),
+    )
+
     id: Mapped[UUID] = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, comment='Идентификатор uuid')
     name: Mapped[str] = Column(String(length=250), nullable=False, unique=True, comment='Имя ресурса')
     description: Mapped[str] = Column(String(length=250), nullable=True, comment='Описание ресурса')
     host: Mapped[str] = Column(String(length=100), nullable=False, comment='Хост ресурса')
     port: Mapped[int] = Column(Integer, nullable=False, comment='Имя ресурса')
     is_active: Mapped[datetime] = Column(Boolean, nullable=False, default=True, comment='Активный для отслеживания')
+    probe_interval: Mapped[int] = Column(
+        Integer, nullable=True, comment='Период проверки (в секундах), по умолчанию период сбора из настроек'
+    )
+    probe_type: Mapped[str] = Column(
+        String(length=20), nullable=False, default='tcp', server_default='tcp',
+        comment='Тип проверки: tcp, tls, http (check_resources.probes.PROBE_TYPES)'
+    )
+    probe_options: Mapped[dict] = Column(JSON, nullable=True, comment='Параметры проверки (по типу проверки)')
+    updated_at: Mapped[datetime] = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now(),
+        comment='Время изменения (обновляется триггером)'
+    )
 
 
 class SwCoreResourceAvailabilityStatistics(Base):
     """ Таблица для хранения данных отслеживания доступности ресурсов. """
     __tablename__ = 'sw_core_resource_availability_statistics'
+    __table_args__ = (
+        # Покрывающий индекс для компоновки: выборка и удаление замеров ресурса по времени
+        Index(
+            'ix_sw_core_resource_availability_statistics_resource_created_at', 'resource', 'created_at',
+            postgresql_include=['is_available', 'avg_latency'],
+        ),
+        # Секции по времени создаются заранее и удаляются целиком (check_resources.partitions)
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
 
     id: Mapped[UUID] = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    created_at: Mapped[datetime] = Column(DateTime(timezone=True), server_default=func.now())
+    # Ключ секционирования входит в первичный ключ
+    created_at: Mapped[datetime] = Column(
+        DateTime(timezone=True), primary_key=True, nullable=False, server_default=func.now()
+    )
     updated_at: Mapped[datetime] = Column(DateTime(timezone=True), server_onupdate=func.now())
     is_available: Mapped[datetime] = Column(Boolean, default=False)
     resource = Column("resource", UUID, ForeignKey("sw_core_resources.id"))
+    min_latency: Mapped[float] = Column(DOUBLE_PRECISION, nullable=True, comment='Минимальная задержка (мс)')
+    avg_latency: Mapped[float] = Column(DOUBLE_PRECISION, nullable=True, comment='Средняя задержка (мс)')
+    max_latency: Mapped[float] = Column(DOUBLE_PRECISION, nullable=True, comment='Максимальная задержка (мс)')
+    failures_count: Mapped[int] = Column(SmallInteger, nullable=False, default=0, comment='Неудачных попыток')
 
 
 class SwCoreResourceAvailabilityStatisticsTestStorage(Base):
     """ ВРЕМЕННАЯ ДЛЯ ТЕСТОВ Таблица для хранения данных отслеживания доступности ресурсов. """
     __tablename__ = 'sw_core_resource_availability_statistics_test_storage'
+    __table_args__ = (
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
 
     id: Mapped[UUID] = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    created_at: Mapped[datetime] = Column(DateTime(timezone=True), server_default=func.now())
+    created_at: Mapped[datetime] = Column(
+        DateTime(timezone=True), primary_key=True, nullable=False, server_default=func.now()
+    )
     updated_at: Mapped[datetime] = Column(DateTime(timezone=True), server_onupdate=func.now())
     is_available: Mapped[datetime] = Column(Boolean, default=False)
     resource = Column("resource", UUID, ForeignKey("sw_core_resources.id"))
+    min_latency: Mapped[float] = Column(DOUBLE_PRECISION, nullable=True, comment='Минимальная задержка (мс)')
+    avg_latency: Mapped[float] = Column(DOUBLE_PRECISION, nullable=True, comment='Средняя задержка (мс)')
+    max_latency: Mapped[float] = Column(DOUBLE_PRECISION, nullable=True, comment='Максимальная задержка (мс)')
+    failures_count: Mapped[int] = Column(SmallInteger, nullable=False, default=0, comment='Неудачных попыток')
 
 
 class SwCoreResourceAvailabilityCompare(Base):
     """ Подготовленная таблица из SwCoreResourceAvailabilityStatistics
     для хранения данных отслеживания доступности ресурсов. """
     __tablename__ = 'sw_core_resource_availability_compare'
+    __table_args__ = (
+        Index('ix_sw_core_resource_availability_compare_resource_state_time_to', 'resource', 'is_available', 'time_to'),
+    )
 
     id: Mapped[UUID] = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     time_from = Column(DateTime(timezone=True), nullable=False)
     time_to = Column(DateTime(timezone=True), nullable=False)
     is_available: Mapped[datetime] = Column(Boolean, default=False)
     resource = Column("resource", UUID, ForeignKey("sw_core_resources.id"))
+    latency_p50: Mapped[float] = Column(DOUBLE_PRECISION, nullable=True, comment='Медиана задержки (мс)')
+    latency_p95: Mapped[float] = Column(DOUBLE_PRECISION, nullable=True, comment='95-й перцентиль задержки (мс)')
+    latency_p99: Mapped[float] = Column(DOUBLE_PRECISION, nullable=True, comment='99-й перцентиль задержки (мс)')
+    latency_sketch = Column(JSON, nullable=True, comment='Корзины скетча задержки для продления интервала')
+
+
+class SwCoreCompactionCheckpoint(Base):
+    """ Контрольная точка компоновки ресурса: водяной знак и открытый (последний) интервал. """
+    __tablename__ = 'sw_core_compaction_checkpoint'
+
+    resource = Column("resource", UUID, ForeignKey("sw_core_resources.id"), primary_key=True)
+    watermark: Mapped[datetime] = Column(
+        DateTime(timezone=True), nullable=False, comment='Время последнего скомпонованного замера'
+    )
+    open_interval = Column(
+        "open_interval", UUID, ForeignKey("sw_core_resource_availability_compare.id"), nullable=True,
+        comment='Интервал, который может быть продлен следующими замерами'
+    )
+
+
+class SwCoreWorkers(Base):
+    """ Живые экземпляры sw-core в режиме шардирования. """
+    __tablename__ = 'sw_core_workers'
+
+    worker_id: Mapped[str] = Column(String(length=250), primary_key=True, comment='Идентификатор экземпляра')
+    started_at: Mapped[datetime] = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    heartbeat_at: Mapped[datetime] = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now(), comment='Время последнего сигнала'
+    )
+
+
+class SwCorePartitionLeases(Base):
+    """ Аренда партиций ресурсов экземплярами sw-core. """
+    __tablename__ = 'sw_core_partition_leases'
+
+    partition: Mapped[int] = Column(Integer, primary_key=True, autoincrement=False, comment='Номер партиции')
+    worker_id: Mapped[str] = Column(String(length=250), nullable=False, comment='Владелец аренды')
+    expires_at: Mapped[datetime] = Column(DateTime(timezone=True), nullable=False, comment='Окончание аренды')
+
+
+class SwCoreResourceAvailabilityBitmap(Base):
+    """ Компактная история проверок: битовые карты слотов ресурса за период (check_resources.bitmap_history). """
+    __tablename__ = 'sw_core_resource_availability_bitmap'
+
+    resource = Column("resource", UUID, ForeignKey("sw_core_resources.id"), primary_key=True)
+    bucket_start: Mapped[datetime] = Column(
+        DateTime(timezone=True), primary_key=True, comment='Начало периода (выровнено по длительности периода)'
+    )
+    slot_seconds: Mapped[int] = Column(SmallInteger, nullable=False, comment='Длительность слота (в секундах)')
+    probed: Mapped[bytes] = Column(LargeBinary, nullable=False, comment='Битовая карта проверенных слотов')
+    failed: Mapped[bytes] = Column(LargeBinary, nullable=False, comment='Битовая карта слотов с отказом')
+
+
+class SwCoreResourceAvailabilityHourly(Base):
+    """ Почасовые итоги доступности ресурса, обновляются компоновкой (check_resources.rollups). """
+    __tablename__ = 'sw_core_resource_availability_hourly'
+
+    resource = Column("resource", UUID, ForeignKey("sw_core_resources.id"), primary_key=True)
+    bucket_start: Mapped[datetime] = Column(DateTime(timezone=True), primary_key=True, comment='Начало часа (UTC)')
+    up_seconds: Mapped[float] = Column(DOUBLE_PRECISION, nullable=False, default=0, comment='Секунд доступности')
+    down_seconds: Mapped[float] = Column(DOUBLE_PRECISION, nullable=False, default=0, comment='Секунд недоступности')
+    outages_count: Mapped[int] = Column(Integer, nullable=False, default=0, comment='Начавшихся отказов')
+    recoveries_count: Mapped[int] = Column(Integer, nullable=False, default=0, comment='Завершившихся отказов')
+    recovery_seconds: Mapped[float] = Column(
+        DOUBLE_PRECISION, nullable=False, default=0, comment='Суммарная длительность завершившихся отказов'
+    )
+
+
+class SwCoreResourceAvailabilityDaily(Base):
+    """ Суточные итоги доступности ресурса, обновляются компоновкой (check_resources.rollups). """
+    __tablename__ = 'sw_core_resource_availability_daily'
+
+    resource = Column("resource", UUID, ForeignKey("sw_core_resources.id"), primary_key=True)
+    bucket_start: Mapped[datetime] = Column(DateTime(timezone=True), primary_key=True, comment='Начало суток (UTC)')
+    up_seconds: Mapped[float] = Column(DOUBLE_PRECISION, nullable=False, default=0, comment='Секунд доступности')
+    down_seconds: Mapped[float] = Column(DOUBLE_PRECISION, nullable=False, default=0, comment='Секунд недоступности')
+    outages_count: Mapped[int] = Column(Integer, nullable=False, default=0, comment='Начавшихся отказов')
+    recoveries_count: Mapped[int] = Column(Integer, nullable=False, default=0, comment='Завершившихся отказов')
+    recovery_seconds: Mapped[float] = Column(
+        DOUBLE_PRECISION, nullable=False, default=0, comment='Суммарная длительность завершившихся отказов'
+    )
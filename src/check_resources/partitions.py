@@ -0,0 +1,224 @@
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import settings
+from app.database import AsyncDBAdapter
+from app.services.logger import SWCoreLogger
+from check_resources.models import SwCoreCompactionCheckpoint, SwCoreResources
+
+LOGGER = SWCoreLogger().get_logger()
+
+# Таблицы сырых замеров, секционированные по created_at
+PARTITIONED_TABLES = (
+    'sw_core_resource_availability_statistics',
+    'sw_core_resource_availability_statistics_test_storage',
+)
+# Формат суффикса имени секции по размеру секции
+PARTITION_NAME_FORMATS = {
+    'day': '%Y%m%d',
+    'hour': '%Y%m%d%H',
+}
+PARTITION_INTERVALS = {
+    'day': timedelta(days=1),
+    'hour': timedelta(hours=1),
+}
+# Ключ рекомендательной блокировки: обслуживание секций выполняет один экземпляр за раз
+PARTITION_MAINTENANCE_LOCK_ID = 0x5C0E_0013
+
+
+def get_partition_start(moment: datetime, interval: str) -> datetime:
+    """ Начало секции (по UTC), в которую попадает момент. """
+    moment = moment.astimezone(timezone.utc)
+    if interval == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def get_partition_name(table: str, start: datetime, interval: str) -> str:
+    return f"{table}_p{start.strftime(PARTITION_NAME_FORMATS[interval])}"
+
+
+def parse_partition_name(table: str, name: str) -> Optional[Tuple[datetime, datetime]]:
+    """ Границы секции по ее имени или None для секций не по схеме имен (например, DEFAULT). """
+    match = re.fullmatch(rf"{re.escape(table)}_p(\d{{8}}|\d{{10}})", name)
+    if match is None:
+        return None
+    interval = 'day' if len(match.group(1)) == 8 else 'hour'
+    start = datetime.strptime(match.group(1), PARTITION_NAME_FORMATS[interval]).replace(tzinfo=timezone.utc)
+    return start, start + PARTITION_INTERVALS[interval]
+
+
+def get_partition_bounds_sql(start: datetime, interval: str) -> str:
+    end = start + PARTITION_INTERVALS[interval]
+    return f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+
+
+def get_create_partition_sql(table: str, start: datetime, interval: str) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {get_partition_name(table, start, interval)} PARTITION OF {table} "
+        f"{get_partition_bounds_sql(start, interval)}"
+    )
+
+
+def get_default_partition_name(table: str) -> str:
+    return f"{table}_default"
+
+
+def iter_partition_starts(time_from: datetime, time_to: datetime, interval: str) -> Iterable[datetime]:
+    """ Начала секций, покрывающих промежуток [time_from, time_to]. """
+    start = get_partition_start(time_from, interval)
+    while start <= time_to:
+        yield start
+        start += PARTITION_INTERVALS[interval]
+
+
+class PartitionManager:
+    """
+    Обслуживание секций таблиц сырых замеров: заранее создает секции на partitions_ahead периодов вперед
+    и целиком отсоединяет (DETACH) или удаляет (DROP) секции старше retention часов вместо построчного DELETE.
+    Секция снимается, только если все ее строки уже скомпонованы: конец секции не позже наименьшего водяного
+    знака компоновки активных ресурсов и самого старого еще не записанного результата (unwritten_since).
+    Секция DEFAULT (создается миграцией) принимает строки, для которых секция не была создана вовремя;
+    при обслуживании такие строки переносятся в секции своих периодов, которые затем снимаются по сроку хранения,
+    иначе создание секции на период со строками в DEFAULT завершилось бы ошибкой.
+    """
+
+    def __init__(
+            self,
+            tables: Iterable[str] = PARTITIONED_TABLES,
+            interval: str = settings.RAW_STATISTICS_PARTITION_INTERVAL,
+            partitions_ahead: int = settings.RAW_STATISTICS_PARTITIONS_AHEAD,
+            retention_in_hours: float = settings.RAW_STATISTICS_RETENTION_IN_HOURS,
+            retention_action: str = settings.RAW_STATISTICS_RETENTION_ACTION,
+            unwritten_since: Optional[Callable[[], Optional[datetime]]] = None,
+    ):
+        """
+        :param unwritten_since: Время самого старого еще не записанного в БД результата (None - все записано)
+        """
+        self.tables = tuple(tables)
+        self.interval = interval
+        self.partitions_ahead = partitions_ahead
+        self.retention = timedelta(hours=retention_in_hours)
+        self.retention_action = retention_action
+        self.unwritten_since = unwritten_since
+
+    async def _get_partitions(self, session: AsyncSession, table: str) -> Dict[str, Tuple[datetime, datetime]]:
+        query = await session.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = :table"
+        ), {'table': table})
+        partitions = {}
+        for name in query.scalars():
+            bounds = parse_partition_name(table, name)
+            if bounds is not None:
+                partitions[name] = bounds
+        return partitions
+
+    async def _get_default_starts(self, session: AsyncSession, table: str) -> List[datetime]:
+        """ Начала периодов, строки которых попали в секцию DEFAULT. """
+        query = await session.execute(text(
+            f"SELECT DISTINCT date_trunc(:interval, created_at AT TIME ZONE 'UTC') "
+            f"FROM {get_default_partition_name(table)}"
+        ), {'interval': self.interval})
+        return sorted(start.replace(tzinfo=timezone.utc) for start in query.scalars())
+
+    async def _create_partition(self, session: AsyncSession, table: str, start: datetime, has_default_rows: bool):
+        """
+        Создаст секцию периода. Строки периода из DEFAULT переносятся в новую таблицу, которая затем
+        присоединяется как секция (присоединение проверяет, что в DEFAULT не осталось строк периода).
+        """
+        if not has_default_rows:
+            await session.execute(text(get_create_partition_sql(table, start, self.interval)))
+            return
+        name = get_partition_name(table, start, self.interval)
+        default_name = get_default_partition_name(table)
+        bounds = {'time_from': start, 'time_to': start + PARTITION_INTERVALS[self.interval]}
+        await session.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+        moved = await session.execute(text(
+            f"WITH moved AS (DELETE FROM {default_name} WHERE created_at >= :time_from AND created_at < :time_to "
+            f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+        ), bounds)
+        await session.execute(text(
+            f"ALTER TABLE {table} ATTACH PARTITION {name} {get_partition_bounds_sql(start, self.interval)}"
+        ))
+        LOGGER.warning("Из секции DEFAULT таблицы %s в секцию %s перенесено %s строк", table, name, moved.rowcount)
+
+    async def _create_ahead(self, session: AsyncSession, table: str, now: datetime) -> List[str]:
+        """ Создаст секции на partitions_ahead периодов вперед и на периоды строк, попавших в DEFAULT. """
+        created = []
+        partitions = await self._get_partitions(session, table)
+        default_starts = set(await self._get_default_starts(session, table))
+        time_to = now + PARTITION_INTERVALS[self.interval] * self.partitions_ahead
+        for start in sorted(default_starts.union(iter_partition_starts(now, time_to, self.interval))):
+            name = get_partition_name(table, start, self.interval)
+            if name not in partitions:
+                await self._create_partition(session, table, start, start in default_starts)
+                created.append(name)
+        return created
+
+    async def _get_retention_bound(self, session: AsyncSession, now: datetime) -> Optional[datetime]:
+        """
+        Секции, закончившиеся не позже этого момента, можно снять: срок хранения истек, и их строки скомпонованы
+        (None - снимать нельзя: есть активные ресурсы, которые еще не компоновались).
+        """
+        checkpoint = SwCoreCompactionCheckpoint
+        query = await session.execute(
+            select(func.min(checkpoint.watermark), func.count() - func.count(checkpoint.watermark)).select_from(
+                SwCoreResources
+            ).outerjoin(checkpoint, checkpoint.resource == SwCoreResources.id).where(SwCoreResources.is_active)
+        )
+        compacted_until, not_compacted = query.one()
+        if not_compacted:
+            return None
+        bounds = [now - self.retention]
+        if compacted_until is not None:
+            bounds.append(compacted_until)
+        unwritten_since = self.unwritten_since() if self.unwritten_since is not None else None
+        if unwritten_since is not None:
+            bounds.append(unwritten_since)
+        return min(bounds)
+
+    async def _apply_retention(self, session: AsyncSession, table: str, bound: Optional[datetime]) -> List[str]:
+        removed = []
+        if bound is None:
+            return removed
+        for name, (_, end) in sorted((await self._get_partitions(session, table)).items()):
+            if end > bound:
+                continue
+            if self.retention_action == 'detach':
+                await session.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            else:
+                await session.execute(text(f"DROP TABLE {name}"))
+            removed.append(name)
+        return removed
+
+    async def maintain(self, tick_index: int = 0):
+        """ Создаст недостающие секции и применит срок хранения ко всем таблицам. """
+        start = time.perf_counter()
+        now = datetime.now(timezone.utc)
+        async with AsyncDBAdapter().get_session() as session:
+            await session.execute(
+                text("SELECT pg_advisory_xact_lock(:lock_id)"), {'lock_id': PARTITION_MAINTENANCE_LOCK_ID}
+            )
+            bound = await self._get_retention_bound(session, now)
+            if bound is None or bound < now - self.retention:
+                LOGGER.warning(
+                    "Срок хранения сырых замеров ограничен компоновкой: секции снимаются до %s (по сроку - до %s)",
+                    bound, now - self.retention,
+                )
+            for table in self.tables:
+                created = await self._create_ahead(session, table, now)
+                removed = await self._apply_retention(session, table, bound)
+                if created or removed:
+                    LOGGER.info(
+                        "Секции %s: создано %s %s, %s %s %s", table, len(created), created,
+                        'отсоединено' if self.retention_action == 'detach' else 'удалено', len(removed), removed,
+                    )
+        LOGGER.info("Обслуживание секций за %0.3f секунд", time.perf_counter() - start)
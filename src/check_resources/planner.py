@@ -0,0 +1,123 @@
+import math
+import zlib
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+from app import settings
+from check_resources.registry import App
+
+
+def get_resource_slot(resource_id) -> float:
+    """ Стабильная для ресурса доля [0, 1), по которой выбираются его тик и сдвиг внутри тика. """
+    return zlib.crc32(str(resource_id).encode()) / 2 ** 32
+
+
+class ProbePlan(NamedTuple):
+    app: App
+    # Задержка проверки от начала тика (в секундах)
+    delay: float
+    # Количество попыток подключения (None - по умолчанию движка проверок)
+    attempts: Optional[int] = None
+
+
+class ProbePlanner:
+    """
+    Распределение проверок по тикам сбора. Ресурс с периодом проверки probe_interval проверяется
+    раз в probe_interval / tick_period тиков, а ресурсы с одинаковым периодом разнесены
+    по разным тикам и по времени внутри тика, чтобы не открывать все соединения одновременно.
+
+    В адаптивном режиме (включается явно, IS_ADAPTIVE_PROBING_ENABLED) период стабильно доступного ресурса
+    удваивается после каждых backoff_step успешных проверок подряд (но не больше max_staleness секунд),
+    а такие проверки делают меньше попыток. Любой отказ возвращает ресурсу исходный период, а смена состояния
+    отдается на перепроверку. Цена - задержка обнаружения: отказ стабильного ресурса замечается не позже чем
+    через max(max_staleness, probe_interval) плюс tick_period секунд после начала (без адаптивного режима -
+    через probe_interval плюс tick_period), поэтому max_staleness держится в масштабе
+    ALERTING_MIN_OUTAGE_IN_SECONDS.
+    """
+
+    def __init__(
+            self,
+            tick_period: float = settings.FREQUENCY_OF_LAUNCHING_AVAILABILITY_COLLECTION,
+            jitter_ratio: float = settings.PROBE_JITTER_RATIO,
+            is_adaptive: bool = settings.IS_ADAPTIVE_PROBING_ENABLED,
+            max_staleness: float = settings.ADAPTIVE_PROBING_MAX_STALENESS_IN_SECONDS,
+            backoff_step: int = settings.ADAPTIVE_PROBING_BACKOFF_STEP,
+            stable_attempts: int = settings.ADAPTIVE_PROBING_STABLE_ATTEMPTS,
+    ):
+        self.tick_period = tick_period
+        self.jitter_ratio = jitter_ratio
+        self.is_adaptive = is_adaptive
+        self.max_staleness = max_staleness
+        self.backoff_step = backoff_step
+        self.stable_attempts = stable_attempts
+        # Состояние адаптивного режима по ресурсам
+        self._successes_in_row: Dict[int, int] = {}
+        self._last_state: Dict[int, bool] = {}
+        self._last_probe_tick: Dict[int, int] = {}
+        # Ресурсы на перепроверке после смены состояния (в обычные тики не проверяются)
+        self.confirming: Set[int] = set()
+
+    def get_ticks_per_probe(self, app: App) -> int:
+        return max(1, round((app.probe_interval or self.tick_period) / self.tick_period))
+
+    def get_adaptive_ticks_per_probe(self, app: App) -> int:
+        ticks_per_probe = self.get_ticks_per_probe(app)
+        max_ticks_per_probe = max(ticks_per_probe, math.floor(self.max_staleness / self.tick_period))
+        backoff = self._successes_in_row.get(app.id, 0) // self.backoff_step
+        if not backoff:
+            return ticks_per_probe
+        return min(max_ticks_per_probe, ticks_per_probe * 2 ** min(backoff, max_ticks_per_probe.bit_length()))
+
+    def is_stable(self, app_id) -> bool:
+        return self._successes_in_row.get(app_id, 0) >= self.backoff_step
+
+    def get_due_probes(self, apps: Iterable[App], tick_index: int) -> List[ProbePlan]:
+        plans = []
+        for app in apps:
+            ticks_per_probe = self.get_ticks_per_probe(app)
+            position = get_resource_slot(app.id) * ticks_per_probe
+            delay = (position - math.floor(position)) * self.tick_period * self.jitter_ratio
+            last_probe_tick = self._last_probe_tick.get(app.id) if self.is_adaptive else None
+
+            if last_probe_tick is None:
+                # Целая часть - тик внутри периода ресурса, дробная - сдвиг внутри тика
+                if tick_index % ticks_per_probe != math.floor(position):
+                    continue
+            elif app.id in self.confirming or tick_index - last_probe_tick < self.get_adaptive_ticks_per_probe(app):
+                # Отсчет от последней проверки сохраняет разнесение ресурсов по тикам
+                continue
+
+            if self.is_adaptive:
+                self._last_probe_tick[app.id] = tick_index
+            plans.append(ProbePlan(
+                app=app,
+                delay=delay,
+                attempts=self.stable_attempts if self.is_adaptive and self.is_stable(app.id) else None,
+            ))
+        return plans
+
+    def observe(self, answers: Iterable) -> Set[int]:
+        """
+        Учтет результаты проверок в адаптивном режиме.
+        :param answers: Результаты проверок AvailableAnswer
+        :return: Ресурсы, у которых сменилось состояние доступности (их нужно перепроверить)
+        """
+        changed = set()
+        if not self.is_adaptive:
+            return changed
+        for answer in answers:
+            previous_state = self._last_state.get(answer.app_id)
+            # Первый отказ ресурса тоже перепроверяется: предыдущее состояние могло быть до перезапуска
+            if previous_state != answer.is_available and (previous_state is not None or not answer.is_available):
+                changed.add(answer.app_id)
+            self._last_state[answer.app_id] = answer.is_available
+            if answer.is_available:
+                self._successes_in_row[answer.app_id] = self._successes_in_row.get(answer.app_id, 0) + 1
+            else:
+                self._successes_in_row[answer.app_id] = 0
+        return changed
+
+    def forget(self, active_ids: Set):
+        """ Удалит состояние ресурсов, которых больше нет среди активных. """
+        for state in (self._successes_in_row, self._last_state, self._last_probe_tick):
+            for resource in [resource for resource in state if resource not in active_ids]:
+                del state[resource]
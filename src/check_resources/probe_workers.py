@@ -0,0 +1,287 @@
+import asyncio
+import math
+import multiprocessing
+import pickle
+import struct
+import time
+from datetime import datetime, timezone
+from multiprocessing.connection import Connection
+from typing import Dict, List, Optional, Tuple
+
+from app import settings
+from app.services.logger import SWCoreLogger
+from app.services.metrics import METRICS
+from check_resources.probes import AvailableAnswer, ProbeEngine
+
+LOGGER = SWCoreLogger().get_logger()
+
+WORKER_PROBES_PER_SECOND = METRICS.gauge(
+    'sw_core_probe_worker_probes_per_second', 'Проверок в секунду процесса проверок в последнем цикле', ['worker']
+)
+WORKER_RESTARTS = METRICS.counter(
+    'sw_core_probe_worker_restarts_total', 'Перезапусков процесса проверок (завершился или не ответил)', ['worker']
+)
+
+# Заголовок ответа процесса: количество результатов и время цикла проверок (в секундах);
+# за результатами - pickle списка упавших заданий (номер, тип и текст ошибки)
+RESULTS_HEADER = struct.Struct('<Id')
+# Результат проверки: номер задания, доступность, количество неудачных попыток, min/avg/max задержки,
+# дней до окончания срока действия сертификата (NaN - нет) и момент проверки (секунды от эпохи)
+RESULT_RECORD = struct.Struct('<IBBddddd')
+# Сколько ждать завершения процесса при остановке (в секундах)
+WORKER_JOIN_TIMEOUT_IN_SECONDS = 5
+
+
+def _to_optional(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+
+def _from_optional(value: Optional[float]) -> float:
+    return math.nan if value is None else value
+
+
+def encode_results(results: List[Tuple], elapsed: float, errors: Optional[List[Tuple]] = None) -> bytes:
+    buffer = bytearray(RESULTS_HEADER.size + RESULT_RECORD.size * len(results))
+    RESULTS_HEADER.pack_into(buffer, 0, len(results), elapsed)
+    for number, (index, is_available, failures_count, *values) in enumerate(results):
+        RESULT_RECORD.pack_into(
+            buffer, RESULTS_HEADER.size + number * RESULT_RECORD.size,
+            index, is_available, min(failures_count, 255), *(_from_optional(value) for value in values),
+        )
+    return bytes(buffer) + (pickle.dumps(errors, protocol=pickle.HIGHEST_PROTOCOL) if errors else b'')
+
+
+def decode_results(payload: bytes) -> Tuple[List[Tuple], float, List[Tuple]]:
+    """ :return: Результаты, время цикла проверок и упавшие задания (номер, тип и текст ошибки) """
+    count, elapsed = RESULTS_HEADER.unpack_from(payload, 0)
+    results_end = RESULTS_HEADER.size + count * RESULT_RECORD.size
+    results = []
+    for index, is_available, failures_count, *values in RESULT_RECORD.iter_unpack(
+            memoryview(payload)[RESULTS_HEADER.size:results_end]
+    ):
+        results.append((index, bool(is_available), failures_count, *(_to_optional(value) for value in values)))
+    errors = pickle.loads(payload[results_end:]) if len(payload) > results_end else []
+    return results, elapsed, errors
+
+
+async def _probe_job(
+        engine: ProbeEngine, index: int, host: str, port: int, delay: float, attempts: int,
+        probe_type: str, options: Optional[dict],
+) -> Tuple:
+    if delay:
+        await asyncio.sleep(delay)
+    points = await engine.measure(
+        host=host, port=port, attempts=attempts or None, probe_type=probe_type, options=options
+    )
+    latencies = [point for point in points if point is not None]
+    return (
+        index,
+        len(latencies) == len(points),
+        len(points) - len(latencies),
+        min(latencies) if latencies else None,
+        sum(latencies) / len(latencies) if latencies else None,
+        max(latencies) if latencies else None,
+        engine.get_cert_expires_in_days(host, port),
+        time.time(),
+    )
+
+
+async def _probe_jobs(engine: ProbeEngine, jobs: List[Tuple]) -> Tuple[List[Tuple], List[Tuple]]:
+    """ :return: Результаты проверок и упавшие задания (номер, тип и текст ошибки) """
+    results = await asyncio.gather(*(_probe_job(engine, *job) for job in jobs), return_exceptions=True)
+    errors = [
+        (job[0], type(result).__name__, str(result))
+        for job, result in zip(jobs, results) if isinstance(result, BaseException)
+    ]
+    return [result for result in results if not isinstance(result, BaseException)], errors
+
+
+def probe_worker_main(connection: Connection, timeout: float, concurrency: int, attempts: int):
+    """
+    Точка входа процесса проверок: собственный цикл событий и движок проверок.
+    При запуске (spawn) процесс заново импортирует этот модуль и главный модуль программы, поэтому
+    в них при импорте не создаются подключения к БД и другие общие объекты (см. main_v_2.init_services),
+    а лог процесса проверок пишется только в поток ошибок. Ошибки заданий возвращаются основному процессу.
+    Задания приходят списком (номер, хост, порт, задержка, попытки, тип и параметры проверки),
+    пустое сообщение - сигнал остановки.
+    """
+    engine = ProbeEngine(timeout=timeout, concurrency=concurrency, attempts=attempts)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        while True:
+            try:
+                payload = connection.recv_bytes()
+            except (EOFError, KeyboardInterrupt):
+                break
+            if not payload:
+                break
+            jobs = pickle.loads(payload)
+            started_at = time.perf_counter()
+            results, errors = loop.run_until_complete(_probe_jobs(engine, jobs))
+            connection.send_bytes(encode_results(results, time.perf_counter() - started_at, errors))
+    finally:
+        loop.run_until_complete(engine.close())
+        loop.close()
+        connection.close()
+
+
+class ProbeWorkerPool:
+    """
+    Координатор проверок в нескольких процессах для очень больших парков ресурсов.
+    Ресурсы цикла делятся между процессами, каждый проверяет свою часть в собственном цикле событий,
+    а результаты в компактном двоичном виде возвращаются в основной процесс, который один пишет их в БД.
+    """
+
+    def __init__(
+            self,
+            processes: int = settings.PROBE_WORKER_PROCESSES,
+            timeout: float = settings.PROBE_TIMEOUT_IN_SECONDS,
+            concurrency: int = settings.PROBE_CONCURRENCY_LIMIT,
+            attempts: int = settings.COUNT_OF_AVAILABLE_ATTEMPT,
+            response_slack: float = settings.PROBE_WORKER_RESPONSE_SLACK_IN_SECONDS,
+    ):
+        self.processes = processes
+        self.timeout = timeout
+        # Общий лимит одновременных подключений делится между процессами
+        self.concurrency = max(1, math.ceil(concurrency / processes))
+        self.attempts = attempts
+        self.response_slack = response_slack
+        self._context = multiprocessing.get_context('spawn')
+        self._workers: Dict[int, Tuple[multiprocessing.Process, Connection]] = {}
+        # Канал процесса не различает запросы: перепроверка и тик, идущие одновременно, ждут друг друга
+        self._locks: Dict[int, asyncio.Lock] = {}
+        # Проверок в секунду по каждому процессу в последнем цикле
+        self.probes_per_second: Dict[int, float] = {}
+
+    def _start_worker(self, worker_index: int):
+        parent_connection, child_connection = self._context.Pipe()
+        process = self._context.Process(
+            target=probe_worker_main,
+            args=(child_connection, self.timeout, self.concurrency, self.attempts),
+            name=f"sw-core-probe-worker-{worker_index}",
+            daemon=True,
+        )
+        process.start()
+        child_connection.close()
+        self._workers[worker_index] = (process, parent_connection)
+
+    def start(self):
+        for worker_index in range(self.processes):
+            self._start_worker(worker_index)
+        LOGGER.info("Запущено процессов проверок: %s", self.processes)
+
+    def stop(self):
+        for process, connection in self._workers.values():
+            try:
+                connection.send_bytes(b'')
+            except OSError:
+                pass
+        for process, connection in self._workers.values():
+            process.join(WORKER_JOIN_TIMEOUT_IN_SECONDS)
+            if process.is_alive():
+                process.terminate()
+            connection.close()
+        self._workers = {}
+
+    async def _probe_in_worker(self, worker_index: int, plans: List) -> List[AvailableAnswer]:
+        lock = self._locks.setdefault(worker_index, asyncio.Lock())
+        async with lock:
+            return await self._exchange(worker_index, plans)
+
+    def _restart_worker(self, worker_index: int):
+        process, connection = self._workers.pop(worker_index)
+        connection.close()
+        if process.is_alive():
+            # Зависший процесс может не обработать SIGTERM
+            process.kill()
+        process.join(WORKER_JOIN_TIMEOUT_IN_SECONDS)
+        WORKER_RESTARTS.inc(1, (str(worker_index),))
+        self._start_worker(worker_index)
+
+    def get_response_timeout(self, plans: List) -> float:
+        """
+        Наибольшее время ответа процесса на задания: каждая попытка ограничена таймаутом и занимает место
+        в лимите одновременных попыток процесса, попытки одного ресурса идут последовательно.
+        """
+        attempts = [plan.attempts or self.attempts for plan in plans]
+        rounds = max(max(attempts), math.ceil(sum(attempts) / self.concurrency))
+        return max(plan.delay for plan in plans) + rounds * self.timeout + self.response_slack
+
+    async def _exchange(self, worker_index: int, plans: List) -> List[AvailableAnswer]:
+        """
+        Отправит задания процессу и дождется ответа на них (только под блокировкой процесса).
+        Процесс, который завершился или не ответил за get_response_timeout, перезапускается, а его проверки
+        цикла пропускаются.
+        """
+        process, connection = self._workers[worker_index]
+        loop = asyncio.get_running_loop()
+        jobs = [
+            (
+                index, plan.app.host, plan.app.port, plan.delay, plan.attempts or 0,
+                plan.app.probe_type, plan.app.probe_options,
+            )
+            for index, plan in enumerate(plans)
+        ]
+        response_timeout = self.get_response_timeout(plans)
+        try:
+            connection.send_bytes(pickle.dumps(jobs, protocol=pickle.HIGHEST_PROTOCOL))
+            # Ожидание ответа блокирующее, поэтому в пуле потоков
+            is_ready = await loop.run_in_executor(None, connection.poll, response_timeout)
+            payload = await loop.run_in_executor(None, connection.recv_bytes) if is_ready else None
+        except (EOFError, OSError) as error:
+            LOGGER.error("Процесс проверок %s завершился (%s), перезапуск", worker_index, error)
+            self._restart_worker(worker_index)
+            return []
+        if payload is None:
+            LOGGER.error(
+                "Процесс проверок %s не ответил за %0.1f секунд (проверок %s), перезапуск",
+                worker_index, response_timeout, len(plans),
+            )
+            self._restart_worker(worker_index)
+            return []
+
+        results, elapsed, errors = decode_results(payload)
+        self.probes_per_second[worker_index] = len(results) / elapsed if elapsed else 0.0
+        WORKER_PROBES_PER_SECOND.set(self.probes_per_second[worker_index], (str(worker_index),))
+        LOGGER.info(
+            "Процесс проверок %s: проверок %s за %0.3f секунд, %0.0f проверок/сек",
+            worker_index, len(results), elapsed, self.probes_per_second[worker_index],
+        )
+        for index, error_type, error in errors:
+            app = plans[index].app
+            LOGGER.error(
+                "Ошибка проверки %s (%s:%s) в процессе проверок %s: %s: %s",
+                app.name, app.host, app.port, worker_index, error_type, error,
+                extra={'resource': app.id, 'error_type': error_type},
+            )
+        answers = []
+        for index, is_available, failures_count, min_latency, avg_latency, max_latency, cert_days, checked_at \
+                in results:
+            app = plans[index].app
+            answers.append(AvailableAnswer(
+                app_id=app.id,
+                app_name=app.name,
+                is_available=is_available,
+                min_latency=min_latency,
+                avg_latency=avg_latency,
+                max_latency=max_latency,
+                failures_count=failures_count,
+                checked_at=datetime.fromtimestamp(checked_at, timezone.utc),
+                cert_expires_in_days=cert_days,
+            ))
+        return answers
+
+    async def probe(self, plans: List) -> List[AvailableAnswer]:
+        """
+        Разделит проверки цикла между процессами и соберет их результаты. Ресурс всегда проверяет один и тот же
+        процесс, чтобы переиспользовались его keep-alive соединения проверок HTTP.
+        """
+        shares = [[] for _ in range(self.processes)]
+        for plan in plans:
+            shares[hash(plan.app.id) % self.processes].append(plan)
+        answers = await asyncio.gather(*(
+            self._probe_in_worker(worker_index, share)
+            for worker_index, share in enumerate(shares) if share
+        ))
+        return [answer for worker_answers in answers for answer in worker_answers]
@@ -0,0 +1,426 @@
+import asyncio
+import re
+import socket
+import ssl
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from app import settings
+from app.services.metrics import METRICS
+from check_resources.dns_cache import DNSCache
+
+PROBE_RESOLVE_SECONDS = METRICS.histogram(
+    'sw_core_probe_resolve_seconds', 'Ожидание разрешения имени ресурса перед подключением (не входит в задержку)'
+)
+
+
+class AvailableAnswer(NamedTuple):
+    app_id: int
+    app_name: str
+    is_available: bool
+    min_latency: Optional[float]
+    avg_latency: Optional[float]
+    max_latency: Optional[float]
+    failures_count: int
+    # Момент проверки (пишется в created_at, поэтому не зависит от задержки записи)
+    checked_at: Optional[datetime] = None
+    # Дней до окончания срока действия сертификата (проверки TLS и HTTPS)
+    cert_expires_in_days: Optional[float] = None
+
+
+# Типы проверок ресурса (SwCoreResources.probe_type)
+PROBE_TCP = 'tcp'
+PROBE_TLS = 'tls'
+PROBE_HTTP = 'http'
+
+
+class ProbeError(Exception):
+    """ Ресурс ответил, но ответ не прошел проверку (код ответа, тело). """
+
+
+def _read_der_header(data: bytes, offset: int) -> Tuple[int, int, int]:
+    """ Тег, начало и конец значения элемента DER. """
+    tag, length = data[offset], data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        size = length & 0x7f
+        length = int.from_bytes(data[offset:offset + size], 'big')
+        offset += size
+    return tag, offset, offset + length
+
+
+def get_certificate_expires_at(certificate: bytes) -> datetime:
+    """
+    Окончание срока действия сертификата (notAfter) из DER. Разбирается сам сертификат, поэтому срок
+    известен и без проверки цепочки (ssl.SSLObject.getpeercert() без проверки возвращает пустой словарь).
+    """
+    _, position, _ = _read_der_header(certificate, 0)
+    _, position, _ = _read_der_header(certificate, position)
+    tag, _, end = _read_der_header(certificate, position)
+    # Версия [0] необязательна
+    if tag == 0xA0:
+        position = end
+    # serialNumber, signature, issuer, затем validity (notBefore, notAfter)
+    for _ in range(3):
+        _, _, position = _read_der_header(certificate, position)
+    _, position, _ = _read_der_header(certificate, position)
+    _, _, position = _read_der_header(certificate, position)
+    tag, start, end = _read_der_header(certificate, position)
+    # 0x17 - UTCTime, 0x18 - GeneralizedTime
+    time_format = '%y%m%d%H%M%SZ' if tag == 0x17 else '%Y%m%d%H%M%SZ'
+    return datetime.strptime(certificate[start:end].decode('ascii'), time_format).replace(tzinfo=timezone.utc)
+
+
+class TCPProbe:
+    """ Проверка подключением: задержка - время connect. """
+
+    def __init__(self, engine: 'ProbeEngine'):
+        self.engine = engine
+
+    async def run(self, host: str, port: int, options: dict) -> float:
+        """ Одна попытка проверки. Вернет задержку в миллисекундах. """
+        loop = asyncio.get_running_loop()
+        family, sock_type, proto, address = await self.engine.resolve(host, port)
+        sock = socket.socket(family, sock_type, proto)
+        sock.setblocking(False)
+        try:
+            start = time.perf_counter()
+            await loop.sock_connect(sock, address)
+            return (time.perf_counter() - start) * 1000
+        finally:
+            sock.close()
+
+    async def close(self):
+        pass
+
+
+class TLSProbe(TCPProbe):
+    """
+    Проверка TLS: задержка - время рукопожатия после connect, срок действия сертификата сохраняется в движке.
+    Параметры (SwCoreResources.probe_options): server_name - имя для SNI и проверки сертификата (по умолчанию хост),
+    verify - проверять цепочку и имя (по умолчанию да), ca_file - свой файл корневых сертификатов.
+    """
+
+    def __init__(self, engine: 'ProbeEngine'):
+        super().__init__(engine)
+        # Контексты создаются дорого (загрузка корневых сертификатов), поэтому переиспользуются
+        self._contexts: Dict[Tuple, ssl.SSLContext] = {}
+
+    def get_context(self, options: dict) -> ssl.SSLContext:
+        key = (options.get('verify', True), options.get('ca_file'))
+        context = self._contexts.get(key)
+        if context is None:
+            context = ssl.create_default_context(cafile=key[1])
+            if not key[0]:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            self._contexts[key] = context
+        return context
+
+    def record_certificate(self, host: str, port: int, ssl_object: Optional[ssl.SSLObject]):
+        certificate = ssl_object.getpeercert(binary_form=True) if ssl_object is not None else None
+        if certificate:
+            self.engine.certificate_expires_at[(host, port)] = get_certificate_expires_at(certificate)
+
+    def forget_certificate(self, host: str, port: int):
+        """ Соединение TLS не установлено: срок действия прежнего сертификата больше не сообщается. """
+        self.engine.certificate_expires_at.pop((host, port), None)
+
+    async def run(self, host: str, port: int, options: dict) -> float:
+        loop = asyncio.get_running_loop()
+        family, sock_type, proto, address = await self.engine.resolve(host, port)
+        sock = socket.socket(family, sock_type, proto)
+        sock.setblocking(False)
+        transport = None
+        try:
+            await loop.sock_connect(sock, address)
+            start = time.perf_counter()
+            transport, _ = await loop.create_connection(
+                asyncio.Protocol, sock=sock, ssl=self.get_context(options),
+                server_hostname=options.get('server_name', host),
+            )
+            latency = (time.perf_counter() - start) * 1000
+            self.record_certificate(host, port, transport.get_extra_info('ssl_object'))
+            return latency
+        except BaseException:
+            # Включая отмену по таймауту посреди рукопожатия
+            self.forget_certificate(host, port)
+            raise
+        finally:
+            if transport is not None:
+                transport.abort()
+            else:
+                sock.close()
+
+
+class HTTPConnection(NamedTuple):
+    reader: asyncio.StreamReader
+    writer: asyncio.StreamWriter
+    released_at: float
+
+
+class HTTPProbe(TLSProbe):
+    """
+    Проверка HTTP(S) по keep-alive соединениям, которые переиспользуются между циклами проверок,
+    поэтому connect и рукопожатие TLS выполняются только для нового соединения. Задержка - время от отправки
+    запроса до получения всего ответа. Соединение, закрытое сервером за время простоя, заменяется новым
+    с одним повтором запроса. Параметры (SwCoreResources.probe_options): tls - HTTPS, path (по умолчанию '/'),
+    method (по умолчанию GET), headers, expected_status - код или список кодов (по умолчанию любой меньше 400),
+    body_match - регулярное выражение, которое должно найтись в теле ответа, а также параметры TLSProbe.
+    """
+
+    def __init__(
+            self,
+            engine: 'ProbeEngine',
+            idle_timeout: float = settings.HTTP_PROBE_IDLE_TIMEOUT_IN_SECONDS,
+            max_idle_connections: int = settings.HTTP_PROBE_MAX_IDLE_CONNECTIONS,
+            max_body_bytes: int = settings.HTTP_PROBE_MAX_BODY_BYTES,
+    ):
+        super().__init__(engine)
+        self.idle_timeout = idle_timeout
+        self.max_idle_connections = max_idle_connections
+        self.max_body_bytes = max_body_bytes
+        self.connections_count = 0
+        # Простаивающие соединения по ресурсу (хост, порт, TLS, имя сервера, проверка сертификата, файл CA):
+        # соединение, проверенное с одними параметрами TLS, не достается ресурсу с другими
+        self._idle: Dict[Tuple, List[HTTPConnection]] = {}
+        self._patterns: Dict[str, re.Pattern] = {}
+
+    @staticmethod
+    def _get_key(host: str, port: int, options: dict) -> Tuple:
+        return (
+            host, port, bool(options.get('tls')), options.get('server_name', host),
+            bool(options.get('verify', True)), options.get('ca_file'),
+        )
+
+    async def _open(self, host: str, port: int, options: dict) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        _, _, _, address = await self.engine.resolve(host, port)
+        is_tls = bool(options.get('tls'))
+        try:
+            reader, writer = await asyncio.open_connection(
+                address[0], address[1],
+                ssl=self.get_context(options) if is_tls else None,
+                server_hostname=options.get('server_name', host) if is_tls else None,
+            )
+        except BaseException:
+            if is_tls:
+                self.forget_certificate(host, port)
+            raise
+        self.connections_count += 1
+        if is_tls:
+            self.record_certificate(host, port, writer.get_extra_info('ssl_object'))
+        return reader, writer
+
+    def _acquire(self, key: Tuple) -> Optional[HTTPConnection]:
+        idle = self._idle.get(key)
+        while idle:
+            connection = idle.pop()
+            if connection.reader.at_eof() or time.monotonic() - connection.released_at > self.idle_timeout:
+                connection.writer.close()
+                continue
+            return connection
+        return None
+
+    def _release(self, key: Tuple, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        idle = self._idle.setdefault(key, [])
+        if len(idle) >= self.max_idle_connections:
+            writer.close()
+            return
+        idle.append(HTTPConnection(reader, writer, time.monotonic()))
+
+    @staticmethod
+    def _get_request(host: str, port: int, options: dict) -> bytes:
+        headers = {'Host': f"{host}:{port}", 'User-Agent': 'sw-core', 'Accept': '*/*', 'Connection': 'keep-alive'}
+        headers.update(options.get('headers') or {})
+        lines = [f"{options.get('method', 'GET')} {options.get('path', '/')} HTTP/1.1"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def _read_body(self, reader: asyncio.StreamReader, headers: Dict[str, str]) -> Tuple[bytes, bool]:
+        """ Тело ответа (не длиннее max_body_bytes) и можно ли переиспользовать соединение. """
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            size = 0
+            while True:
+                chunk_size = int((await reader.readline()).split(b';', 1)[0], 16)
+                if chunk_size == 0:
+                    # Завершающие заголовки не используются
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    return b''.join(chunks), True
+                size += chunk_size
+                if size > self.max_body_bytes:
+                    return b''.join(chunks), False
+                chunks.append(await reader.readexactly(chunk_size))
+                await reader.readexactly(2)
+        if 'content-length' in headers:
+            length = int(headers['content-length'])
+            if length > self.max_body_bytes:
+                return await reader.readexactly(self.max_body_bytes), False
+            return await reader.readexactly(length), True
+        # Без длины тело заканчивается закрытием соединения
+        return await reader.read(self.max_body_bytes), False
+
+    async def _request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, options: dict,
+                       request: bytes) -> Tuple[int, bytes, bool]:
+        writer.write(request)
+        await writer.drain()
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Соединение закрыто сервером")
+        version, status = status_line.split(None, 2)[:2]
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if options.get('method', 'GET') == 'HEAD' or status in (b'204', b'304'):
+            body, is_reusable = b'', True
+        else:
+            body, is_reusable = await self._read_body(reader, headers)
+        is_reusable = is_reusable and version == b'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        return int(status), body, is_reusable
+
+    def _check(self, status: int, body: bytes, options: dict):
+        expected_status = options.get('expected_status')
+        if expected_status is None:
+            if status >= 400:
+                raise ProbeError(f"HTTP {status}")
+        elif status not in (expected_status if isinstance(expected_status, list) else [expected_status]):
+            raise ProbeError(f"HTTP {status}, ожидался {expected_status}")
+        body_match = options.get('body_match')
+        if body_match:
+            pattern = self._patterns.get(body_match)
+            if pattern is None:
+                pattern = self._patterns[body_match] = re.compile(body_match.encode())
+            if pattern.search(body) is None:
+                raise ProbeError(f"Тело ответа не соответствует {body_match!r}")
+
+    async def run(self, host: str, port: int, options: dict) -> float:
+        key = self._get_key(host, port, options)
+        request = self._get_request(host, port, options)
+        for attempt in range(2):
+            connection = self._acquire(key)
+            if connection is not None:
+                reader, writer = connection.reader, connection.writer
+            else:
+                reader, writer = await self._open(host, port, options)
+            try:
+                start = time.perf_counter()
+                status, body, is_reusable = await self._request(reader, writer, options, request)
+                latency = (time.perf_counter() - start) * 1000
+            except (ConnectionError, asyncio.IncompleteReadError) as error:
+                writer.close()
+                # Сервер мог закрыть простаивающее соединение: повтор через новое
+                if connection is not None and not attempt:
+                    continue
+                raise ProbeError(f"Ответ не получен: {error!r}") from error
+            except (ValueError, IndexError) as error:
+                writer.close()
+                raise ProbeError(f"Некорректный ответ HTTP: {error!r}") from error
+            except BaseException:
+                # Таймаут (отмена) посреди ответа: состояние соединения неизвестно
+                writer.close()
+                raise
+            if is_reusable:
+                self._release(key, reader, writer)
+            else:
+                writer.close()
+            self._check(status, body, options)
+            return latency
+
+    async def close(self):
+        idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.writer.close()
+
+
+# Типы проверок: расширяются добавлением класса с методами run и close
+PROBE_TYPES = {
+    PROBE_TCP: TCPProbe,
+    PROBE_TLS: TLSProbe,
+    PROBE_HTTP: HTTPProbe,
+}
+
+
+class ProbeEngine:
+    """
+    Асинхронные проверки доступности ресурсов по типу проверки ресурса (PROBE_TYPES).
+    Один семафор ограничивает одновременные попытки всех типов, имена ресурсов разрешаются через общий кэш.
+    """
+
+    def __init__(
+            self,
+            timeout: float = settings.PROBE_TIMEOUT_IN_SECONDS,
+            concurrency: int = settings.PROBE_CONCURRENCY_LIMIT,
+            attempts: int = settings.COUNT_OF_AVAILABLE_ATTEMPT,
+            dns_cache: Optional[DNSCache] = None,
+    ):
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.attempts = attempts
+        self.dns_cache = dns_cache or DNSCache()
+        # Семафор создается в работающем цикле событий при первой проверке
+        self._semaphore = None
+        self.probes = {probe_type: probe_class(self) for probe_type, probe_class in PROBE_TYPES.items()}
+        # Окончание срока действия сертификата по (хост, порт) из последнего рукопожатия TLS
+        self.certificate_expires_at: Dict[Tuple[str, int], datetime] = {}
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    def _get_probe(self, probe_type: str) -> TCPProbe:
+        probe = self.probes.get(probe_type)
+        if probe is None:
+            raise ValueError(f"Неизвестный тип проверки ресурса: {probe_type}")
+        return probe
+
+    async def resolve(self, host: str, port: int) -> Tuple:
+        """ Семейство, тип сокета, протокол и адрес для подключения к ресурсу. """
+        start = time.perf_counter()
+        try:
+            return await self.dns_cache.resolve(host, port)
+        finally:
+            PROBE_RESOLVE_SECONDS.observe(time.perf_counter() - start)
+
+    async def latency_point(
+            self, host: str, port: int, probe_type: str = PROBE_TCP, options: Optional[dict] = None
+    ) -> Optional[float]:
+        """
+        Замена tcp_latency.latency_point, не блокирующая цикл событий.
+        :return: Задержка в миллисекундах или None, если ресурс недоступен
+        """
+        probe = self._get_probe(probe_type)
+        async with self._get_semaphore():
+            try:
+                return await asyncio.wait_for(probe.run(host, port, options or {}), timeout=self.timeout)
+            except (OSError, asyncio.TimeoutError, ProbeError):
+                return None
+
+    async def measure(
+            self, host: str, port: int, attempts: Optional[int] = None,
+            probe_type: str = PROBE_TCP, options: Optional[dict] = None,
+    ) -> List[Optional[float]]:
+        """ Последовательно выполнит attempts попыток проверки ресурса. """
+        points = []
+        for _ in range(attempts or self.attempts):
+            points.append(await self.latency_point(host=host, port=port, probe_type=probe_type, options=options))
+        return points
+
+    def get_cert_expires_in_days(self, host: str, port: int) -> Optional[float]:
+        expires_at = self.certificate_expires_at.get((host, port))
+        if expires_at is None:
+            return None
+        return (expires_at - datetime.now(timezone.utc)).total_seconds() / 86400
+
+    async def close(self):
+        """ Закроет простаивающие соединения проверок и остановит обновления кэша имен. """
+        for probe in self.probes.values():
+            await probe.close()
+        await self.dns_cache.close()
@@ -0,0 +1,121 @@
+import asyncio
+import time
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import select, func
+
+from app import settings
+from app.database import AsyncDBAdapter, async_engine
+from app.services.logger import SWCoreLogger
+from check_resources.models import SwCoreResources
+
+LOGGER = SWCoreLogger().get_logger()
+
+
+class App(NamedTuple):
+    id: int
+    name: str
+    description: str
+    host: str
+    port: int
+    is_active: bool
+    probe_interval: Optional[int] = None
+    probe_type: str = 'tcp'
+    probe_options: Optional[dict] = None
+
+
+class ResourceRegistry:
+    """
+    Активные ресурсы в памяти процесса. Перечитываются из БД только при изменении таблицы
+    SwCoreResources: по уведомлению PostgreSQL (LISTEN/NOTIFY, триггер из миграции) или,
+    если уведомления недоступны, по проверке версии таблицы раз в ttl секунд.
+    """
+
+    def __init__(
+            self,
+            ttl: float = settings.RESOURCE_REGISTRY_TTL_IN_SECONDS,
+            channel: str = settings.RESOURCE_REGISTRY_NOTIFY_CHANNEL,
+    ):
+        self.ttl = ttl
+        self.channel = channel
+        self.apps: List[App] = []
+        # Версия таблицы: время последнего изменения и количество строк
+        self._version = None
+        self._checked_at: Optional[float] = None
+        self._is_dirty = True
+        self._listener_connection = None
+
+    def _on_notify(self, *args):
+        self._is_dirty = True
+
+    def _on_listener_terminated(self, *args):
+        LOGGER.warning("Соединение LISTEN %s потеряно, реестр ресурсов будет перечитан", self.channel)
+        connection, self._listener_connection = self._listener_connection, None
+        self._is_dirty = True
+        if connection is not None:
+            asyncio.ensure_future(connection.invalidate())
+
+    async def _listen(self):
+        """ Подпишется на уведомления об изменении ресурсов (только для бэкенда postgresql). """
+        if async_engine.dialect.name != 'postgresql':
+            return
+        connection = None
+        try:
+            connection = await async_engine.connect()
+            raw_connection = await connection.get_raw_connection()
+            await raw_connection.driver_connection.add_listener(self.channel, self._on_notify)
+            raw_connection.driver_connection.add_termination_listener(self._on_listener_terminated)
+            self._listener_connection = connection
+        except Exception as error:
+            if connection is not None:
+                await connection.close()
+            LOGGER.warning("Не удалось подписаться на %s, реестр обновляется по ttl: %r", self.channel, error)
+
+    async def close(self):
+        if self._listener_connection is not None:
+            await self._listener_connection.close()
+            self._listener_connection = None
+
+    def _is_expired(self) -> bool:
+        return self._checked_at is None or time.monotonic() - self._checked_at > self.ttl
+
+    async def refresh(self):
+        """ Проверит версию таблицы ресурсов и перечитает ресурсы, если она изменилась. """
+        # Подписка оформляется до чтения, чтобы не пропустить изменения между чтением и подпиской
+        if self._listener_connection is None:
+            await self._listen()
+
+        is_dirty, self._is_dirty = self._is_dirty, False
+        async with AsyncDBAdapter().get_session() as session:
+            query = await session.execute(select(func.max(SwCoreResources.updated_at), func.count()))
+            version = tuple(query.one())
+            if is_dirty or version != self._version:
+                query = await session.execute(select(SwCoreResources).filter(SwCoreResources.is_active == True))
+                self.apps = [
+                    App(
+                        id=item.id,
+                        name=item.name,
+                        description=item.description,
+                        host=item.host,
+                        port=item.port,
+                        is_active=item.is_active,
+                        probe_interval=item.probe_interval,
+                        probe_type=item.probe_type,
+                        probe_options=item.probe_options,
+                    )
+                    for item in query.scalars()
+                ]
+                LOGGER.info("Реестр ресурсов перечитан: активных ресурсов %s", len(self.apps))
+        self._version = version
+        self._checked_at = time.monotonic()
+
+    async def get_apps(self) -> List[App]:
+        """ Активные ресурсы. Обращается к БД только при изменении таблицы или по истечении ttl. """
+        if self._is_dirty or self._is_expired():
+            try:
+                await self.refresh()
+            except Exception as error:
+                # Пока БД недоступна, работаем с последним прочитанным списком, следующий вызов повторит попытку
+                self._is_dirty = True
+                LOGGER.error("Не удалось обновить реестр ресурсов: %r", error)
+        return self.apps
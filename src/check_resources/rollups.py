@@ -0,0 +1,217 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select, delete, func, or_, and_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import settings
+from app.database import AsyncDBAdapter, get_rows_chunks
+from app.services.logger import SWCoreLogger
+from check_resources.models import SwCoreResourceAvailabilityHourly, SwCoreResourceAvailabilityDaily, \
+    SwCoreResourceAvailabilityCompare
+
+LOGGER = SWCoreLogger().get_logger()
+
+ROLLUP_MODELS = {
+    'hour': SwCoreResourceAvailabilityHourly,
+    'day': SwCoreResourceAvailabilityDaily,
+}
+ROLLUP_PERIODS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+}
+# Накапливаемые колонки итогов (в порядке значений дельты)
+ROLLUP_COLUMNS = ('up_seconds', 'down_seconds', 'outages_count', 'recoveries_count', 'recovery_seconds')
+
+
+class IntervalBounds(NamedTuple):
+    id: object
+    time_from: datetime
+    time_to: datetime
+    is_available: bool
+
+
+class UptimeReport(NamedTuple):
+    resource: object
+    time_from: datetime
+    time_to: datetime
+    up_seconds: float
+    down_seconds: float
+    # None - за окно нет данных
+    uptime_percent: Optional[float]
+    outages_count: int
+    # Среднее время восстановления (в секундах), None - за окно не завершилось ни одного отказа
+    mttr_seconds: Optional[float]
+
+
+def get_bucket_start(moment: datetime, period: str) -> datetime:
+    """ Начало часа или суток (по UTC), в которые попадает момент. """
+    moment = moment.astimezone(timezone.utc)
+    if period == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def get_bucket_end(moment: datetime, period: str) -> datetime:
+    """ Ближайшая граница часа или суток не раньше момента. """
+    bucket_start = get_bucket_start(moment, period)
+    return bucket_start if bucket_start == moment else bucket_start + ROLLUP_PERIODS[period]
+
+
+class RollupDeltas:
+    """ Приращения итогов по (период, ресурс, начало периода). """
+
+    def __init__(self):
+        self.values: Dict[Tuple, List[float]] = {}
+
+    def _get(self, period: str, resource, moment: datetime) -> List[float]:
+        return self.values.setdefault((period, resource, get_bucket_start(moment, period)), [0.0, 0.0, 0, 0, 0.0])
+
+    def add_duration(self, resource, time_from: datetime, time_to: datetime, is_available: bool):
+        """ Разнесет длительность [time_from, time_to] по часам и суткам. """
+        for period, period_length in ROLLUP_PERIODS.items():
+            bucket_start = get_bucket_start(time_from, period)
+            while bucket_start < time_to:
+                bucket_end = bucket_start + period_length
+                seconds = (min(time_to, bucket_end) - max(time_from, bucket_start)).total_seconds()
+                self._get(period, resource, bucket_start)[0 if is_available else 1] += seconds
+                bucket_start = bucket_end
+
+    def add_outage(self, resource, moment: datetime):
+        for period in ROLLUP_PERIODS:
+            self._get(period, resource, moment)[2] += 1
+
+    def add_recovery(self, resource, moment: datetime, outage_seconds: float):
+        for period in ROLLUP_PERIODS:
+            values = self._get(period, resource, moment)
+            values[3] += 1
+            values[4] += outage_seconds
+
+
+def get_rollup_deltas(rows: Iterable[dict], open_intervals: Dict) -> RollupDeltas:
+    """
+    Приращения итогов по результату компоновки пачки.
+    :param rows: Строки интервалов из CompactionEngine._merge_islands (по ресурсу и времени)
+    :param open_intervals: Открытые интервалы ресурсов до компоновки пачки
+    Продленный интервал добавляет только время после своего прежнего конца. Новый интервал закрывает
+    предыдущий: если тот был отказом, его длительность учитывается в MTTR в периоде восстановления.
+    """
+    deltas = RollupDeltas()
+    previous = {
+        resource: IntervalBounds(interval.id, interval.time_from, interval.time_to, interval.is_available)
+        for resource, interval in open_intervals.items() if interval is not None
+    }
+    for row in rows:
+        resource = row['resource']
+        interval = previous.get(resource)
+        if interval is not None and interval.id == row['id']:
+            deltas.add_duration(resource, interval.time_to, row['time_to'], row['is_available'])
+        else:
+            if interval is not None and not interval.is_available:
+                outage_seconds = (interval.time_to - interval.time_from).total_seconds()
+                deltas.add_recovery(resource, interval.time_to, outage_seconds)
+            if not row['is_available']:
+                deltas.add_outage(resource, row['time_from'])
+            deltas.add_duration(resource, row['time_from'], row['time_to'], row['is_available'])
+        previous[resource] = IntervalBounds(row['id'], row['time_from'], row['time_to'], row['is_available'])
+    return deltas
+
+
+async def upsert_rollups(session: AsyncSession, deltas: RollupDeltas):
+    """
+    Прибавит приращения к итогам upsert на таблицу (в транзакции компоновки пачки); при пересчете по многим
+    ресурсам и периодам строки пишутся частями в пределах параметров запроса.
+    """
+    for period, model in ROLLUP_MODELS.items():
+        rows = [
+            {'resource': resource, 'bucket_start': bucket_start, **dict(zip(ROLLUP_COLUMNS, values))}
+            for (values_period, resource, bucket_start), values in deltas.values.items()
+            if values_period == period
+        ]
+        if not rows:
+            continue
+        for chunk in get_rows_chunks(rows):
+            statement = insert(model).values(chunk)
+            await session.execute(statement.on_conflict_do_update(
+                index_elements=[model.resource, model.bucket_start],
+                set_={column: getattr(model, column) + statement.excluded[column] for column in ROLLUP_COLUMNS},
+            ))
+
+
+async def _get_totals(session: AsyncSession, period: str, resource, ranges: List[Tuple[datetime, datetime]]) -> List:
+    model = ROLLUP_MODELS[period]
+    query = await session.execute(select(
+        *(func.coalesce(func.sum(getattr(model, column)), 0) for column in ROLLUP_COLUMNS)
+    ).where(
+        model.resource == resource,
+        or_(*(
+            and_(model.bucket_start >= range_from, model.bucket_start < range_to)
+            for range_from, range_to in ranges
+        )),
+    ))
+    return list(query.one())
+
+
+async def get_uptime_report(session: AsyncSession, resource, time_from: datetime, time_to: datetime) -> UptimeReport:
+    """
+    Uptime, количество отказов и MTTR ресурса за окно. Окно расширяется до границ часов:
+    полные сутки читаются из суточных итогов, края - из почасовых.
+    """
+    time_from = get_bucket_start(time_from, 'hour')
+    time_to = get_bucket_end(time_to, 'hour')
+    day_from = get_bucket_end(time_from, 'day')
+    day_to = get_bucket_start(time_to, 'day')
+
+    if day_from < day_to:
+        totals = await _get_totals(session, 'day', resource, [(day_from, day_to)])
+        hourly_ranges = [(time_from, day_from), (day_to, time_to)]
+    else:
+        totals = [0] * len(ROLLUP_COLUMNS)
+        hourly_ranges = [(time_from, time_to)]
+    hourly_totals = await _get_totals(session, 'hour', resource, hourly_ranges)
+    up_seconds, down_seconds, outages_count, recoveries_count, recovery_seconds = (
+        daily + hourly for daily, hourly in zip(totals, hourly_totals)
+    )
+
+    observed_seconds = up_seconds + down_seconds
+    return UptimeReport(
+        resource=resource,
+        time_from=time_from,
+        time_to=time_to,
+        up_seconds=float(up_seconds),
+        down_seconds=float(down_seconds),
+        uptime_percent=100 * up_seconds / observed_seconds if observed_seconds else None,
+        outages_count=int(outages_count),
+        mttr_seconds=recovery_seconds / recoveries_count if recoveries_count else None,
+    )
+
+
+async def rebuild_rollups(batch_size: int = settings.COMPACTION_BATCH_SIZE):
+    """
+    Пересчитает итоги заново по всей таблице SwCoreResourceAvailabilityCompare
+    (после включения итогов на существующей истории). Выполнять при остановленной компоновке.
+    """
+    start = time.perf_counter()
+    compare = SwCoreResourceAvailabilityCompare
+    async with AsyncDBAdapter().get_session() as session:
+        for model in ROLLUP_MODELS.values():
+            await session.execute(delete(model))
+        resources = list((await session.execute(select(compare.resource).distinct())).scalars())
+
+    for batch_start in range(0, len(resources), batch_size):
+        batch = resources[batch_start:batch_start + batch_size]
+        async with AsyncDBAdapter().get_session() as session:
+            query = await session.execute(
+                select(compare.id, compare.resource, compare.time_from, compare.time_to, compare.is_available).where(
+                    compare.resource.in_(batch)
+                ).order_by(compare.resource, compare.time_from)
+            )
+            await upsert_rollups(session, get_rollup_deltas((dict(row._mapping) for row in query), {}))
+    LOGGER.info("Пересчет итогов %s ресурсов за %0.3f секунд", len(resources), time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    asyncio.run(rebuild_rollups())
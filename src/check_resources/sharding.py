@@ -0,0 +1,173 @@
+import bisect
+import hashlib
+import os
+import socket
+import time
+from datetime import timedelta
+from typing import Callable, Iterable, List, Optional, Set
+
+from sqlalchemy import select, delete, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import settings
+from app.database import AsyncDBAdapter
+from app.services.logger import SWCoreLogger
+from check_resources.models import SwCoreWorkers, SwCorePartitionLeases
+
+LOGGER = SWCoreLogger().get_logger()
+
+# Виртуальных узлов на экземпляр в кольце (сглаживает распределение партиций)
+RING_VIRTUAL_NODES = 64
+# Сколько периодов аренды хранить запись об экземпляре без сигнала
+STALE_WORKERS_TTL_MULTIPLIER = 10
+
+
+def get_hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+
+def get_resource_partition(resource_id, partitions_count: int = settings.SHARDING_PARTITIONS_COUNT) -> int:
+    return get_hash(str(resource_id)) % partitions_count
+
+
+class ConsistentHashRing:
+    """ Кольцо консистентного хеширования: при входе или уходе экземпляра переезжает только его доля партиций. """
+
+    def __init__(self, workers: Iterable[str], virtual_nodes: int = RING_VIRTUAL_NODES):
+        self._points = sorted(
+            (get_hash(f"{worker}#{index}"), worker)
+            for worker in workers
+            for index in range(virtual_nodes)
+        )
+        self._hashes = [point for point, _ in self._points]
+
+    def get_worker(self, partition: int) -> Optional[str]:
+        if not self._points:
+            return None
+        index = bisect.bisect(self._hashes, get_hash(f"partition-{partition}")) % len(self._points)
+        return self._points[index][1]
+
+
+class ShardCoordinator:
+    """
+    Распределение партиций ресурсов между экземплярами через таблицы SwCoreWorkers и SwCorePartitionLeases.
+    Каждый экземпляр периодически (heartbeat) отмечается живым, по кольцу консистентного хеширования
+    живых экземпляров определяет свои партиции, отпускает чужие и арендует свои.
+    Партицию можно арендовать, только если ее аренда свободна или истекла, поэтому
+    одну партицию никогда не обрабатывают два экземпляра.
+    """
+
+    def __init__(
+            self,
+            worker_id: Optional[str] = settings.WORKER_ID,
+            partitions_count: int = settings.SHARDING_PARTITIONS_COUNT,
+            lease_ttl: int = settings.SHARDING_LEASE_TTL_IN_SECONDS,
+    ):
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.partitions_count = partitions_count
+        self.lease_ttl = lease_ttl
+        self.owned_partitions: Set[int] = set()
+        # До какого момента (по монотонным часам) аренда гарантированно действует
+        self._lease_valid_until = 0.0
+        # Вызываются с множеством новых партиций (например, для сброса кэшей их ресурсов)
+        self.on_partitions_acquired: List[Callable[[Set[int]], None]] = []
+
+    def is_lease_valid(self) -> bool:
+        return time.monotonic() < self._lease_valid_until
+
+    def is_owned(self, resource_id) -> bool:
+        return self.is_lease_valid() and get_resource_partition(resource_id, self.partitions_count) in self.owned_partitions
+
+    def filter_owned(self, items: Iterable, key: Callable = lambda item: item.id) -> List:
+        """ Оставит только объекты, чьи ресурсы попадают в арендованные партиции. """
+        return [item for item in items if self.is_owned(key(item))]
+
+    async def heartbeat(self, tick_index: int = 0):
+        """ Отметит экземпляр живым, перераспределит и продлит аренду партиций. """
+        started_at = time.monotonic()
+        lease_ttl = timedelta(seconds=self.lease_ttl)
+        async with AsyncDBAdapter().get_session() as session:
+            statement = insert(SwCoreWorkers).values(worker_id=self.worker_id)
+            await session.execute(statement.on_conflict_do_update(
+                index_elements=[SwCoreWorkers.worker_id],
+                set_={'heartbeat_at': func.now()},
+            ))
+            await session.execute(delete(SwCoreWorkers).where(
+                SwCoreWorkers.heartbeat_at < func.now() - lease_ttl * STALE_WORKERS_TTL_MULTIPLIER
+            ))
+            query = await session.execute(select(SwCoreWorkers.worker_id).where(
+                SwCoreWorkers.heartbeat_at > func.now() - lease_ttl
+            ))
+            ring = ConsistentHashRing(query.scalars())
+            desired = [
+                partition for partition in range(self.partitions_count)
+                if ring.get_worker(partition) == self.worker_id
+            ]
+
+            # Отпускаем партиции, которые по кольцу теперь принадлежат другим экземплярам
+            await session.execute(delete(SwCorePartitionLeases).where(
+                SwCorePartitionLeases.worker_id == self.worker_id,
+                SwCorePartitionLeases.partition.not_in(desired),
+            ))
+            owned = await self._acquire(session, desired, lease_ttl)
+
+        acquired = owned - self.owned_partitions
+        released = self.owned_partitions - owned
+        self.owned_partitions = owned
+        self._lease_valid_until = started_at + self.lease_ttl
+        if acquired or released:
+            LOGGER.info(
+                "Шардирование %s: партиций %s, получено %s, отпущено %s",
+                self.worker_id, len(owned), len(acquired), len(released),
+            )
+        if acquired:
+            for callback in self.on_partitions_acquired:
+                callback(acquired)
+
+    async def _acquire(self, session: AsyncSession, partitions: List[int], lease_ttl: timedelta) -> Set[int]:
+        """ Арендует или продлит партиции. Занятые другим экземпляром с действующей арендой пропускаются. """
+        if not partitions:
+            return set()
+        leases = SwCorePartitionLeases
+        statement = insert(leases).values([
+            {'partition': partition, 'worker_id': self.worker_id, 'expires_at': func.now() + lease_ttl}
+            for partition in partitions
+        ])
+        statement = statement.on_conflict_do_update(
+            index_elements=[leases.partition],
+            set_={'worker_id': statement.excluded.worker_id, 'expires_at': statement.excluded.expires_at},
+            where=(leases.worker_id == self.worker_id) | (leases.expires_at < func.now()),
+        ).returning(leases.partition)
+        query = await session.execute(statement)
+        return set(query.scalars())
+
+    async def lock_owned(self, session: AsyncSession, resources: List) -> List:
+        """
+        Заблокирует (FOR SHARE) действующую аренду партиций ресурсов до конца транзакции session
+        и вернет только ресурсы арендованных партиций. Пока транзакция не завершена,
+        другой экземпляр не сможет перехватить эти партиции.
+        """
+        partitions = {get_resource_partition(resource, self.partitions_count) for resource in resources}
+        query = await session.execute(
+            select(SwCorePartitionLeases.partition).where(
+                SwCorePartitionLeases.partition.in_(partitions),
+                SwCorePartitionLeases.worker_id == self.worker_id,
+                SwCorePartitionLeases.expires_at > func.now(),
+            ).with_for_update(read=True)
+        )
+        locked = set(query.scalars())
+        return [
+            resource for resource in resources
+            if get_resource_partition(resource, self.partitions_count) in locked
+        ]
+
+    async def release(self):
+        """ Отпустит все партиции при остановке экземпляра, чтобы другие забрали их без ожидания ttl. """
+        async with AsyncDBAdapter().get_session() as session:
+            await session.execute(delete(SwCorePartitionLeases).where(
+                SwCorePartitionLeases.worker_id == self.worker_id
+            ))
+            await session.execute(delete(SwCoreWorkers).where(SwCoreWorkers.worker_id == self.worker_id))
+        self.owned_partitions = set()
+        self._lease_valid_until = 0.0
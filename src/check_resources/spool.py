@@ -0,0 +1,339 @@
+import asyncio
+import math
+import os
+import struct
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+
+from app import settings
+from app.services.logger import SWCoreLogger
+from app.services.metrics import METRICS
+
+LOGGER = SWCoreLogger().get_logger()
+
+SPOOLED_ROWS = METRICS.counter('sw_core_spool_rows_total', 'Строк результатов, записанных в спул')
+REPLAYED_ROWS = METRICS.counter('sw_core_spool_replayed_rows_total', 'Строк результатов, перенесенных из спула в БД')
+CORRUPTED_RECORDS = METRICS.counter('sw_core_spool_corrupted_records_total', 'Поврежденных записей спула')
+SPOOL_BYTES = METRICS.gauge('sw_core_spool_bytes', 'Размер еще не перенесенных в БД сегментов спула')
+FSYNC_SECONDS = METRICS.histogram('sw_core_spool_fsync_seconds', 'Длительность fsync сегмента спула')
+QUARANTINED_SEGMENTS = METRICS.counter(
+    'sw_core_spool_quarantined_segments_total', 'Сегментов спула, отложенных в failed после неудачных переносов'
+)
+DB_AVAILABLE = METRICS.gauge('sw_core_spool_db_available', 'БД принимает результаты (1) или они идут в спул (0)')
+
+# Запись строки результата: id, created_at (микросекунды от эпохи), resource, is_available, failures_count,
+# min/avg/max_latency (NaN - нет значения); за ней - crc32 записи
+RECORD = struct.Struct('<16sq16sBHddd')
+RECORD_CRC = struct.Struct('<I')
+RECORD_SIZE = RECORD.size + RECORD_CRC.size
+SEGMENT_SUFFIX = '.spool'
+# Папка спула для сегментов, перенос которых отклоняется ошибкой запроса
+FAILED_DIRECTORY = 'failed'
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def encode_row(row: dict) -> bytes:
+    record = RECORD.pack(
+        row['id'].bytes,
+        (row['created_at'] - EPOCH) // MICROSECOND,
+        row['resource'].bytes,
+        row['is_available'],
+        row['failures_count'],
+        *(math.nan if row[column] is None else row[column] for column in ('min_latency', 'avg_latency', 'max_latency')),
+    )
+    return record + RECORD_CRC.pack(zlib.crc32(record))
+
+
+def decode_segment(data: bytes) -> Tuple[List[dict], int]:
+    """
+    Строки результатов из содержимого сегмента. Записи с неверной контрольной суммой
+    и оборванная последняя запись (сбой во время записи) пропускаются.
+    :return: Строки и количество пропущенных записей
+    """
+    rows = []
+    corrupted = 1 if len(data) % RECORD_SIZE else 0
+    for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+        record = data[offset:offset + RECORD.size]
+        if RECORD_CRC.unpack_from(data, offset + RECORD.size)[0] != zlib.crc32(record):
+            corrupted += 1
+            continue
+        row_id, created_at, resource, is_available, failures_count, *latencies = RECORD.unpack(record)
+        rows.append({
+            'id': uuid.UUID(bytes=row_id),
+            'created_at': EPOCH + created_at * MICROSECOND,
+            'resource': uuid.UUID(bytes=resource),
+            'is_available': bool(is_available),
+            'failures_count': failures_count,
+            **{
+                column: None if math.isnan(value) else value
+                for column, value in zip(('min_latency', 'avg_latency', 'max_latency'), latencies)
+            },
+        })
+    return rows, corrupted
+
+
+def is_db_unavailable_error(error: BaseException) -> bool:
+    """
+    Ошибка соединения с БД или таймаут. Ошибка самого запроса (например, слишком много параметров)
+    повторится при любой попытке и не означает, что БД недоступна.
+    """
+    if isinstance(error, (OSError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, DBAPIError):
+        return error.connection_invalidated or isinstance(error, (InterfaceError, OperationalError)) \
+            or isinstance(error.orig, OSError)
+    return False
+
+
+def read_segment(path: Path) -> Tuple[List[dict], int]:
+    with open(path, 'rb') as file:
+        return decode_segment(file.read())
+
+
+class ResultSpool:
+    """
+    Локальный спул результатов проверок на время, когда БД недоступна или не успевает.
+    Строки дописываются в конец активного сегмента (файлы <номер>.spool в directory), fsync выполняется
+    пачкой не чаще раза в fsync_interval секунд в пуле потоков; при достижении segment_max_bytes
+    сегмент закрывается и начинается новый. Фоновый replay переносит закрытые сегменты в БД по порядку
+    номеров, внутри сегмента - по времени проверки, и удаляет сегмент только после commit.
+    Строка пишется в спул с тем же id, что и в БД, а перенос выполняется INSERT ... ON CONFLICT DO NOTHING,
+    поэтому повторный перенос (после сбоя или когда неудачная по таймауту запись все же прошла) не дает дублей.
+    Перенесенные строки старше водяного знака компоновки не потеряются: пока они в спуле,
+    get_unwritten_since не дает отсечке компоновки пройти дальше самой старой из них.
+    Сегмент, перенос которого max_replay_failures раз подряд отклонен ошибкой запроса, переносится
+    в папку failed (для разбора вручную) и больше не держит отсечку; счетчик попыток живет до перезапуска.
+    """
+
+    def __init__(
+            self,
+            write_rows: Callable[[List[dict]], Awaitable],
+            replay_rows: Callable[[List[dict]], Awaitable],
+            directory: Path = settings.WRITE_SPOOL_DIR,
+            segment_max_bytes: int = settings.WRITE_SPOOL_SEGMENT_MAX_BYTES,
+            fsync_interval: float = settings.WRITE_SPOOL_FSYNC_INTERVAL_IN_SECONDS,
+            db_timeout: float = settings.WRITE_SPOOL_DB_TIMEOUT_IN_SECONDS,
+            retry_interval: float = settings.WRITE_SPOOL_RETRY_IN_SECONDS,
+            replay_batch_size: int = settings.WRITE_SPOOL_REPLAY_BATCH_SIZE,
+            max_replay_failures: int = settings.WRITE_SPOOL_MAX_REPLAY_FAILURES,
+    ):
+        """
+        :param write_rows: Обычная запись строк get_statistics_rows в БД
+        :param replay_rows: Запись строк из спула без дублей (INSERT ... ON CONFLICT DO NOTHING)
+        """
+        self.write_rows = write_rows
+        self.replay_rows = replay_rows
+        self.directory = Path(directory)
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync_interval = fsync_interval
+        self.db_timeout = db_timeout
+        self.retry_interval = retry_interval
+        self.replay_batch_size = replay_batch_size
+        self.max_replay_failures = max_replay_failures
+        # Закрытые сегменты: путь -> (размер, самое раннее время проверки)
+        self._segments: Dict[Path, Tuple[int, Optional[datetime]]] = {}
+        # Неудачных подряд переносов сегмента из-за ошибки запроса
+        self._replay_failures: Dict[Path, int] = {}
+        self._next_number = 0
+        self._active_file = None
+        self._active_path: Optional[Path] = None
+        self._active_bytes = 0
+        self._active_oldest: Optional[datetime] = None
+        self._is_dirty = False
+        # До этого момента (monotonic) запись идет сразу в спул, минуя БД
+        self._unavailable_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        SPOOL_BYTES.set_function(lambda: self.pending_bytes)
+        DB_AVAILABLE.set_function(lambda: 1 if self.is_db_available() else 0)
+
+    @property
+    def pending_bytes(self) -> int:
+        return self._active_bytes + sum(size for size, _ in self._segments.values())
+
+    def _get_lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def _scan(self):
+        """ Найдет сегменты, оставшиеся от прошлого запуска (все они считаются закрытыми). """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for path in sorted(self.directory.glob(f"*{SEGMENT_SUFFIX}")):
+            rows, corrupted = read_segment(path)
+            CORRUPTED_RECORDS.inc(corrupted)
+            self._segments[path] = (path.stat().st_size, min((row['created_at'] for row in rows), default=None))
+            self._next_number = max(self._next_number, int(path.stem) + 1)
+        if self._segments:
+            LOGGER.warning(
+                "В спуле %s сегментов (%s байт) от прошлого запуска", len(self._segments), self.pending_bytes
+            )
+
+    def is_db_available(self) -> bool:
+        return time.monotonic() >= self._unavailable_until
+
+    def _mark_db_unavailable(self, error: BaseException):
+        if self.is_db_available():
+            LOGGER.warning(
+                "БД недоступна или не успевает (%r): результаты пишутся в спул %s", error, self.directory,
+                extra={'error_type': type(error).__name__},
+            )
+        self._unavailable_until = time.monotonic() + self.retry_interval
+
+    def get_unwritten_since(self) -> Optional[datetime]:
+        """ Самое раннее время проверки среди строк, которые еще не перенесены в БД. """
+        moments = [oldest for _, oldest in self._segments.values() if oldest is not None]
+        if self._active_oldest is not None:
+            moments.append(self._active_oldest)
+        return min(moments, default=None)
+
+    async def write(self, rows: List[dict]):
+        """
+        Запишет строки в БД, а если она недоступна или не ответила за db_timeout секунд - в спул.
+        Ошибка запроса (не соединения) пробрасывается: в спуле строки получили бы ту же ошибку при переносе.
+        """
+        if not rows:
+            return
+        if self.is_db_available():
+            try:
+                await asyncio.wait_for(self.write_rows(rows), timeout=self.db_timeout)
+                return
+            except Exception as error:
+                if not is_db_unavailable_error(error):
+                    raise
+                self._mark_db_unavailable(error)
+        await self.append(rows)
+
+    async def append(self, rows: List[dict]):
+        if self._active_file is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._active_path = self.directory / f"{self._next_number:012d}{SEGMENT_SUFFIX}"
+            self._next_number += 1
+            self._active_file = open(self._active_path, 'ab')
+            self._active_bytes = 0
+            self._active_oldest = None
+        data = b''.join(encode_row(row) for row in rows)
+        self._active_file.write(data)
+        self._active_bytes += len(data)
+        oldest = min(row['created_at'] for row in rows)
+        self._active_oldest = oldest if self._active_oldest is None else min(self._active_oldest, oldest)
+        self._is_dirty = True
+        SPOOLED_ROWS.inc(len(rows))
+        if self._active_bytes >= self.segment_max_bytes:
+            await self._rotate()
+
+    async def _fsync(self, file):
+        start = time.perf_counter()
+        file.flush()
+        await asyncio.get_running_loop().run_in_executor(None, os.fsync, file.fileno())
+        FSYNC_SECONDS.observe(time.perf_counter() - start)
+
+    async def sync(self):
+        """ fsync активного сегмента, если в него писали после прошлого fsync. """
+        async with self._get_lock():
+            if self._active_file is not None and self._is_dirty:
+                self._is_dirty = False
+                await self._fsync(self._active_file)
+
+    async def _rotate(self):
+        """ Закроет активный сегмент: новые строки пойдут в следующий. """
+        async with self._get_lock():
+            if self._active_file is None:
+                return
+            file, path = self._active_file, self._active_path
+            self._segments[path] = (self._active_bytes, self._active_oldest)
+            self._active_file = self._active_path = self._active_oldest = None
+            self._active_bytes = 0
+            self._is_dirty = False
+            await self._fsync(file)
+            file.close()
+
+    def _quarantine(self, path: Path):
+        """ Отложит сегмент в папку failed: он больше не переносится и не держит отсечку компоновки. """
+        failed_directory = self.directory / FAILED_DIRECTORY
+        failed_directory.mkdir(parents=True, exist_ok=True)
+        path.replace(failed_directory / path.name)
+        del self._segments[path]
+        self._replay_failures.pop(path, None)
+        QUARANTINED_SEGMENTS.inc()
+
+    async def replay(self) -> int:
+        """
+        Перенесет все сегменты спула в БД. При ошибке соединения перенос прерывается до следующей попытки,
+        и БД считается недоступной (новые строки идут в спул). Ошибка запроса относится только к сегменту:
+        он пропускается до следующей попытки, а после max_replay_failures неудач подряд откладывается.
+        :return: Количество перенесенных строк
+        """
+        if self._active_file is not None:
+            await self._rotate()
+        loop = asyncio.get_running_loop()
+        replayed = 0
+        for path in sorted(self._segments):
+            start = time.perf_counter()
+            rows, corrupted = await loop.run_in_executor(None, read_segment, path)
+            CORRUPTED_RECORDS.inc(corrupted)
+            rows.sort(key=lambda row: row['created_at'])
+            try:
+                for batch_start in range(0, len(rows), self.replay_batch_size):
+                    await self.replay_rows(rows[batch_start:batch_start + self.replay_batch_size])
+            except Exception as error:
+                if is_db_unavailable_error(error):
+                    self._mark_db_unavailable(error)
+                    return replayed
+                failures = self._replay_failures.get(path, 0) + 1
+                self._replay_failures[path] = failures
+                LOGGER.error(
+                    "Ошибка переноса сегмента спула %s в БД (попытка %s из %s): %r",
+                    path.name, failures, self.max_replay_failures, error,
+                    extra={'error_type': type(error).__name__},
+                )
+                if failures >= self.max_replay_failures:
+                    self._quarantine(path)
+                    LOGGER.error(
+                        "Сегмент спула %s (%s строк) отложен в %s", path.name, len(rows), path.parent / FAILED_DIRECTORY
+                    )
+                continue
+            path.unlink()
+            del self._segments[path]
+            self._replay_failures.pop(path, None)
+            replayed += len(rows)
+            REPLAYED_ROWS.inc(len(rows))
+            LOGGER.info(
+                "Из спула перенесено %s строк (%s) за %0.3f секунд", len(rows), path.name, time.perf_counter() - start
+            )
+        self._unavailable_until = 0.0
+        return replayed
+
+    async def run(self):
+        """ Фоновая задача: пакетный fsync и перенос спула в БД, как только она снова принимает запись. """
+        last_replay_at = 0.0
+        while True:
+            await asyncio.sleep(self.fsync_interval)
+            await self.sync()
+            has_pending = self._segments or self._active_file is not None
+            if has_pending and time.monotonic() - last_replay_at >= self.retry_interval:
+                last_replay_at = time.monotonic()
+                await self.replay()
+
+    async def start(self):
+        await asyncio.get_running_loop().run_in_executor(None, self._scan)
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """ Остановит фоновую задачу и сохранит активный сегмент (он будет перенесен после перезапуска). """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._rotate()
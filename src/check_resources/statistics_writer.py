@@ -0,0 +1,134 @@
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Iterable, List
+
+from sqlalchemy import Table, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import settings
+from app.database import AsyncDBAdapter, get_rows_chunks
+from app.services.logger import SWCoreLogger
+from app.services.metrics import METRICS
+from check_resources.models import SwCoreResourceAvailabilityStatistics, \
+    SwCoreResourceAvailabilityStatisticsTestStorage
+
+LOGGER = SWCoreLogger().get_logger()
+
+ROWS_WRITTEN = METRICS.counter('sw_core_rows_written_total', 'Записано строк результатов проверок', ['table'])
+WRITE_SECONDS = METRICS.histogram('sw_core_write_seconds', 'Длительность записи результатов цикла', ['table'])
+
+# Колонки, которые пишутся из результатов проверок (created_at - момент проверки)
+STATISTICS_COLUMNS = (
+    'id', 'created_at', 'resource', 'is_available', 'min_latency', 'avg_latency', 'max_latency', 'failures_count',
+)
+
+
+def get_statistics_rows(answers: Iterable) -> List[dict]:
+    """ Преобразует AvailableAnswer в строки для вставки в таблицу статистики. """
+    return [
+        {
+            'id': uuid.uuid4(),
+            'created_at': answer.checked_at or datetime.now(timezone.utc),
+            'resource': answer.app_id,
+            'is_available': answer.is_available,
+            'min_latency': answer.min_latency,
+            'avg_latency': answer.avg_latency,
+            'max_latency': answer.max_latency,
+            'failures_count': answer.failures_count,
+        }
+        for answer in answers
+    ]
+
+
+async def _write_orm(session: AsyncSession, table: Table, rows: List[dict]):
+    """ Прежний режим записи через unit of work (объект ORM на каждую строку). """
+    model = {
+        SwCoreResourceAvailabilityStatistics.__table__: SwCoreResourceAvailabilityStatistics,
+        SwCoreResourceAvailabilityStatisticsTestStorage.__table__: SwCoreResourceAvailabilityStatisticsTestStorage,
+    }[table]
+    session.add_all([model(**row) for row in rows])
+    await session.flush()
+
+
+async def _write_insert(session: AsyncSession, table: Table, rows: List[dict]):
+    """ Многострочные INSERT ... VALUES: один на цикл, если строки укладываются в предел параметров запроса. """
+    for chunk in get_rows_chunks(rows):
+        await session.execute(insert(table).values(chunk))
+
+
+async def _write_copy(session: AsyncSession, table: Table, rows: List[dict]):
+    """ Запись через PostgreSQL COPY (только для бэкенда postgresql, драйвер asyncpg). """
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        table.name,
+        records=[tuple(row[column] for column in STATISTICS_COLUMNS) for row in rows],
+        columns=STATISTICS_COLUMNS,
+    )
+
+
+async def _write_insert_ignore(session: AsyncSession, table: Table, rows: List[dict]):
+    """ INSERT ... ON CONFLICT DO NOTHING: повторная запись тех же строк (например, из спула) не создает дублей. """
+    dialect_insert = sqlite.insert if session.bind.dialect.name == 'sqlite' else postgresql.insert
+    for chunk in get_rows_chunks(rows):
+        await session.execute(dialect_insert(table).values(chunk).on_conflict_do_nothing())
+
+
+WRITE_MODES = {
+    'orm': _write_orm,
+    'insert': _write_insert,
+    'copy': _write_copy,
+    'insert_ignore': _write_insert_ignore,
+}
+
+
+async def write_availability_statistics(
+        session: AsyncSession,
+        answers: Iterable,
+        table: Table = SwCoreResourceAvailabilityStatistics.__table__,
+        mode: str = settings.AVAILABILITY_STATISTICS_WRITE_MODE,
+) -> int:
+    """
+    Запишет результаты цикла проверок минимальным числом обращений к БД (в пределах параметров запроса).
+    :param session: Сессия, в транзакции которой выполняется запись
+    :param answers: Результаты проверок AvailableAnswer
+    :param table: Таблица для записи
+    :param mode: Режим записи из WRITE_MODES
+    :return: Количество записанных строк
+    """
+    return await write_statistics_rows(session, get_statistics_rows(answers), table, mode)
+
+
+async def write_statistics_rows(
+        session: AsyncSession,
+        rows: List[dict],
+        table: Table = SwCoreResourceAvailabilityStatistics.__table__,
+        mode: str = settings.AVAILABILITY_STATISTICS_WRITE_MODE,
+) -> int:
+    """ Запишет готовые строки get_statistics_rows (параметры - как у write_availability_statistics). """
+    if not rows:
+        return 0
+
+    start = time.perf_counter()
+    await WRITE_MODES[mode](session, table, rows)
+    executing_time = time.perf_counter() - start
+    ROWS_WRITTEN.inc(len(rows), (table.name,))
+    WRITE_SECONDS.observe(executing_time, (table.name,))
+    LOGGER.info(
+        "Запись %s строк в %s (%s) за %0.3f секунд (%0.0f строк/сек)",
+        len(rows), table.name, mode, executing_time, len(rows) / max(executing_time, 1e-9),
+        extra={'table': table.name, 'rows': len(rows), 'seconds': executing_time},
+    )
+    return len(rows)
+
+
+async def write_test_storage(answers: List):
+    """ Дублирование результатов в тестовую таблицу. Выполняется отдельной задачей после основной записи. """
+    async with AsyncDBAdapter().get_session() as session:
+        await write_availability_statistics(
+            session,
+            answers,
+            table=SwCoreResourceAvailabilityStatisticsTestStorage.__table__
+        )
@@ -0,0 +1,94 @@
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from http import HTTPStatus
+from typing import Dict, Hashable, Iterable, Optional
+
+from app import settings
+from app.database import AsyncDBAdapter
+from app.services.http_server import LocalHTTPServer, Response, json_response
+from check_resources.rollups import get_uptime_report, get_bucket_start, get_bucket_end
+
+
+class ResponseCache:
+    """ LRU-кэш ответов с вытеснением всех ответов ресурса при появлении его новых итогов. """
+
+    def __init__(self, max_size: int = settings.UPTIME_API_CACHE_SIZE):
+        self.max_size = max_size
+        self._responses: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Response]:
+        response = self._responses.get(key)
+        if response is None:
+            self.misses += 1
+            return None
+        self._responses.move_to_end(key)
+        self.hits += 1
+        return response
+
+    def put(self, key: Hashable, response: Response):
+        self._responses[key] = response
+        self._responses.move_to_end(key)
+        while len(self._responses) > self.max_size:
+            self._responses.popitem(last=False)
+
+    def evict(self, resources: Iterable):
+        """ Удалит ответы по ресурсам (ключ ответа начинается с идентификатора ресурса). """
+        resources = set(resources)
+        for key in [key for key in self._responses if key[0] in resources]:
+            del self._responses[key]
+
+
+def parse_moment(value: Optional[str], default: datetime) -> datetime:
+    if not value:
+        return default
+    moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return moment if moment.tzinfo is not None else moment.replace(tzinfo=timezone.utc)
+
+
+class UptimeAPI:
+    """
+    Локальный HTTP API для запросов доступности по почасовым и суточным итогам.
+    GET /uptime?resource=<uuid>&from=<ISO 8601>&to=<ISO 8601> - uptime (%), количество отказов и MTTR
+    (по умолчанию to - текущее время, from - UPTIME_API_DEFAULT_WINDOW_IN_DAYS дней назад).
+    """
+
+    def __init__(
+            self,
+            host: str = settings.UPTIME_API_HOST,
+            port: int = settings.UPTIME_API_PORT,
+            cache_size: int = settings.UPTIME_API_CACHE_SIZE,
+    ):
+        self.cache = ResponseCache(cache_size)
+        self.server = LocalHTTPServer(host, port, name='uptime api')
+        self.server.route('/uptime', self.get_uptime)
+
+    async def get_uptime(self, query: Dict[str, str]) -> Response:
+        try:
+            resource = uuid.UUID(query['resource'])
+            time_to = parse_moment(query.get('to'), datetime.now(timezone.utc))
+            time_from = parse_moment(
+                query.get('from'), time_to - timedelta(days=settings.UPTIME_API_DEFAULT_WINDOW_IN_DAYS)
+            )
+        except (KeyError, ValueError) as error:
+            return json_response({'error': f"Некорректный запрос: {error}"}, HTTPStatus.BAD_REQUEST)
+        if time_from >= time_to:
+            return json_response({'error': "Начало окна должно быть раньше конца"}, HTTPStatus.BAD_REQUEST)
+
+        # Окно все равно расширяется до границ часов, поэтому ключ кэша - границы часов
+        key = (resource, get_bucket_start(time_from, 'hour'), get_bucket_end(time_to, 'hour'))
+        response = self.cache.get(key)
+        if response is None:
+            async with AsyncDBAdapter().get_session() as session:
+                report = await get_uptime_report(session, resource, time_from, time_to)
+            response = json_response(report._asdict())
+            self.cache.put(key, response)
+        return response
+
+    async def start(self):
+        await self.server.start()
+
+    async def stop(self):
+        await self.server.stop()
@@ -0,0 +1,226 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app import settings
+from app.services.logger import SWCoreLogger
+from app.services.metrics import METRICS, ROWS_BUCKETS
+from check_resources.spool import is_db_unavailable_error
+
+LOGGER = SWCoreLogger().get_logger()
+
+QUEUE_DEPTH = METRICS.gauge('sw_core_write_queue_depth', 'Результатов проверок в очереди записи')
+QUEUE_DROPPED = METRICS.counter('sw_core_write_queue_dropped_total', 'Отброшено при переполнении очереди', ['policy'])
+QUEUE_WAIT_SECONDS = METRICS.histogram(
+    'sw_core_write_queue_wait_seconds', 'Ожидание места в очереди записи (обратное давление на проверки)'
+)
+FLUSH_SECONDS = METRICS.histogram('sw_core_write_flush_seconds', 'Длительность записи пачки из очереди')
+FLUSH_ROWS = METRICS.histogram('sw_core_write_flush_rows', 'Размер пачки записи из очереди', buckets=ROWS_BUCKETS)
+FLUSH_ERRORS = METRICS.counter('sw_core_write_flush_errors_total', 'Ошибок записи пачки из очереди')
+DEAD_LETTERS = METRICS.counter(
+    'sw_core_write_queue_dead_letters_total', 'Отброшено результатов, запись которых отклоняется самим запросом'
+)
+
+# Что делать с новым результатом, если очередь заполнена
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP_NEW = 'drop_new'
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_NEW, OVERFLOW_DROP_OLDEST)
+
+
+class WriteBehindQueue:
+    """
+    Ограниченная очередь asyncio.Queue между проверками и единственной корутиной записи.
+    Проверки только кладут результаты в очередь, запись собирает пачку до batch_size результатов
+    или до flush_interval секунд с первого результата пачки и пишет ее одним обращением к БД.
+    Если БД недоступна или не успевает, пачка с ошибкой соединения повторяется с растущей паузой, очередь
+    заполняется и срабатывает политика переполнения: block - проверки ждут места (тики пропускаются и попадают в лог
+    TickScheduler), drop_new - новый результат отбрасывается, drop_oldest - отбрасывается самый старый.
+    Ошибка самого запроса (например, нарушение внешнего ключа после удаления ресурса) повторится при любой
+    попытке, поэтому такая пачка делится пополам, пока отклоняемые результаты не останутся по одному:
+    они отбрасываются (dead_letters) и не останавливают запись остальных.
+    """
+
+    def __init__(
+            self,
+            write: Callable[[List], Awaitable],
+            max_size: int = settings.WRITE_QUEUE_MAX_SIZE,
+            batch_size: int = settings.WRITE_QUEUE_BATCH_SIZE,
+            flush_interval: float = settings.WRITE_QUEUE_FLUSH_INTERVAL_IN_SECONDS,
+            overflow_policy: str = settings.WRITE_QUEUE_OVERFLOW_POLICY,
+            retry_max_delay: float = settings.WRITE_QUEUE_RETRY_MAX_DELAY_IN_SECONDS,
+    ):
+        """
+        :param write: Корутина-функция записи пачки результатов AvailableAnswer
+        """
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Неизвестная политика переполнения очереди записи: {overflow_policy}")
+        self.write = write
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.retry_max_delay = retry_max_delay
+        self.dropped = 0
+        self.dead_letters = 0
+        self.last_flush_seconds = 0.0
+        # Очередь создается в работающем цикле событий
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        # Количество незаписанных результатов по секунде проверки (для нижней границы компоновки)
+        self._unwritten: Dict[int, int] = {}
+        QUEUE_DEPTH.set_function(lambda: self._queue.qsize() if self._queue is not None else 0)
+
+    def _get_queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.max_size)
+        return self._queue
+
+    @staticmethod
+    def _get_second(answer) -> int:
+        return int(answer.checked_at.timestamp()) if answer.checked_at is not None else int(time.time())
+
+    def _track(self, answer):
+        second = self._get_second(answer)
+        self._unwritten[second] = self._unwritten.get(second, 0) + 1
+
+    def _untrack(self, answers: List):
+        for answer in answers:
+            second = self._get_second(answer)
+            count = self._unwritten.get(second, 0) - 1
+            if count > 0:
+                self._unwritten[second] = count
+            else:
+                self._unwritten.pop(second, None)
+
+    def get_unwritten_since(self) -> Optional[datetime]:
+        """ Начало секунды самого старого еще не записанного результата (None - все записано). """
+        if not self._unwritten:
+            return None
+        return datetime.fromtimestamp(min(self._unwritten), timezone.utc)
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def put(self, answers: List):
+        """ Положит результаты цикла в очередь по политике переполнения. """
+        queue = self._get_queue()
+        for answer in answers:
+            if queue.full():
+                if self.overflow_policy == OVERFLOW_BLOCK:
+                    start = time.perf_counter()
+                    await queue.put(answer)
+                    QUEUE_WAIT_SECONDS.observe(time.perf_counter() - start)
+                    self._track(answer)
+                    continue
+                self.dropped += 1
+                QUEUE_DROPPED.inc(1, (self.overflow_policy,))
+                if self.overflow_policy == OVERFLOW_DROP_NEW:
+                    continue
+                oldest = queue.get_nowait()
+                queue.task_done()
+                self._untrack([oldest])
+            queue.put_nowait(answer)
+            self._track(answer)
+
+    async def _collect_batch(self, queue: asyncio.Queue) -> List:
+        """ Дождется первого результата и доберет пачку до batch_size или до истечения flush_interval. """
+        loop = asyncio.get_running_loop()
+        batch = [await queue.get()]
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            if not queue.empty():
+                batch.append(queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush(self, batch: List):
+        """
+        Запишет пачку, повторяя запись с растущей паузой, пока она не удастся. Пачка с ошибкой запроса
+        записывается половинами (_split).
+        """
+        delay = self.flush_interval
+        while True:
+            start = time.perf_counter()
+            try:
+                await self.write(batch)
+            except Exception as error:
+                FLUSH_ERRORS.inc()
+                if not is_db_unavailable_error(error):
+                    await self._split(batch, error)
+                    return
+                LOGGER.error(
+                    "Ошибка записи пачки из %s результатов, повтор через %0.1f секунд: %r", len(batch), delay, error,
+                    extra={'error_type': type(error).__name__},
+                )
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.retry_max_delay)
+                continue
+            self.last_flush_seconds = time.perf_counter() - start
+            FLUSH_SECONDS.observe(self.last_flush_seconds)
+            FLUSH_ROWS.observe(len(batch))
+            return
+
+    async def _split(self, batch: List, error: Exception):
+        """ Запишет половины пачки с ошибкой запроса, отклоняемый результат без пары отбросит. """
+        if len(batch) == 1:
+            answer = batch[0]
+            self.dead_letters += 1
+            DEAD_LETTERS.inc()
+            LOGGER.error(
+                "Результат проверки %s (%s) отброшен: запрос записи отклонен: %r",
+                answer.app_name, answer.checked_at, error,
+                extra={'resource': answer.app_id, 'error_type': type(error).__name__},
+            )
+            return
+        LOGGER.warning(
+            "Ошибка запроса при записи пачки из %s результатов, пачка записывается половинами: %r", len(batch), error,
+            extra={'error_type': type(error).__name__},
+        )
+        middle = len(batch) // 2
+        await self._flush(batch[:middle])
+        await self._flush(batch[middle:])
+
+    async def run(self):
+        """ Корутина записи. """
+        queue = self._get_queue()
+        while True:
+            batch = await self._collect_batch(queue)
+            try:
+                await self._flush(batch)
+            finally:
+                self._untrack(batch)
+                for _ in batch:
+                    queue.task_done()
+
+    def start(self):
+        if self._writer is None:
+            self._writer = asyncio.create_task(self.run())
+
+    async def join(self):
+        """ Дождется записи всего, что уже в очереди. """
+        await self._get_queue().join()
+
+    async def stop(self, timeout: Optional[float] = None):
+        """ Допишет очередь (не дольше timeout секунд) и остановит корутину записи. """
+        if self._writer is None:
+            return
+        try:
+            await asyncio.wait_for(self.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            LOGGER.error("Очередь записи не дописана при остановке: осталось %s результатов", self.depth)
+        self._writer.cancel()
+        try:
+            await self._writer
+        except asyncio.CancelledError:
+            pass
+        self._writer = None
@@ -1,64 +1,145 @@
 import asyncio
-from datetime import datetime, timedelta
-from typing import NamedTuple
+from datetime import datetime, timezone
+from typing import Optional
 
 from sqlalchemy.dialects import postgresql
-from sqlalchemy.orm import Session
-from tcp_latency import latency_point
 
 from app import settings
-from app.database import DBAdapter
-from app.services.app_decorators import error_logger, settings_sleep, log_execution_time
+from app.database import AsyncDBAdapter
+from app.services.app_decorators import error_logger, log_execution_time
 from app.services.common_service import show_raw_sql
 from app.services.logger import SWCoreLogger
-from check_resources.models import SwCoreResources, SwCoreResourceAvailabilityStatistics, \
-    SwCoreResourceAvailabilityCompare, SwCoreResourceAvailabilityStatisticsTestStorage
+from app.services.mailer import SMTPConnectionPool
+from app.services.metrics import METRICS, MetricsAPI, LATENCY_MS_BUCKETS
+from app.services.scheduler import TickScheduler
+from check_resources.alerting import AlertManager
+from check_resources.archive import IntervalArchive, archive_intervals
+from check_resources.bitmap_history import BitmapHistoryStore
+from check_resources.compaction import CompactionEngine
+from check_resources.partitions import PartitionManager
+from check_resources.planner import ProbePlan, ProbePlanner
+from check_resources.probe_workers import ProbeWorkerPool
+from check_resources.probes import AvailableAnswer, ProbeEngine
+from check_resources.registry import ResourceRegistry
+from check_resources.sharding import ShardCoordinator, get_resource_partition
+from check_resources.uptime_api import UptimeAPI
+from check_resources.spool import ResultSpool
+from check_resources.write_behind import WriteBehindQueue
+from check_resources.statistics_writer import get_statistics_rows, write_statistics_rows, write_test_storage
 
 LOGGER = SWCoreLogger().get_logger()
 
-
-class App(NamedTuple):
-    id: int
-    name: str
-    description: str
-    host: str
-    port: int
-    is_active: bool
-
-
-class AvailableAnswer(NamedTuple):
-    app_id: int
-    app_name: str
-    is_available: bool
-
-
-class PreparedAvailableRows(NamedTuple):
-    time_from: datetime
-    time_to: datetime
-    is_available: bool
-    resource: int
+PROBES = METRICS.counter('sw_core_probes_total', 'Выполнено проверок ресурсов', ['result'])
+PROBE_FAILURES = METRICS.counter('sw_core_probe_failures_total', 'Неудачных попыток подключения')
+PROBE_LATENCY_MS = METRICS.histogram(
+    'sw_core_probe_latency_milliseconds', 'Средняя задержка подключения доступного ресурса', buckets=LATENCY_MS_BUCKETS
+)
+CERTIFICATE_EXPIRY_DAYS = METRICS.gauge(
+    'sw_core_certificate_expiry_days', 'Дней до окончания срока действия сертификата ресурса', ['resource']
+)
+
+# Общие объекты процесса создает init_services при запуске, а не импорт модуля: процессы проверок (spawn)
+# импортируют этот модуль заново как __mp_main__ и не должны создавать движки, пулы соединений и спул.
+# Общий для всех задач движок проверок (один семафор на все одновременные подключения)
+PROBE_ENGINE: Optional[ProbeEngine] = None
+# Проверки в отдельных процессах (для очень больших парков ресурсов)
+PROBE_WORKER_POOL: Optional[ProbeWorkerPool] = None
+# Ссылки на фоновые задачи, чтобы их не собрал сборщик мусора до завершения
+BACKGROUND_TASKS = set()
+# Распределение партиций ресурсов между экземплярами (только в режиме шардирования)
+SHARD_COORDINATOR: Optional[ShardCoordinator] = None
+# Компактная история проверок в битовых картах (RAW_HISTORY_STORE 'bitmap' или 'both')
+BITMAP_HISTORY: Optional[BitmapHistoryStore] = None
+# Очередь между проверками и единственной корутиной записи результатов в БД
+WRITE_QUEUE: Optional[WriteBehindQueue] = None
+# Спул результатов на диске на время недоступности БД
+SPOOL: Optional[ResultSpool] = None
+# Компоновка сырых замеров в интервалы доступности
+COMPACTION_ENGINE: Optional[CompactionEngine] = None
+# Локальный HTTP API для запросов uptime по итогам компоновки
+UPTIME_API: Optional[UptimeAPI] = None
+# Оповещения о смене доступности ресурсов по результатам компоновки
+SMTP_POOL: Optional[SMTPConnectionPool] = None
+ALERT_MANAGER: Optional[AlertManager] = None
+# Колоночный архив старых интервалов доступности
+INTERVAL_ARCHIVE: Optional[IntervalArchive] = None
+# Локальный эндпоинт метрик Prometheus
+METRICS_API: Optional[MetricsAPI] = None
+# Активные ресурсы в памяти процесса
+RESOURCE_REGISTRY: Optional[ResourceRegistry] = None
+# Распределение проверок ресурсов по тикам сбора
+PROBE_PLANNER: Optional[ProbePlanner] = None
+# Создание и удаление секций таблиц сырых замеров (только для PostgreSQL)
+PARTITION_MANAGER: Optional[PartitionManager] = None
+
+
+def get_unwritten_since():
+    """ Самое раннее время проверки среди результатов, еще не записанных в БД (очередь записи, спул, битовые карты). """
+    moments = [
+        WRITE_QUEUE.get_unwritten_since(),
+        SPOOL.get_unwritten_since() if SPOOL is not None else None,
+        BITMAP_HISTORY.get_unwritten_since() if BITMAP_HISTORY is not None else None,
+    ]
+    return min((moment for moment in moments if moment is not None), default=None)
+
+
+def init_services():
+    """ Создаст общие объекты процесса по настройкам (один раз, до запуска задач). """
+    global PROBE_ENGINE, PROBE_WORKER_POOL, SHARD_COORDINATOR, BITMAP_HISTORY, WRITE_QUEUE, SPOOL, \
+        COMPACTION_ENGINE, UPTIME_API, SMTP_POOL, ALERT_MANAGER, INTERVAL_ARCHIVE, METRICS_API, RESOURCE_REGISTRY, \
+        PROBE_PLANNER, PARTITION_MANAGER
+    if PROBE_ENGINE is not None:
+        return
+
+    PROBE_ENGINE = ProbeEngine()
+    PROBE_WORKER_POOL = ProbeWorkerPool() if settings.PROBE_WORKER_PROCESSES > 0 else None
+    SHARD_COORDINATOR = ShardCoordinator() if settings.IS_SHARDING_ENABLED else None
+    BITMAP_HISTORY = BitmapHistoryStore() if settings.RAW_HISTORY_STORE in ('bitmap', 'both') else None
+    WRITE_QUEUE = WriteBehindQueue(write=persist_answers)
+    SPOOL = ResultSpool(
+        write_rows=write_rows_in_session,
+        replay_rows=lambda rows: write_rows_in_session(rows, mode='insert_ignore'),
+    ) if settings.IS_WRITE_SPOOL_ENABLED else None
+
+    COMPACTION_ENGINE = CompactionEngine(
+        lease_guard=SHARD_COORDINATOR.lock_owned if SHARD_COORDINATOR else None,
+        islands_reader=BITMAP_HISTORY.read_islands if settings.RAW_HISTORY_STORE == 'bitmap' else None,
+        unwritten_since=get_unwritten_since,
+    )
+    if SHARD_COORDINATOR is not None:
+        # Открытые интервалы перешедших к нам ресурсов могли продлить на другом экземпляре
+        SHARD_COORDINATOR.on_partitions_acquired.append(
+            lambda partitions: COMPACTION_ENGINE.forget(
+                lambda resource: get_resource_partition(resource) in partitions
+            )
+        )
+    UPTIME_API = UptimeAPI() if settings.IS_UPTIME_API_ENABLED else None
+    if UPTIME_API is not None:
+        # Ответы по ресурсам с новыми итогами устарели
+        COMPACTION_ENGINE.on_batch_committed.append(
+            lambda open_intervals, intervals: UPTIME_API.cache.evict(open_intervals)
+        )
+    SMTP_POOL = SMTPConnectionPool() if settings.IS_ALERTING_ENABLED else None
+    ALERT_MANAGER = AlertManager(SMTP_POOL) if SMTP_POOL is not None else None
+    if ALERT_MANAGER is not None:
+        COMPACTION_ENGINE.on_batch_committed.append(ALERT_MANAGER.observe)
+    INTERVAL_ARCHIVE = IntervalArchive() if settings.IS_INTERVAL_ARCHIVE_ENABLED else None
+    METRICS_API = MetricsAPI() if settings.IS_METRICS_API_ENABLED else None
+    RESOURCE_REGISTRY = ResourceRegistry()
+    PROBE_PLANNER = ProbePlanner()
+    PARTITION_MANAGER = PartitionManager(
+        unwritten_since=get_unwritten_since
+    ) if settings.DB_BACKEND == 'postgresql' else None
 
 
 @error_logger
-# Получит все активные приложения из БД
+# Получит все активные приложения (из реестра, БД читается только при изменении ресурсов)
 async def get_active_apps():
-    try:
-        apps = []
-        with DBAdapter().get_session() as session:
-            query = session.query(SwCoreResources).filter(SwCoreResources.is_active == True)
-            for item in query:
-                apps.append(App(
-                    id=item.id,
-                    name=item.name,
-                    description=item.description,
-                    host=item.host,
-                    port=item.port,
-                    is_active=item.is_active
-                ))
-        # print(f"{apps=}")
-        return apps
-    except Exception as error:
-        LOGGER.error(error)
+    apps = await RESOURCE_REGISTRY.get_apps()
+    # В режиме шардирования - только ресурсы арендованных партиций
+    if SHARD_COORDINATOR is not None:
+        apps = SHARD_COORDINATOR.filter_owned(apps)
+    return apps
 
 
 @error_logger
@@ -67,177 +148,239 @@ async def is_available_resource(points):
 
 
 @error_logger
-async def get_measure_latency(app, runs: int = settings.COUNT_OF_AVAILABLE_ATTEMPT):
-    points = []
-    for item in range(runs):
-        points.append(latency_point(host=app.host, port=app.port))
+async def get_measure_latency(app, runs: int = settings.COUNT_OF_AVAILABLE_ATTEMPT, delay: float = 0):
+    # Сдвиг проверки внутри тика, чтобы не открывать все соединения одновременно
+    if delay:
+        await asyncio.sleep(delay)
+    points = await PROBE_ENGINE.measure(
+        host=app.host, port=app.port, attempts=runs, probe_type=app.probe_type, options=app.probe_options
+    )
+    latencies = [point for point in points if point is not None]
 
     answer = AvailableAnswer(
         app_id=app.id,
         app_name=app.name,
-        is_available=await is_available_resource(points)
+        is_available=await is_available_resource(points),
+        min_latency=min(latencies) if latencies else None,
+        avg_latency=sum(latencies) / len(latencies) if latencies else None,
+        max_latency=max(latencies) if latencies else None,
+        failures_count=len(points) - len(latencies),
+        checked_at=datetime.now(timezone.utc),
+        cert_expires_in_days=PROBE_ENGINE.get_cert_expires_in_days(app.host, app.port),
     )
     return answer
 
 
+def run_in_background(coroutine):
+    BACKGROUND_TASKS.add(asyncio.create_task(coroutine))
+    BACKGROUND_TASKS.difference_update({task for task in BACKGROUND_TASKS if task.done()})
+
+
+def record_probe_metrics(answers):
+    """ Метрики проверок считаются в основном процессе, в том числе для проверок в процессах проверок. """
+    available_count = 0
+    failures_count = 0
+    for answer in answers:
+        failures_count += answer.failures_count
+        if answer.is_available:
+            available_count += 1
+            PROBE_LATENCY_MS.observe(answer.avg_latency)
+        if answer.cert_expires_in_days is not None:
+            CERTIFICATE_EXPIRY_DAYS.set(answer.cert_expires_in_days, (answer.app_name,))
+    PROBES.inc(available_count, ('available',))
+    PROBES.inc(len(answers) - available_count, ('unavailable',))
+    PROBE_FAILURES.inc(failures_count)
+
+
+async def probe_plans(plans):
+    """ Выполнит проверки по планам (в процессах проверок или в цикле событий основного процесса). """
+    if PROBE_WORKER_POOL is not None:
+        answers = await PROBE_WORKER_POOL.probe(plans)
+    else:
+        tasks = [
+            asyncio.create_task(get_measure_latency(
+                app=plan.app, runs=plan.attempts or settings.COUNT_OF_AVAILABLE_ATTEMPT, delay=plan.delay
+            ))
+            for plan in plans
+        ]
+        # error_logger вернет None для упавшей проверки
+        answers = [answer for answer in await asyncio.gather(*tasks) if answer is not None]
+    record_probe_metrics(answers)
+    return answers
+
+
+async def write_answers(answers):
+    """ Передаст результаты на запись: в БД их пишет корутина записи WRITE_QUEUE, проверки ее не ждут. """
+    if BITMAP_HISTORY is not None:
+        BITMAP_HISTORY.record(answers)
+    if settings.RAW_HISTORY_STORE == 'bitmap':
+        return
+    await WRITE_QUEUE.put(answers)
+
+
+async def write_rows_in_session(rows, **kwargs):
+    async with AsyncDBAdapter().get_session() as session:
+        await write_statistics_rows(session, rows, **kwargs)
+
+
+async def persist_answers(answers):
+    """ Запись пачки результатов из WRITE_QUEUE: в БД, а если она недоступна или не успевает - в спул SPOOL. """
+    rows = get_statistics_rows(answers)
+    if SPOOL is not None:
+        await SPOOL.write(rows)
+    else:
+        await write_rows_in_session(rows)
+
+    # Дублирование в тестовую таблицу не задерживает цикл проверок
+    if settings.IS_WRITE_TEST_STORAGE:
+        run_in_background(write_test_storage(answers))
+
+
+@error_logger
+async def confirm_state_changes(apps):
+    """
+    Перепроверка ресурсов со сменой состояния доступности: несколько проверок подряд с короткой паузой,
+    не дожидаясь следующего тика, каждая сразу уходит в очередь записи. Пока идет перепроверка, ресурсы
+    не проверяются в обычных тиках.
+    """
+    resources = {app.id for app in apps}
+    PROBE_PLANNER.confirming.update(resources)
+    try:
+        for _ in range(settings.ADAPTIVE_PROBING_CONFIRM_PROBES):
+            await asyncio.sleep(settings.ADAPTIVE_PROBING_CONFIRM_INTERVAL_IN_SECONDS)
+            answers = await probe_plans([ProbePlan(app=app, delay=0) for app in apps])
+            await write_answers(answers)
+            PROBE_PLANNER.observe(answers)
+    finally:
+        PROBE_PLANNER.confirming.difference_update(resources)
+
+
 # @log_execution_time
-@settings_sleep(seconds_for_sleep=settings.FREQUENCY_OF_LAUNCHING_AVAILABILITY_COLLECTION)
 @error_logger
-async def availability_check_task_func():
+async def availability_check_task_func(tick_index: int = 0):
     """
     Задача для получения доступности ресурсов и записи результатов в БД
+    :param tick_index: Номер тика сбора, по нему выбираются ресурсы, которые пора проверять
     :return:
     """
-    tasks = []
-    for item in await get_active_apps():
-        tasks.append(asyncio.create_task(get_measure_latency(app=item)))
-
-    with DBAdapter().get_session() as session:
-        for mark_task in asyncio.as_completed(tasks):
-            response = await mark_task
-            row = SwCoreResourceAvailabilityStatistics(
-                resource=response.app_id,
-                is_available=response.is_available
-            )
-            row_temp = SwCoreResourceAvailabilityStatisticsTestStorage(
-                resource=response.app_id,
-                is_available=response.is_available
-            )
-            session.add(row)
-            session.add(row_temp)
-        session.commit()
-    print(f"{availability_check_task_func.__name__} {settings.FREQUENCY_OF_LAUNCHING_AVAILABILITY_COLLECTION}")
+    plans = PROBE_PLANNER.get_due_probes(await get_active_apps(), tick_index)
+
+    # Результаты уходят в очередь записи, сессия БД в цикле проверок не открывается
+    answers = await probe_plans(plans)
+    await write_answers(answers)
+
+    # Смена состояния перепроверяется отдельной задачей, чтобы не задерживать тик
+    changed = PROBE_PLANNER.observe(answers)
+    if changed:
+        run_in_background(confirm_state_changes([plan.app for plan in plans if plan.app.id in changed]))
+    LOGGER.debug("%s: проверок %s", availability_check_task_func.__name__, len(answers))
 
 
 # @log_execution_time
-@settings_sleep(seconds_for_sleep=settings.FREQUENCY_OF_LAUNCHING_AVAILABILITY_COMPILE)
 @error_logger
-async def compile_availability_check_task_func():
+async def compile_availability_check_task_func(tick_index: int = 0):
     """ Компоновка резудьтатов сбора доступноси ресурсов. """
+    apps = await get_active_apps()
+    resources = [item.id for item in apps]
+    # Накопленные битовые карты записываются до компоновки, которая может их читать
+    if BITMAP_HISTORY is not None:
+        await BITMAP_HISTORY.flush()
+    await COMPACTION_ENGINE.run(resources)
+    if PROBE_PLANNER.is_adaptive:
+        PROBE_PLANNER.forget(set(resources))
+    if ALERT_MANAGER is not None:
+        ALERT_MANAGER.forget(set(resources))
+        # Отправка не задерживает следующую компоновку
+        if ALERT_MANAGER.pending:
+            run_in_background(ALERT_MANAGER.dispatch({app.id: app for app in apps}))
+
+    LOGGER.debug("Компоновка резудьтатов сбора доступноси ресурсов завершена")
 
-    # Временной буфер (в секундах), в течении которого не учитываются изменения состояний доступности
-    TIME_BUFFER_IN_SECONDS = 60
-
-    # временная отсечка
-    time_cutoff = datetime.now()
-    # print(time_cutoff)
-
-    with DBAdapter().get_session() as session:
-        session: Session = session
-        # Получим реорганизованные строки для добавления данных в результирующую таблицу
-        for item in await get_active_apps():
-            # print(f"{item=}")
-            query = session.query(SwCoreResourceAvailabilityStatistics).filter(
-                SwCoreResourceAvailabilityStatistics.created_at < time_cutoff,
-                SwCoreResourceAvailabilityStatistics.resource == item.id
-            ).order_by(SwCoreResourceAvailabilityStatistics.created_at.asc())
-            left_time_bound = None
-            is_available_mark = None
-            previos_data_created_at = None
-            previos_is_available_mark = None
-            this_prepared_rows = []
-            rows_for_delete = []
-
-            for data_row in query:
-                # Если начали - то задаем границы
-                if left_time_bound is None:
-                    left_time_bound = data_row.created_at
-                    is_available_mark = data_row.is_available
-                else:
-                    # Если метка доступности поменялась, то записываем данные
-                    # Дата в будещем + 60 секунд и + секунды периодичности из настроек
-                    buffer_minute_timedelta = previos_data_created_at + timedelta(
-                        seconds=settings.FREQUENCY_OF_LAUNCHING_AVAILABILITY_COLLECTION + TIME_BUFFER_IN_SECONDS)
-                    # Если метка поменялась или время от предидущего изменения больше buffer_minute_timedelta промежутка
-                    if data_row.is_available != is_available_mark or data_row.created_at > buffer_minute_timedelta:
-                        this_prepared_rows.append(
-                            PreparedAvailableRows(
-                                time_from=left_time_bound,
-                                time_to=previos_data_created_at,
-                                is_available=is_available_mark,
-                                resource=item.id,
-                            )
-                        )
-                        left_time_bound = data_row.created_at
-                        is_available_mark = data_row.is_available
-
-                previos_data_created_at = data_row.created_at
-                previos_is_available_mark = data_row.is_available
-                rows_for_delete.append(data_row)
-                # Пометим строку к удалению
-                session.delete(data_row)
-
-            # Запишем последние данные
-            this_prepared_rows.append(
-                PreparedAvailableRows(
-                    time_from=left_time_bound,
-                    time_to=previos_data_created_at,
-                    is_available=previos_is_available_mark,
-                    resource=item.id,
-                )
-            )
 
-            # Получим данные из результирующей таблицы для возможного объединения
-            # и изменим в случае выполнения условий из запроса row_from_compare_query
-            for prepered_item in this_prepared_rows:
-                row_from_compare_query = session.query(SwCoreResourceAvailabilityCompare).filter(
-                    SwCoreResourceAvailabilityCompare.resource == prepered_item.resource,
-                    SwCoreResourceAvailabilityCompare.is_available == prepered_item.is_available,
-                    SwCoreResourceAvailabilityCompare.time_to >= prepered_item.time_from - timedelta(
-                        seconds=TIME_BUFFER_IN_SECONDS)
-                ).order_by(SwCoreResourceAvailabilityCompare.time_to.desc())
-                for row_item in row_from_compare_query:
-                    # Если есть выборка, то удалим из подготовленных данных строку
-                    this_prepared_rows.remove(prepered_item)
-                    # И пометим найденную строку в результирующей таблице на перезапись граничного значения
-                    row_item.time_to = prepered_item.time_from
-                    # break - гарантируем, что меняем одну запись
-                    break
-
-            # Добавим данные в результирующую таблицу, если новые данные вообще были
-            if left_time_bound is not None:
-                alchemy_this_prepared_rows = [
-                    SwCoreResourceAvailabilityCompare(
-                        time_from=row.time_from,
-                        time_to=row.time_to,
-                        is_available=row.is_available,
-                        resource=row.resource
-                    )
-                    for row in this_prepared_rows
-                ]
-                session.add_all(alchemy_this_prepared_rows)
-                #
-                # Принять удаление обработанных строк из исходной таблицы
-                session.commit()
-
-    # LOGGER.info("Компоновка резудьтатов сбора доступноси ресурсов завершена")
-    print(f"{compile_availability_check_task_func.__name__} {settings.FREQUENCY_OF_LAUNCHING_AVAILABILITY_COMPILE}")
+@error_logger
+async def archive_intervals_task_func(tick_index: int = 0):
+    """ Перенос старых закрытых интервалов доступности в колоночный архив. """
+    await archive_intervals(
+        INTERVAL_ARCHIVE,
+        lease_guard=SHARD_COORDINATOR.lock_owned if SHARD_COORDINATOR else None,
+    )
 
 
 @error_logger
 async def app():
-    # Задача по проверке доступности ресурсов
-    availability_check_task = None
-    # Задача по компоновке резудьтатов сбора доступноси ресурсов
-    compile_availability_check_task = None
-
-    while True:
-        # Обработка задачи на проверку доступности ресурсов
-        if availability_check_task is None:
-            availability_check_task = asyncio.ensure_future(availability_check_task_func())
-        elif availability_check_task.done():
-            availability_check_task.cancel()
-            availability_check_task = None
-
-        # Обработка задачи на компановку результатов по проверке доступности ресурсов
-        if compile_availability_check_task is None:
-            compile_availability_check_task = asyncio.ensure_future(compile_availability_check_task_func())
-        elif compile_availability_check_task.done():
-            compile_availability_check_task.cancel()
-            compile_availability_check_task = None
-
-        # Поспим перед следующей обработкой цикла
-        await asyncio.sleep(1)
+    schedulers = [
+        # Задача по проверке доступности ресурсов
+        TickScheduler(
+            name=availability_check_task_func.__name__,
+            period=settings.FREQUENCY_OF_LAUNCHING_AVAILABILITY_COLLECTION,
+            func=availability_check_task_func,
+        ),
+        # Задача по компоновке резудьтатов сбора доступноси ресурсов
+        TickScheduler(
+            name=compile_availability_check_task_func.__name__,
+            period=settings.FREQUENCY_OF_LAUNCHING_AVAILABILITY_COMPILE,
+            func=compile_availability_check_task_func,
+        ),
+    ]
+    if SHARD_COORDINATOR is not None:
+        # Партиции арендуются до первого сбора. При недоступной БД экземпляр не владеет партициями,
+        # пока аренду не получит тик heartbeat, а сбор и запись не прерываются
+        try:
+            await SHARD_COORDINATOR.heartbeat()
+        except Exception as error:
+            LOGGER.error(
+                "Шардирование %s: партиции не арендованы при запуске: %r", SHARD_COORDINATOR.worker_id, error,
+                extra={'error_type': type(error).__name__},
+            )
+        schedulers.append(TickScheduler(
+            name=f"sharding {SHARD_COORDINATOR.worker_id}",
+            period=settings.SHARDING_HEARTBEAT_IN_SECONDS,
+            func=SHARD_COORDINATOR.heartbeat,
+        ))
+
+    if PARTITION_MANAGER is not None:
+        # Первый тик обслуживания запускается раньше остальных задач, ошибки (например, недоступная БД)
+        # только логируются. Замеры, записанные до создания их секции, попадают в секцию DEFAULT
+        schedulers.insert(0, TickScheduler(
+            name="partitions maintenance",
+            period=settings.RAW_STATISTICS_PARTITION_MAINTENANCE_IN_SECONDS,
+            func=PARTITION_MANAGER.maintain,
+        ))
+    if INTERVAL_ARCHIVE is not None:
+        schedulers.append(TickScheduler(
+            name=archive_intervals_task_func.__name__,
+            period=settings.INTERVAL_ARCHIVE_PERIOD_IN_SECONDS,
+            func=archive_intervals_task_func,
+        ))
+    if PROBE_WORKER_POOL is not None:
+        PROBE_WORKER_POOL.start()
+    if SPOOL is not None:
+        await SPOOL.start()
+    WRITE_QUEUE.start()
+    if UPTIME_API is not None:
+        await UPTIME_API.start()
+    if METRICS_API is not None:
+        await METRICS_API.start()
+
+    try:
+        await asyncio.gather(*(scheduler.run() for scheduler in schedulers))
+    finally:
+        if PROBE_WORKER_POOL is not None:
+            PROBE_WORKER_POOL.stop()
+        await PROBE_ENGINE.close()
+        await WRITE_QUEUE.stop(timeout=settings.WRITE_QUEUE_RETRY_MAX_DELAY_IN_SECONDS)
+        if SPOOL is not None:
+            await SPOOL.stop()
+        if BITMAP_HISTORY is not None:
+            await BITMAP_HISTORY.flush()
+        if UPTIME_API is not None:
+            await UPTIME_API.stop()
+        if METRICS_API is not None:
+            await METRICS_API.stop()
+        if SMTP_POOL is not None:
+            await asyncio.get_running_loop().run_in_executor(None, SMTP_POOL.close)
+        if SHARD_COORDINATOR is not None:
+            await SHARD_COORDINATOR.release()
 
 
 if __name__ == "__main__":
@@ -249,6 +392,7 @@ if __name__ == "__main__":
     print(mesage)
     LOGGER.info(mesage)
 
+    init_services()
     run_app = asyncio.ensure_future(app())
     event_loop = asyncio.get_event_loop()
     event_loop.run_forever()